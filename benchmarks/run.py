@@ -0,0 +1,207 @@
+# benchmarks/run.py
+"""
+Runs Process A, Process B and generate_dashboard against synthetic data and writes the
+results as JSON, so runs can be compared for regressions.
+
+    python -m benchmarks.run --sizes 1000 10000 --latency 0.05 --failure-rate 0.02
+    python -m benchmarks.run --sizes 1000 --compare benchmarks/results/previous.json
+
+Gemini is replaced by the gateway's StubBackend (deterministic replies, optional latency
+and injected 429s), so no network access or API key is needed.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_SIZES = (1000, 10000)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="registry sizes to benchmark, e.g. 1000 10000 100000 1000000")
+    parser.add_argument('--applications', type=int, default=None,
+                        help="C&P applications per case (default: size / 10)")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake LLM latency per call, seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of fake LLM calls answered with a 429")
+    parser.add_argument('--backoff', type=float, default=0.01, help="LLM retry backoff base, seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--use-cache', action='store_true', help="keep the LLM response cache enabled")
+    parser.add_argument('--workdir', default=None, help="where data, logs and outputs are written (default: a temp dir)")
+    parser.add_argument('--output', default=None, help="result JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="earlier result JSON to compare wall times against")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir):
+    """Settings that the src modules read at import time; must run before they are imported."""
+    os.environ['LLM_BACKEND'] = 'stub'
+    os.environ['LOG_QUIET'] = '1'
+    os.environ['LLM_BACKOFF_BASE'] = str(args.backoff)
+    os.environ['LLM_CACHE_BYPASS'] = '0' if args.use_cache else '1'
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'outputs')
+    # Logs, the dashboard and any caches are written relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+
+
+def stage_table(snapshot):
+    """Per agent function: calls, total seconds and throughput, from the telemetry histograms."""
+    stages = {}
+    for name, labels, histogram in snapshot['histograms']:
+        if name != 'agent_function_seconds':
+            continue
+        total = histogram['sum']
+        stages[f"{labels['agent']}.{labels['function']}"] = {
+            'calls': histogram['count'],
+            'total_s': round(total, 4),
+            'calls_per_s': round(histogram['count'] / total, 1) if total else None,
+        }
+    return dict(sorted(stages.items(), key=lambda item: -item[1]['total_s']))
+
+
+def measure(func, items_of):
+    """Runs one process with fresh telemetry; returns its wall time, throughput and stage breakdown."""
+    from src import llm_gateway, log_writer, metrics
+
+    metrics.reset()
+    backend = llm_gateway.current_backend()
+    calls_before, failures_before = backend.calls, backend.failures
+
+    started = time.perf_counter()
+    # The orchestrator prints an n8n payload per document; keep it out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+        log_writer.flush()
+    wall = time.perf_counter() - started
+
+    items = items_of(result)
+    return result, {
+        'wall_s': round(wall, 4),
+        'items': items,
+        'items_per_s': round(items / wall, 1) if wall and items else None,
+        'llm_calls': backend.calls - calls_before,
+        'llm_injected_failures': backend.failures - failures_before,
+        'stages': stage_table(metrics.snapshot()),
+    }
+
+
+def run_case(size, args, workdir):
+    from benchmarks.synthetic import write_dataset
+    from src import llm_gateway, utils
+    from src.agents.compliance_agent import generate_dashboard
+    from src.agents.main_orchestrator import (run_process_a_document_control_lifecycle,
+                                              run_process_b_credentialing_privileging)
+
+    data_dir = os.path.join(workdir, f"data-{size}")
+    started = time.perf_counter()
+    counts = write_dataset(data_dir, size, applications=args.applications, seed=args.seed,
+                           source_dir=str(REPO_ROOT / 'data'))
+    generate_s = time.perf_counter() - started
+
+    utils.DATA_DIR = data_dir
+    utils.init_logs()
+    llm_gateway.reset_guards()
+    llm_gateway.set_backend(llm_gateway.StubBackend(latency=args.latency, failure_rate=args.failure_rate,
+                                                    seed=args.seed))
+    started = time.perf_counter()
+    utils.reload_data()
+    load_s = time.perf_counter() - started
+
+    metrics_a, process_a = measure(run_process_a_document_control_lifecycle,
+                                   lambda result: result.get('docs_renewed', 0))
+    applications_path = os.path.join(data_dir, 'applications.jsonl')
+    metrics_b, process_b = measure(lambda: run_process_b_credentialing_privileging(applications_path),
+                                   lambda result: counts['applications'])
+    final_metrics = {'docs_renewed': metrics_a.get('docs_renewed', 0), 'cp_granted': metrics_b.get('cp_granted', 0)}
+    _, dashboard = measure(lambda: generate_dashboard(final_metrics),
+                           lambda result: os.path.getsize(utils.ACTIVITY_LOG_PATH))
+    dashboard['items_unit'] = 'activity log bytes'
+    process_a['items_unit'] = 'documents renewed'
+    process_b['items_unit'] = 'applications verified'
+
+    return {
+        'size': size,
+        'rows': counts,
+        'generate_s': round(generate_s, 4),
+        'load_s': round(load_s, 4),
+        'results': final_metrics,
+        'process_a': process_a,
+        'process_b': process_b,
+        'dashboard': dashboard,
+        'end_to_end_s': round(load_s + process_a['wall_s'] + process_b['wall_s'] + dashboard['wall_s'], 4),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, previous):
+    """Prints wall-time ratios (current / previous) for every size present in both runs."""
+    earlier = {case['size']: case for case in previous['cases']}
+    for case in current['cases']:
+        before = earlier.get(case['size'])
+        if before is None:
+            continue
+        ratios = []
+        for key in ('process_a', 'process_b', 'dashboard'):
+            old, new = before[key]['wall_s'], case[key]['wall_s']
+            ratios.append(f"{key} {new / old:.2f}x" if old else f"{key} n/a")
+        print(f"size {case['size']}: " + ", ".join(ratios) + " (current / previous wall time)")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = Path(args.output or REPO_ROOT / 'benchmarks' / 'results' /
+                  f"benchmark-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json").resolve()
+    previous = Path(args.compare).resolve() if args.compare else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='agentic-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(args, workdir)
+
+    cases = []
+    for size in args.sizes:
+        case = run_case(size, args, workdir)
+        cases.append(case)
+        print(f"size {size}: end-to-end {case['end_to_end_s']}s | "
+              f"process A {case['process_a']['wall_s']}s ({case['process_a']['items']} renewed) | "
+              f"process B {case['process_b']['wall_s']}s ({case['process_b']['items_per_s']} apps/s) | "
+              f"dashboard {case['dashboard']['wall_s']}s")
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'workdir': workdir,
+        'cases': cases,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    if previous is not None:
+        with open(previous) as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == '__main__':
+    main()
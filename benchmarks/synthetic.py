@@ -0,0 +1,112 @@
+# benchmarks/synthetic.py
+
+import json
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Same simulation date as src.utils.CURRENT_DATE
+BASE_DATE = date(2025, 10, 30)
+
+# Config files copied unchanged from the real data folder
+CONFIG_FILES = ('email_templates.json', 'policy_rules.json', 'routing_policy.json', 'consultant_application.json')
+
+# The real staff come first: the routing policy and the C&P approver lookup refer to them
+CORE_STAFF = [
+    ('Dr. Chan', 'Consultant', 'dr.chan@phmk.my', 'Medical', 'Owner'),
+    ('Ms. Lim', 'Nurse', 'nurse.lim@phmk.my', 'Nursing', 'Reviewer'),
+    ('Mr. Lee', 'QMR', 'qmr@phmk.my', 'Quality', 'Approver'),
+]
+POSITIONS = [('Consultant', 'Owner'), ('Medical Officer', 'Owner'), ('Nurse', 'Reviewer'),
+             ('Pharmacist', 'Reviewer'), ('Unit Manager', 'Approver')]
+DEPARTMENTS = ['Medical', 'Nursing', 'Quality', 'Pharmacy', 'Laboratory', 'Radiology', 'Surgery']
+DOC_TYPES = ['Policy', 'WI', 'Form']
+TOPICS = ['Infection Control', 'Blood Transfusion', 'Medication Safety', 'Patient Identification',
+          'Hand Hygiene', 'Fall Prevention', 'Sterilization', 'Incident Reporting', 'Consent', 'Discharge']
+SPECIALTIES = ['Cardiology', 'Orthopaedics', 'Paediatrics', 'General Surgery', 'Anaesthesiology', 'Radiology']
+
+
+def generate_staff(count, rng):
+    """HR/IPSG list with `count` rows (at least the three core staff)."""
+    extra = max(0, count - len(CORE_STAFF))
+    positions = rng.integers(0, len(POSITIONS), extra)
+    departments = rng.integers(0, len(DEPARTMENTS), extra)
+    rows = list(CORE_STAFF) + [
+        (f"Staff {i}", POSITIONS[p][0], f"staff{i}@phmk.my", DEPARTMENTS[d], POSITIONS[p][1])
+        for i, p, d in zip(range(extra), positions, departments)
+    ]
+    return pd.DataFrame(rows, columns=['name', 'position', 'email', 'department', 'approval_role'])
+
+
+def generate_documents(count, staff_emails, rng):
+    """
+    Document registry with `count` rows. Expiry dates spread from 30 days in the past to
+    three years ahead, so a small, realistic share falls inside the 60-day triage window.
+    """
+    base = np.datetime64(BASE_DATE, 'D')
+    types = rng.integers(0, len(DOC_TYPES), count)
+    topics = rng.integers(0, len(TOPICS), count)
+    owners = rng.integers(0, len(staff_emails), count)
+    expiry = base + rng.integers(-30, 3 * 365, count).astype('timedelta64[D]')
+    last_review = expiry - rng.integers(365, 3 * 365, count).astype('timedelta64[D]')
+    status = np.where(rng.random(count) < 0.95, 'Active', 'Archived')
+
+    doc_types = np.array(DOC_TYPES)[types]
+    return pd.DataFrame({
+        'doc_id': [f"D{i:07d}" for i in range(1, count + 1)],
+        'title': [f"{TOPICS[t]} {d} {i}" for i, (t, d) in enumerate(zip(topics, doc_types), start=1)],
+        'owner_email': np.asarray(staff_emails)[owners],
+        'type': doc_types,
+        'last_review': pd.to_datetime(last_review).strftime('%Y-%m-%d'),
+        'expiry_date': pd.to_datetime(expiry).strftime('%Y-%m-%d'),
+        'status': status,
+    })
+
+
+def generate_applications(count, rng):
+    """
+    C&P applications with realistic file naming. Roughly 10% each miss a document, hold an
+    expired document, or add an unrecognized file (which makes some of them ambiguous).
+    """
+    year = BASE_DATE.year
+    for i in range(count):
+        docs = ['C&P Form.pdf', f"APC_{year}.pdf", f"Indemnity_{year}.pdf", f"BLS_{year - 1}.pdf"]
+        roll = rng.random()
+        if roll < 0.1:
+            docs.pop(int(rng.integers(0, len(docs))))
+        elif roll < 0.2:
+            docs[1] = f"APC_{year - 1}.pdf"
+        if rng.random() < 0.1:
+            docs.append(f"scan_{i}.pdf")
+        yield {
+            'name': f"Dr. Applicant {i}",
+            'specialty': SPECIALTIES[int(rng.integers(0, len(SPECIALTIES)))],
+            'email': f"applicant{i}@phmk.my",
+            'submitted_docs': docs,
+        }
+
+
+def write_dataset(directory, documents, applications=None, staff=None, seed=0, source_dir='data'):
+    """
+    Writes a complete data folder (documents.csv, hr_ipsg_list.csv, applications.jsonl and
+    the config files) for `documents` registry rows. Returns the row counts written.
+    """
+    rng = np.random.default_rng(seed)
+    staff = staff or max(len(CORE_STAFF), documents // 50)
+    applications = max(1, documents // 10) if applications is None else applications
+    os.makedirs(directory, exist_ok=True)
+
+    staff_df = generate_staff(staff, rng)
+    staff_df.to_csv(os.path.join(directory, 'hr_ipsg_list.csv'), index=False)
+    generate_documents(documents, staff_df['email'].to_numpy(), rng).to_csv(
+        os.path.join(directory, 'documents.csv'), index=False)
+    with open(os.path.join(directory, 'applications.jsonl'), 'w') as f:
+        for application in generate_applications(applications, rng):
+            f.write(json.dumps(application) + "\n")
+    for name in CONFIG_FILES:
+        shutil.copy(os.path.join(source_dir, name), os.path.join(directory, name))
+
+    return {'documents': documents, 'staff': staff, 'applications': applications}
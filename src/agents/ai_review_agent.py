@@ -1,22 +1,15 @@
 # src/agents/ai_review_agent.py
 
-from src.utils import log_activity, os # os is needed to access the key
-from google import genai
+from src.utils import log_activity
+from src import llm_gateway, metrics
 
+@metrics.timed("AI Review Agent")
 def generate_ai_summary(doc_id, doc_title):
     """
     AI Review Agent: Uses Gemini to generate content analysis and suggested amendments.
     """
     log_activity("AI Review Agent", "Start Analysis", f"Generating LLM summary for {doc_id}: {doc_title}")
     
-    # Initialize the client using the environment variable
-    try:
-        client = genai.Client()
-    except Exception as e:
-        log_activity("AI Review Agent", "Client Error", f"Failed to initialize Gemini Client: {e}")
-        # FALLBACK: Use a generic message if API client fails
-        return "LLM failure: Please conduct a full manual review."
-
     prompt = f"""
     You are a Quality Assurance AI Agent specializing in hospital document control. 
     Analyze the document titled "{doc_title}" which is approaching its renewal date.
@@ -25,8 +18,9 @@ def generate_ai_summary(doc_id, doc_title):
     """
     
     try:
-        response = client.models.generate_content(
+        response = llm_gateway.generate_content(
             model='gemini-2.5-pro',
+            agent="AI Review Agent",
             contents=prompt
         )
         ai_summary = response.text
@@ -35,5 +29,6 @@ def generate_ai_summary(doc_id, doc_title):
         
     except Exception as e:
         log_activity("AI Review Agent", "API Error", f"Gemini API call failed for {doc_id}. Error: {e}")
+        metrics.record_fallback("AI Review Agent")
         # FALLBACK: Provide a useful message if the API call fails during execution
         return "System error: Failed to retrieve AI summary. Manual review required."
\ No newline at end of file
@@ -1,8 +1,102 @@
 # src/agents/communication_agent.py
 
-from src.utils import log_communication, get_owner_info, log_activity, HR_IPSG_LIST
-from google import genai
+from src.utils import log_communication, get_owner_info, log_activity, get_email_templates, on_reload
+from src import llm_gateway, metrics
+from functools import lru_cache
 import json
+import os
+import string
+import threading
+
+# --- Rendering Configuration ---
+# Emails are rendered from data/email_templates.json; the LLM is only used as configured:
+#   'template' - never call the LLM
+#   'urgent'   - personalize only messages whose urgency is listed in EMAIL_LLM_URGENCIES
+#   'variant'  - draft one reusable template per (message kind, urgency) with the LLM
+#   'all'      - personalize every message with the LLM (previous behaviour)
+EMAIL_LLM_MODE = os.getenv('EMAIL_LLM_MODE', 'urgent').lower()
+EMAIL_LLM_URGENCIES = {u.strip() for u in os.getenv('EMAIL_LLM_URGENCIES', 'High').split(',') if u.strip()}
+
+# --- Digest Configuration ---
+# With COMM_DIGEST=1, expiry notices, review requests and WhatsApp pings are collected per
+# (recipient, channel) during a run and sent as one consolidated message each by flush_digests().
+COMM_DIGEST = os.getenv('COMM_DIGEST', '0').lower() in ('1', 'true', 'yes')
+
+# Placeholders each message kind can use, in templates and in LLM-drafted variants
+TEMPLATE_FIELDS = {
+    'expiry_notice': ('owner_name', 'title', 'doc_id', 'expiry_date', 'ai_summary'),
+    'review_request': ('reviewer_name', 'owner_name', 'title'),
+    'cp_approval_request': ('approver_name', 'applicant_name', 'specialty'),
+    'digest': ('recipient_name', 'count', 'items'),
+}
+
+URGENCY_RANK = {'Low': 1, 'Medium': 2, 'High': 3}
+
+# Built-in digest templates, used when email_templates.json does not define them
+# (the email digest itself falls back to the LLM like any other kind without a template)
+DIGEST_TEMPLATE_DEFAULTS = {
+    'whatsapp_digest_subject': '{count} document updates',
+    'whatsapp_digest': 'Hi {recipient_name}, here are your document updates:\n{items}',
+    'expiry_notice_line': '{title} ({doc_id}) expires on {expiry_date}. Suggested update: {ai_summary}.',
+    'review_request_line': '{title}, submitted by {owner_name}, is awaiting your review.',
+    'request_sent_line': "Your request for '{title}' has been sent for review/approval.",
+    'confirmation_line': "Your acknowledgment of '{title}' has been logged.",
+}
+# Line for a message kind that has neither a configured nor a built-in line template
+DEFAULT_DIGEST_LINE = '{title}'
+
+email_schema = {
+    "type": "object",
+    "properties": {
+        "subject": {"type": "string", "description": "The generated email subject line."},
+        "body": {"type": "string", "description": "The generated email body, using newline characters where necessary."}
+    },
+    "required": ["subject", "body"]
+}
+
+# How each message was rendered in this process: template, llm or variant
+RENDER_COUNTS = {'template': 0, 'llm': 0, 'variant': 0}
+_render_lock = threading.Lock()
+
+
+class EmailTemplate:
+    """A template string parsed once into literal text and placeholder names."""
+
+    def __init__(self, text):
+        self.parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        self.fields = {field for _, field in self.parts if field}
+
+    def render(self, values):
+        return "".join(literal + (str(values.get(field, '')) if field else '') for literal, field in self.parts)
+
+
+@lru_cache(maxsize=1)
+def get_compiled_templates():
+    """Parses every template in email_templates.json once; templates that fail to parse are skipped."""
+    compiled = {}
+    for name, text in get_email_templates().items():
+        try:
+            compiled[name] = EmailTemplate(text)
+        except ValueError as e:
+            log_activity("Communication Agent", "Template Error", f"Ignoring malformed template '{name}'. Error: {e}")
+    return compiled
+
+
+on_reload(get_compiled_templates.cache_clear)
+
+
+def digest_template(name):
+    """A compiled digest template from email_templates.json, else its built-in default."""
+    template = get_compiled_templates().get(name)
+    if template is None:
+        template = EmailTemplate(DIGEST_TEMPLATE_DEFAULTS.get(name, DEFAULT_DIGEST_LINE))
+    return template
+
+
+def count_render(path):
+    with _render_lock:
+        RENDER_COUNTS[path] += 1
+
 
 # --- LLM Helper for Dynamic Email Generation ---
 
@@ -24,21 +118,11 @@ def generate_llm_email_content(recipient_name, doc_title, due_date, context):
     The email must clearly state the document/request details and the required action.
     """
     
-    # 2. Define the JSON Schema for Structured Output
-    email_schema = {
-        "type": "object",
-        "properties": {
-            "subject": {"type": "string", "description": "The generated email subject line."},
-            "body": {"type": "string", "description": "The generated email body, using newline characters where necessary."}
-        },
-        "required": ["subject", "body"]
-    }
-    
-    # 3. Call Gemini with Structured Config
+    # 2. Call Gemini with Structured Config (email_schema defined above)
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
+        response = llm_gateway.generate_content(
             model='gemini-2.5-pro',
+            agent="Communication Agent",
             contents=prompt,
             config={
                 "response_mime_type": "application/json",
@@ -52,8 +136,9 @@ def generate_llm_email_content(recipient_name, doc_title, due_date, context):
         
     except Exception as e:
         log_activity("Communication Agent", "LLM Gen Error", f"Failed to generate email content. Using fallback template. Error: {e}")
+        metrics.record_fallback("Communication Agent")
         
-        # 4. FALLBACK: Simple hardcoded template if LLM fails
+        # 3. FALLBACK: Simple hardcoded template if LLM fails
         if "expiry" in context.lower():
             subject = f"ACTION REQUIRED: Document '{doc_title}' expires on {due_date}"
             body = (
@@ -71,48 +156,228 @@ def generate_llm_email_content(recipient_name, doc_title, due_date, context):
         return subject, body
 
 
+# --- Template-First Rendering ---
+
+_variants = {}
+_variant_locks = {}  # one lock per (kind, urgency), so different context classes draft in parallel
+_variants_lock = threading.Lock()
+
+
+def get_llm_variant(kind, urgency):
+    """
+    Returns an LLM-drafted (subject, body) template pair for one context class, drafting it
+    on first use. Drafts that use placeholders outside TEMPLATE_FIELDS are rejected (None),
+    so the stock template is used instead.
+    """
+    key = (kind, urgency)
+    if key in _variants:
+        return _variants[key]
+    with _variants_lock:
+        key_lock = _variant_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        if key not in _variants:
+            _variants[key] = draft_llm_variant(kind, urgency)
+    return _variants[key]
+
+
+def draft_llm_variant(kind, urgency):
+    fields = TEMPLATE_FIELDS[kind]
+    placeholders = ", ".join("{" + field + "}" for field in fields)
+    prompt = f"""
+    You are a professional corporate communication AI drafting a reusable email template.
+
+    TASK: Write a concise subject and a professional, yet firm, body for a '{kind.replace('_', ' ')}' email
+    with {urgency or 'normal'} urgency.
+
+    Use these placeholders, including the curly braces, wherever the specific details belong: {placeholders}.
+    Do not use any other curly braces.
+    """
+    try:
+        response = llm_gateway.generate_content(
+            model='gemini-2.5-pro',
+            agent="Communication Agent",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": email_schema
+            }
+        )
+        draft = json.loads(response.text.strip())
+        subject, body = EmailTemplate(draft['subject']), EmailTemplate(draft['body'])
+        if not (subject.fields | body.fields) <= set(fields):
+            raise ValueError(f"unknown placeholders {sorted((subject.fields | body.fields) - set(fields))}")
+    except Exception as e:
+        log_activity("Communication Agent", "Variant Error", f"Could not draft a '{kind}' variant. Using the stock template. Error: {e}")
+        metrics.record_fallback("Communication Agent")
+        return None
+
+    log_activity("Communication Agent", "Variant Drafted", f"LLM template drafted for '{kind}' ({urgency or 'no urgency'}).")
+    return subject, body
+
+
+def render_email(kind, values, urgency=None, llm_request=None):
+    """
+    Renders (subject, body) for one message of `kind` from the precompiled templates.
+    The LLM is called per message only when EMAIL_LLM_MODE selects it (`llm_request`
+    holds the generate_llm_email_content arguments), or once per context class in
+    'variant' mode. Kinds without a template fall back to the LLM.
+    """
+    templates = get_compiled_templates()
+    has_template = kind in templates and f"{kind}_subject" in templates
+
+    personalize = EMAIL_LLM_MODE == 'all' or (EMAIL_LLM_MODE == 'urgent' and urgency in EMAIL_LLM_URGENCIES)
+    if personalize or not has_template:
+        count_render('llm')
+        return generate_llm_email_content(**llm_request)
+
+    if EMAIL_LLM_MODE == 'variant':
+        variant = get_llm_variant(kind, urgency)
+        if variant is not None:
+            count_render('variant')
+            return variant[0].render(values), variant[1].render(values)
+
+    count_render('template')
+    return templates[f"{kind}_subject"].render(values), templates[kind].render(values)
+
+
+def rendering_stats():
+    with _render_lock:
+        return dict(RENDER_COUNTS)
+
+
+# --- Digest Mode ---
+
+# (recipient, channel) -> {'name': recipient name, 'items': [(kind, values, urgency), ...]}, in arrival order
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def queue_digest_item(recipient, recipient_name, channel, kind, values, urgency=None):
+    """Holds one notification for the recipient's digest instead of sending it now."""
+    with _digests_lock:
+        digest = _digests.setdefault((recipient, channel), {'name': recipient_name, 'items': []})
+        digest['items'].append((kind, values, urgency))
+
+
+def take_digest_items():
+    """Removes and returns all pending digest entries, e.g. to hand them from a worker process to the coordinator."""
+    with _digests_lock:
+        pending = list(_digests.items())
+        _digests.clear()
+    return pending
+
+
+def add_digest_items(pending):
+    """Merges digest entries returned by take_digest_items() (in another process) into this one."""
+    for (recipient, channel), digest in pending:
+        for kind, values, urgency in digest['items']:
+            queue_digest_item(recipient, digest['name'], channel, kind, values, urgency)
+
+
+def render_digest(recipient_name, channel, items):
+    """Builds one consolidated (subject, body) for a recipient's digest; content is generated once per digest."""
+    lines = [f"- {digest_template(f'{kind}_line').render(values)}" for kind, values, _ in items]
+    values = {'recipient_name': recipient_name, 'count': len(items), 'items': "\n".join(lines)}
+
+    if channel == 'WhatsApp':
+        # WhatsApp pings never used the LLM; keep it that way for their digest
+        return digest_template('whatsapp_digest_subject').render(values), digest_template('whatsapp_digest').render(values)
+
+    ranked = [urgency for _, _, urgency in items if urgency in URGENCY_RANK]
+    urgency = max(ranked, key=URGENCY_RANK.get) if ranked else None
+    due_dates = sorted(str(values_['expiry_date']) for _, values_, _ in items if 'expiry_date' in values_)
+    return render_email(
+        'digest', values, urgency=urgency,
+        llm_request=dict(
+            recipient_name=recipient_name,
+            doc_title=f"{len(items)} document items",
+            due_date=due_dates[0] if due_dates else 'N/A',
+            context="Consolidated notice covering these items, each of which must be listed:\n" + "\n".join(lines)
+        )
+    )
+
+
+@metrics.timed("Communication Agent")
+def flush_digests():
+    """Sends one consolidated message per (recipient, channel) for everything queued this run."""
+    pending = take_digest_items()
+    if not pending:
+        return 0
+    for (recipient, channel), digest in pending:
+        subject, body = render_digest(digest['name'], channel, digest['items'])
+        log_communication(recipient, f"{channel} (Digest)", subject, body)
+
+    total_items = sum(len(digest['items']) for _, digest in pending)
+    log_activity("Communication Agent", "Digest Flush", f"{total_items} notifications sent as {len(pending)} digest messages.")
+    return len(pending)
+
+
 # --- Agent Functions ---
 
-def send_expiry_notification(doc_id, doc_title, owner_email, expiry_date):
-    """Sends a personalized email notification about an upcoming document expiry."""
+@metrics.timed("Communication Agent")
+def send_expiry_notification(doc_id, doc_title, owner_email, expiry_date, urgency=None, ai_summary=None):
+    """Sends an email notification about an upcoming document expiry."""
     owner_info = get_owner_info(owner_email)
     owner_name = owner_info['name']
+    values = {'owner_name': owner_name, 'title': doc_title, 'doc_id': doc_id, 'expiry_date': expiry_date,
+              'ai_summary': (ai_summary or 'no amendments suggested').strip().rstrip('.')}
+    if COMM_DIGEST:
+        queue_digest_item(owner_email, owner_name, "Email", 'expiry_notice', values, urgency)
+        return
     
-    # LLM-powered content generation
-    subject, body = generate_llm_email_content(
-        recipient_name=owner_name,
-        doc_title=doc_title,
-        due_date=expiry_date,
-        context=f"Document expiry notification for {doc_title}. Requires submission of updated document for review."
+    # Template-first; LLM personalization only when configured for this urgency
+    subject, body = render_email(
+        'expiry_notice', values,
+        urgency=urgency,
+        llm_request=dict(
+            recipient_name=owner_name,
+            doc_title=doc_title,
+            due_date=expiry_date,
+            context=f"Document expiry notification for {doc_title} ({urgency or 'normal'} urgency). "
+                    f"Requires submission of updated document for review."
+        )
     )
     
     log_communication(owner_email, "Email", subject, body)
 
 
-def send_review_request(doc_title, owner_name, reviewer_info):
-    """Sends a personalized email notification to the designated reviewer."""
+@metrics.timed("Communication Agent")
+def send_review_request(doc_title, owner_name, reviewer_info, urgency=None):
+    """Sends an email notification to the designated reviewer."""
+    values = {'reviewer_name': reviewer_info['name'], 'owner_name': owner_name, 'title': doc_title}
+    if COMM_DIGEST:
+        queue_digest_item(reviewer_info['email'], reviewer_info['name'], "Email", 'review_request', values, urgency)
+        return
     
-    # LLM-powered content generation
-    subject, body = generate_llm_email_content(
-        recipient_name=reviewer_info['name'],
-        doc_title=doc_title,
-        due_date='N/A', # Not applicable for review requests
-        context=f"A new document submission ({doc_title}) by {owner_name} requires your review."
+    subject, body = render_email(
+        'review_request', values,
+        urgency=urgency,
+        llm_request=dict(
+            recipient_name=reviewer_info['name'],
+            doc_title=doc_title,
+            due_date='N/A', # Not applicable for review requests
+            context=f"A new document submission ({doc_title}) by {owner_name} requires your review."
+        )
     )
     
     log_communication(reviewer_info['email'], "Email", subject, body)
 
 
-def send_cp_approval_request(applicant_name, specialty, approver_email):
-    """Sends a personalized C&P final approval request to the designated approver."""
+@metrics.timed("Communication Agent")
+def send_cp_approval_request(applicant_name, specialty, approver_email, urgency=None):
+    """Sends a C&P final approval request to the designated approver."""
     approver_info = get_owner_info(approver_email)
 
-    # LLM-powered content generation
-    subject, body = generate_llm_email_content(
-        recipient_name=approver_info['name'],
-        doc_title=f"C&P Application for Dr. {applicant_name}",
-        due_date='ASAP',
-        context=f"Final Credentialing and Privileging (C&P) request for Dr. {applicant_name} ({specialty}). Application is fully compliant and awaits final sign-off."
+    subject, body = render_email(
+        'cp_approval_request',
+        {'approver_name': approver_info['name'], 'applicant_name': applicant_name, 'specialty': specialty},
+        urgency=urgency,
+        llm_request=dict(
+            recipient_name=approver_info['name'],
+            doc_title=f"C&P Application for Dr. {applicant_name}",
+            due_date='ASAP',
+            context=f"Final Credentialing and Privileging (C&P) request for Dr. {applicant_name} ({specialty}). Application is fully compliant and awaits final sign-off."
+        )
     )
     
     log_communication(approver_email, "Email (C&P)", subject, body)
@@ -120,9 +385,14 @@ def send_cp_approval_request(applicant_name, specialty, approver_email):
 
 # --- Simulation/Simple Functions (No LLM required for these) ---
 
+@metrics.timed("Communication Agent")
 def send_whatsapp_acknowledgement(owner_email, doc_title, status):
     """Simulates sending a WhatsApp notification (no LLM required for this simple ping)."""
     owner_info = get_owner_info(owner_email)
+    if COMM_DIGEST:
+        kind = 'request_sent' if status == "request_sent" else 'confirmation'
+        queue_digest_item(owner_email, owner_info['name'], "WhatsApp", kind, {'title': doc_title})
+        return
     
     if status == "request_sent":
         subject = f"Request sent for '{doc_title}'"
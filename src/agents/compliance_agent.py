@@ -1,9 +1,14 @@
 # src/agents/compliance_agent.py
 
-from src.utils import DOCUMENTS_DF, ACTIVITY_LOG_PATH, log_activity
-from google import genai
+from src.utils import get_document_registry, ACTIVITY_LOG_PATH, log_activity
+from src import llm_gateway, log_writer
+from src import metrics as telemetry  # `metrics` is the dashboard input dict below
 import json
 import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 from datetime import date
 
 # --- Helper Function (No AI needed) ---
@@ -11,19 +16,20 @@ from datetime import date
 def check_document_status(doc_id):
     """
     Simulates checking a document's status in the central registry.
-    This is typically done via a database query, but here we read the global DataFrame.
+    This is typically done via a database query, but here we use the indexed registry.
     """
-    doc = DOCUMENTS_DF[DOCUMENTS_DF['doc_id'] == doc_id]
-    if not doc.empty:
+    doc = get_document_registry().get(doc_id)
+    if doc is not None:
         return {
-            'doc_id': doc.iloc[0]['doc_id'],
-            'status': doc.iloc[0]['status'],
-            'expiry_date': doc.iloc[0]['expiry_date']
+            'doc_id': doc['doc_id'],
+            'status': doc['status'],
+            'expiry_date': doc['expiry_date']
         }
     return None
 
 # --- Compliance/Update Functions (No AI needed) ---
 
+@telemetry.timed("Compliance Agent")
 def acknowledge_staff_read(doc_id, owner_info):
     """Logs the staff's simulated acknowledgment of a document."""
     owner_name = owner_info['name']
@@ -35,17 +41,10 @@ def acknowledge_staff_read(doc_id, owner_info):
     # In a real system, this would update a training/acknowledgment matrix.
     return True
 
+@telemetry.timed("Compliance Agent")
 def update_document_review_date(doc_id, new_date):
-    """Updates the document's review/expiry date in the global registry (DataFrame)."""
-    global DOCUMENTS_DF
-    
-    # Find the document index
-    idx = DOCUMENTS_DF[DOCUMENTS_DF['doc_id'] == doc_id].index
-    
-    if not idx.empty:
-        # Update the review date
-        DOCUMENTS_DF.loc[idx, 'review_date'] = str(new_date)
-        
+    """Updates the document's review/expiry date in the global registry."""
+    if get_document_registry().update_review_dates([doc_id], new_date):
         # In a full system, you would also update the expiry_date based on a standard interval (e.g., +2 years)
         
         log_activity("Compliance Agent", "Document Update", f"Updating review date for {doc_id}.")
@@ -54,18 +53,27 @@ def update_document_review_date(doc_id, new_date):
         return True
     return False
 
+def update_document_review_dates(doc_ids, new_date):
+    """Bulk variant: updates the review date of many documents in one vectorized call."""
+    updated = get_document_registry().update_review_dates(doc_ids, new_date)
+    log_activity("Compliance Agent", "Bulk Document Update", f"{len(updated)} review dates updated to {new_date}.")
+    return updated
+
+@telemetry.timed("Compliance Agent")
 def finalize_document_status(doc_id, status):
     """Finalizes the status of a document (e.g., 'Active (Renewed)' or 'Retired')."""
-    global DOCUMENTS_DF
-    
-    idx = DOCUMENTS_DF[DOCUMENTS_DF['doc_id'] == doc_id].index
-    
-    if not idx.empty:
-        DOCUMENTS_DF.loc[idx, 'status'] = status
+    if get_document_registry().update_statuses([doc_id], status):
         log_activity("Compliance Agent", "Final Record Update", f"Document {doc_id} status set to '{status}'.")
         return True
     return False
 
+def finalize_document_statuses(doc_ids, status):
+    """Bulk variant: sets the status of many documents in one vectorized call."""
+    updated = get_document_registry().update_statuses(doc_ids, status)
+    log_activity("Compliance Agent", "Bulk Final Record Update", f"{len(updated)} documents set to '{status}'.")
+    return updated
+
+@telemetry.timed("Compliance Agent")
 def finalize_cp_privileges(applicant_name, specialty):
     """Simulates logging the final privileging status for a C&P applicant."""
     # In a real system, this would write to a credentialing database
@@ -77,45 +85,178 @@ def finalize_cp_privileges(applicant_name, specialty):
 
 # --- AI Reporting Function (New) ---
 
+# The activity log is summarized map-reduce style: it is streamed in chunks of at most
+# DASHBOARD_CHUNK_CHARS, event counts are aggregated locally, chunks are summarized
+# concurrently and the partial summaries are reduced into the executive summary.
+DASHBOARD_CHUNK_CHARS = int(os.getenv('DASHBOARD_CHUNK_CHARS', '20000'))
+DASHBOARD_CONCURRENCY = int(os.getenv('DASHBOARD_CONCURRENCY', '4'))
+DASHBOARD_REDUCE_FANOUT = int(os.getenv('DASHBOARD_REDUCE_FANOUT', '8'))
+
+LOG_LINE_PATTERN = re.compile(r"^\[[^\]]+\] \[(?P<agent>[^\]]+)\] (?P<action>[^:]+):")
+
+EXECUTIVE_SUMMARY_REQUIREMENTS = """
+    EXECUTIVE SUMMARY REQUIREMENTS:
+    1. Must be three short paragraphs, max 10 lines total.
+    2. Must summarize the total number of documents processed and renewed.
+    3. Must summarize the outcome of the C&P application(s) handled.
+    4. Must highlight any critical fallbacks (e.g., LLM routing fallback if present in the log).
+"""
+
+
+def iter_log_chunks(path, chunk_chars=None):
+    """Streams the log file as text chunks of roughly `chunk_chars`, split on line boundaries."""
+    chunk_chars = chunk_chars or DASHBOARD_CHUNK_CHARS
+    chunk, size = [], 0
+    with open(path, 'r') as f:
+        for line in f:
+            if chunk and size + len(line) > chunk_chars:
+                yield "".join(chunk)
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line)
+    if chunk:
+        yield "".join(chunk)
+
+
+def count_log_events(chunk, counts):
+    """Adds per-agent/per-event counts for one chunk into `counts` (a Counter)."""
+    for line in chunk.splitlines():
+        match = LOG_LINE_PATTERN.match(line)
+        if match:
+            counts[(match.group('agent'), match.group('action').strip())] += 1
+
+
+def format_event_counts(counts):
+    return "\n".join(f"    - [{agent}] {action}: {count}" for (agent, action), count in sorted(counts.items()))
+
+
+def summarize_log_chunk(chunk, chunk_number):
+    """Map step: condenses one log chunk into a few factual bullet points."""
+    prompt = f"""
+    You are an Executive Reporting Analyst AI. Summarize the following excerpt (part {chunk_number}) of a
+    hospital document-control activity log in at most 5 factual bullet points. Include counts of documents
+    processed and renewed, C&P application outcomes, and every fallback or error that occurred.
+
+    ACTIVITY LOG EXCERPT:
+    {chunk}
+    """
+    try:
+        response = llm_gateway.generate_content(
+            model='gemini-2.5-pro',
+            agent="Compliance Agent",
+            contents=prompt
+        )
+        return response.text
+    except Exception as e:
+        log_activity("Compliance Agent", "AI Chunk Summary Error", f"Failed to summarize log chunk {chunk_number}. Error: {e}")
+        telemetry.record_fallback("Compliance Agent")
+        return f"- Log part {chunk_number}: summary unavailable (see event counts)."
+
+
+def combine_summaries(partial_summaries):
+    """Intermediate reduce step: merges several partial summaries into one, keeping memory bounded."""
+    joined = "\n\n".join(partial_summaries)
+    prompt = f"""
+    Merge the following partial summaries of one activity log into a single list of at most 8 factual
+    bullet points. Keep all counts, C&P outcomes, fallbacks and errors.
+
+    PARTIAL SUMMARIES:
+    {joined}
+    """
+    try:
+        response = llm_gateway.generate_content(
+            model='gemini-2.5-pro',
+            agent="Compliance Agent",
+            contents=prompt
+        )
+        return response.text
+    except Exception as e:
+        log_activity("Compliance Agent", "AI Reduce Error", f"Failed to merge {len(partial_summaries)} partial summaries. Error: {e}")
+        telemetry.record_fallback("Compliance Agent")
+        return joined
+
+
+@telemetry.timed("Compliance Agent")
+def summarize_activity_log(path):
+    """
+    Streams the activity log and returns (analysis_input, event counts). A log that fits
+    in one chunk is passed through verbatim; larger logs are reduced to merged chunk
+    summaries so the final prompt stays bounded regardless of log size.
+    """
+    counts = Counter()
+    chunks = iter_log_chunks(path)
+    first_chunk = next(chunks, "")
+    count_log_events(first_chunk, counts)
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        return first_chunk, counts
+
+    def counted(chunk_iter):
+        for chunk in chunk_iter:
+            count_log_events(chunk, counts)
+            yield chunk
+
+    remaining = chain([first_chunk], counted(chain([second_chunk], chunks)))
+    partial_summaries, chunk_number = [], 0
+    with ThreadPoolExecutor(max_workers=max(1, DASHBOARD_CONCURRENCY)) as executor:
+        while True:
+            # Only one window of DASHBOARD_CONCURRENCY chunks is held in memory at a time
+            window = list(islice(remaining, max(1, DASHBOARD_CONCURRENCY)))
+            if not window:
+                break
+            futures = [
+                executor.submit(summarize_log_chunk, chunk, chunk_number + offset + 1)
+                for offset, chunk in enumerate(window)
+            ]
+            chunk_number += len(window)
+            partial_summaries.extend(future.result() for future in futures)
+
+            # Collapse partial summaries early so they never grow with log size
+            if len(partial_summaries) >= DASHBOARD_REDUCE_FANOUT:
+                partial_summaries = [combine_summaries(partial_summaries)]
+
+    log_activity("Compliance Agent", "Log Map-Reduce", f"Activity log summarized in {chunk_number} chunks.")
+    return "PARTIAL SUMMARIES OF THE LOG:\n" + "\n\n".join(partial_summaries), counts
+
+
+@telemetry.timed("Compliance Agent")
 def generate_dashboard(metrics):
     """
     Generates the final compliance dashboard, including an AI-generated Executive Summary.
     """
     log_activity("Compliance Agent", "Dashboard Generation", "Starting metric aggregation and AI analysis...")
 
-    # 1. Read the full Activity Log for context
+    # 1. Stream the Activity Log (after flushing buffered entries) into a bounded analysis input
+    log_writer.flush()
     try:
-        with open(ACTIVITY_LOG_PATH, 'r') as f:
-            activity_log = f.read()
+        activity_log, event_counts = summarize_activity_log(ACTIVITY_LOG_PATH)
     except Exception as e:
         log_activity("Compliance Agent", "Log Read Error", f"Could not read activity log for AI analysis. Error: {e}")
-        activity_log = "Error: Activity log file could not be read."
+        activity_log, event_counts = "Error: Activity log file could not be read.", Counter()
         
     # 2. Define the AI Analysis Prompt
     prompt = f"""
     You are an Executive Reporting Analyst AI. Your task is to analyze the following activity log and generate a 
     concise, professional Executive Summary for the Quality Management Representative (QMR).
-    
-    EXECUTIVE SUMMARY REQUIREMENTS:
-    1. Must be three short paragraphs, max 10 lines total.
-    2. Must summarize the total number of documents processed and renewed.
-    3. Must summarize the outcome of the C&P application(s) handled.
-    4. Must highlight any critical fallbacks (e.g., LLM routing fallback if present in the log).
-    
+    {EXECUTIVE_SUMMARY_REQUIREMENTS}
+    EVENT COUNTS (aggregated from the full log):
+{format_event_counts(event_counts)}
+
     ACTIVITY LOG FOR ANALYSIS:
     {activity_log}
     """
     
     # 3. Call Gemini to generate the summary
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
+        response = llm_gateway.generate_content(
             model='gemini-2.5-pro', # Use Pro for better summarization and reasoning
+            agent="Compliance Agent",
             contents=prompt
         )
         executive_summary = response.text
     except Exception as e:
         log_activity("Compliance Agent", "AI Summary Error", f"Failed to generate AI summary. Error: {e}")
+        telemetry.record_fallback("Compliance Agent")
         executive_summary = "AI Summary Failed. Review raw logs for details."
 
 
@@ -128,6 +269,10 @@ def generate_dashboard(metrics):
     dashboard_content += "\n\n---\n\n## Key Metrics\n"
     dashboard_content += f"**Documents Renewed:** {metrics.get('docs_renewed', 0)}\n"
     dashboard_content += f"**C&P Privileges Granted:** {metrics.get('cp_granted', 0)}\n"
+
+    # Where the run spent its time, so the bottleneck (triage, routing, email drafting...) is visible
+    dashboard_content += "\n---\n\n## Performance Telemetry\n"
+    dashboard_content += telemetry.summary_markdown() + "\n"
     
     # Save the final file
     output_path = os.path.join('outputs', 'compliance_dashboard.md')
@@ -135,4 +280,4 @@ def generate_dashboard(metrics):
     with open(output_path, 'w') as f:
         f.write(dashboard_content)
         
-    log_activity("Compliance Agent", "Dashboard Generation", f"Dashboard saved to {output_path}.")
\ No newline at end of file
+    log_activity("Compliance Agent", "Dashboard Generation", f"Dashboard saved to {output_path}.")
@@ -1,8 +1,15 @@
 # src/agents/credential_verification_agent.py (Revised)
 
-from src.utils import CONSULTANT_APP, POLICY_RULES, log_activity
-from google import genai
+from src.utils import get_consultant_app, get_policy_rules, log_activity, CURRENT_DATE
+from src import llm_gateway, metrics
+from src.credential_matcher import CredentialMatcher
+from itertools import islice
+import glob
 import json
+import os
+
+# Applications are checked in chunks of this size, so a stream of any length uses bounded memory
+CP_BATCH_SIZE = int(os.getenv('CP_BATCH_SIZE', '1000'))
 
 # Define the structured output schema for the LLM's verification
 verification_schema = {
@@ -15,16 +22,20 @@ verification_schema = {
     "required": ["is_compliant", "missing_docs", "policy_justification"]
 }
 
-def verify_consultant_credentials():
+@metrics.timed("Credential Verification Agent")
+def verify_consultant_credentials(application=None):
     """
     AI-Enhanced: Uses LLM to interpret complex policy rules against the
     consultant application data to determine compliance.
+    Defaults to the single application in data/consultant_application.json.
     """
-    log_activity("Credential Verification Agent", "Check Start", f"Verifying C&P application for {CONSULTANT_APP['name']}.")
+    consultant_app = application or get_consultant_app()
+    policy_rules = get_policy_rules()
+    log_activity("Credential Verification Agent", "Check Start", f"Verifying C&P application for {consultant_app['name']}.")
 
-    # Policy rules are loaded from utils.py (POLICY_RULES)
-    policy_text = json.dumps(POLICY_RULES, indent=2)
-    application_data = json.dumps(CONSULTANT_APP, indent=2)
+    # Policy rules are loaded lazily from utils.py (get_policy_rules)
+    policy_text = json.dumps(policy_rules, indent=2)
+    application_data = json.dumps(consultant_app, indent=2)
     
     prompt = f"""
     You are a Credentialing and Privileging (C&P) Policy Compliance AI.
@@ -42,9 +53,9 @@ def verify_consultant_credentials():
     
     # 1. Call LLM for Policy Interpretation
     try:
-        client = genai.Client()
-        response = client.models.generate_content(
+        response = llm_gateway.generate_content(
             model='gemini-2.5-pro', # Use Pro for better reasoning on policy text
+            agent="Credential Verification Agent",
             contents=prompt,
             config={
                 "response_mime_type": "application/json",
@@ -55,6 +66,7 @@ def verify_consultant_credentials():
         
     except Exception as e:
         log_activity("Credential Verification Agent", "AI Policy Error", f"LLM verification failed. Defaulting to NON-COMPLIANT. Error: {e}")
+        metrics.record_fallback("Credential Verification Agent")
         # Default fallback to non-compliant for safety
         verification = {'is_compliant': False, 'missing_docs': ['AI Policy Check Failed'], 'policy_justification': 'System error in policy interpretation.'}
     
@@ -62,13 +74,120 @@ def verify_consultant_credentials():
     # 2. Return the structured results
     log_status = "COMPLIANT" if verification['is_compliant'] else "NON-COMPLIANT"
     log_activity("Credential Verification Agent", "Check Complete", 
-                 f"Application for {CONSULTANT_APP['name']} is {log_status}.") # Use 'name'
+                 f"Application for {consultant_app['name']} is {log_status}.") # Use 'name'
                  
     return {
-        'applicant': CONSULTANT_APP['name'],      # Use 'name' for the applicant's name
-        'email': CONSULTANT_APP['email'],         # Use 'email' for the applicant's email
-        'specialty': CONSULTANT_APP['specialty'], # This key seems correct
+        'applicant': consultant_app['name'],      # Use 'name' for the applicant's name
+        'email': consultant_app['email'],         # Use 'email' for the applicant's email
+        'specialty': consultant_app['specialty'], # This key seems correct
         'is_compliant': verification['is_compliant'],
         'missing_docs': verification['missing_docs'],
-        'ai_justification': verification['policy_justification']
-    }
\ No newline at end of file
+        'ai_justification': verification['policy_justification'],
+        'decision_path': 'llm'
+    }
+
+
+# --- Bulk Verification ---
+
+def load_applications(source):
+    """
+    Yields application dicts from a directory of *.json / *.jsonl files, a single such file,
+    or any iterable of dicts. A .json file may hold one application or a list of them; a
+    .jsonl file holds one application per line and is read line by line.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.isdir(source):
+            paths = sorted(glob.glob(os.path.join(source, '*.json')) + glob.glob(os.path.join(source, '*.jsonl')))
+        else:
+            paths = [source]
+        for path in paths:
+            try:
+                with open(path, 'r') as f:
+                    if str(path).endswith('.jsonl'):
+                        for line in f:
+                            if line.strip():
+                                yield json.loads(line)
+                        continue
+                    loaded = json.load(f)
+                yield from (loaded if isinstance(loaded, list) else [loaded])
+            except Exception as e:
+                log_activity("Credential Verification Agent", "Application Read Error", f"Skipping {path}. Error: {e}")
+    else:
+        yield from source
+
+
+def deterministic_result(application, check):
+    """Builds a verification result without the LLM, in the same shape as verify_consultant_credentials."""
+    is_compliant = not check['missing_docs'] and not check['expiring_docs']
+    if is_compliant:
+        justification = "All required C&P documents were submitted and are valid."
+    else:
+        problems = []
+        if check['missing_docs']:
+            problems.append(f"not found among the submitted files: {', '.join(check['missing_docs'])}")
+        if check['expiring_docs']:
+            problems.append(f"expired or expiring within the policy threshold: {', '.join(check['expiring_docs'])}")
+        justification = f"Required documents {'; '.join(problems)}."
+    return {
+        'applicant': application['name'],
+        'email': application['email'],
+        'specialty': application['specialty'],
+        'is_compliant': is_compliant,
+        'missing_docs': check['missing_docs'],
+        'expiring_docs': check['expiring_docs'],
+        'evidence': check['evidence'],
+        'ai_justification': justification,
+        'decision_path': 'rule'
+    }
+
+
+def policy_unavailable_result(application):
+    """Non-compliant result used when no required documents are configured (fails closed, like the LLM fallback)."""
+    return {
+        'applicant': application['name'],
+        'email': application['email'],
+        'specialty': application['specialty'],
+        'is_compliant': False,
+        'missing_docs': ['Policy Check Failed'],
+        'expiring_docs': [],
+        'evidence': [],
+        'ai_justification': 'No required C&P documents are defined; the policy rules could not be loaded.',
+        'decision_path': 'fallback'
+    }
+
+
+def verify_consultant_applications(source):
+    """
+    Bulk C&P verification. Submitted files are matched to required categories and validity
+    dates locally, vectorized over each chunk of applications; only applications with
+    ambiguous evidence (a required document missing while unrecognized files were
+    submitted) are sent to the LLM. Yields one result per application, in input order.
+    """
+    matcher = CredentialMatcher.from_policy(get_policy_rules())
+    applications = load_applications(source)
+    counts = {'rule': 0, 'llm': 0, 'fallback': 0}
+
+    # Without required documents every application would pass locally; refuse them all instead
+    if not matcher.required_docs:
+        log_activity("Credential Verification Agent", "Policy Error",
+                     "No required_docs in the C&P policy rules. Defaulting every application to NON-COMPLIANT.")
+        for application in applications:
+            metrics.record_fallback("Credential Verification Agent")
+            counts['fallback'] += 1
+            yield policy_unavailable_result(application)
+    else:
+        while True:
+            batch = list(islice(applications, CP_BATCH_SIZE))
+            if not batch:
+                break
+            for application, check in zip(batch, matcher.assess(batch, CURRENT_DATE)):
+                if check['missing_docs'] and check['unmatched_docs']:
+                    result = verify_consultant_credentials(application)
+                else:
+                    result = deterministic_result(application, check)
+                counts[result['decision_path']] += 1
+                yield result
+
+    log_activity("Credential Verification Agent", "Bulk Check Complete",
+                 f"{sum(counts.values())} applications verified. Decided locally: {counts['rule']}, by LLM: {counts['llm']}, "
+                 f"fallback: {counts['fallback']}.")
\ No newline at end of file
@@ -1,9 +1,30 @@
 # src/agents/document_expiry_agent.py (Revised)
 
-from src.utils import DOCUMENTS_DF, CURRENT_DATE, log_activity, get_owner_info
+from src.utils import get_document_registry, get_hr_list, CURRENT_DATE, log_activity, get_owner_info
 from datetime import timedelta
-from google import genai
+from src import llm_gateway, metrics, run_state
+import asyncio
 import json
+import os
+
+# Triage mode: 'serial' (one blocking call per document), 'async' (bounded concurrent
+# fan-out) or 'batch' (many documents classified in a single request)
+TRIAGE_MODE = os.getenv('TRIAGE_MODE', 'serial')
+TRIAGE_CONCURRENCY = int(os.getenv('TRIAGE_CONCURRENCY', '8'))
+# Batch mode packs documents into one prompt until either limit is reached
+TRIAGE_BATCH_PROMPT_BUDGET = int(os.getenv('TRIAGE_BATCH_PROMPT_BUDGET', '12000'))  # characters
+TRIAGE_MAX_BATCH_SIZE = int(os.getenv('TRIAGE_MAX_BATCH_SIZE', '50'))
+# Deterministic rules decide most rows locally; set TRIAGE_RULES=0 to send every row to the LLM
+TRIAGE_RULES = os.getenv('TRIAGE_RULES', '1').lower() in ('1', 'true', 'yes')
+
+# Urgency rules, in priority order: (rule name, urgency_level, recommended_action).
+# These mirror the POLICY GUIDANCE given to the LLM; conditions are built in evaluate_urgency_rules.
+URGENCY_RULES = [
+    ('already_expired', 'High', 'send_email'),
+    ('chief_of_medical_staff_owner', 'High', 'send_email'),
+    ('policy_document', 'High', 'send_email'),
+    ('work_instruction', 'Medium', 'send_email'),
+]
 
 # Define the structured output schema for the LLM's recommendation
 recommendation_schema = {
@@ -15,71 +36,372 @@ recommendation_schema = {
     "required": ["urgency_level", "recommended_action"]
 }
 
-def get_expiring_documents(check_days=60):
+# Batch variant: one recommendation per document, keyed by doc_id
+batch_recommendation_schema = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "doc_id": {"type": "string", "description": "The doc_id of the document this recommendation applies to."},
+            **recommendation_schema["properties"]
+        },
+        "required": ["doc_id", "urgency_level", "recommended_action"]
+    }
+}
+
+# Safe fallback used whenever the LLM cannot classify a document
+FALLBACK_RECOMMENDATION = {'urgency_level': 'Medium', 'recommended_action': 'send_email', 'decision_path': 'fallback'}
+
+
+def evaluate_urgency_rules(docs):
     """
-    AI-Enhanced: Analyzes documents expiring soon and uses LLM to determine
-    the best action based on document context.
+    Vectorized rule engine over a slice of the registry. Returns a DataFrame aligned to
+    `docs` with urgency_level, recommended_action and decision_rule columns; rows that no
+    rule can decide (unknown type or unknown owner) have decision_rule set to None.
     """
-    log_activity("Document Expiry Agent", "Check Start", "Analyzing documents for upcoming expiries.")
-    
-    # Calculate the cutoff date (Fixed logic remains for filtering)
-    cutoff_date = CURRENT_DATE + timedelta(days=check_days)
-    
-    expiring_list = []
-    
-    # Filter documents based on the expiration date and 'Active' status
-    filtered_docs = DOCUMENTS_DF[
-        (DOCUMENTS_DF['Expiry_Date_dt'] <= cutoff_date) & 
-        (DOCUMENTS_DF['status'] == 'Active')
-    ]
-
-    for index, doc in filtered_docs.iterrows():
-        doc_data = doc.to_dict()
-        
-        # 🚨 FETCH OWNER INFO HERE 🚨
-        owner_info = get_owner_info(doc_data['owner_email'])
-        owner_position = owner_info.get('position', 'Staff') # Use a safe default
-        
-        # 1. Define Context for LLM
-        prompt = f"""
+    import numpy as np
+
+    position_by_email = {email: info.get('position') for email, info in get_hr_list().items()}
+    owner_position = docs['owner_email'].map(position_by_email)
+    owner_known = owner_position.notna()
+
+    conditions = {
+        # Expiry and the owner's seniority decide urgency regardless of document type
+        'already_expired': (docs['Expiry_Date_dt'] < CURRENT_DATE).to_numpy(dtype=bool),
+        'chief_of_medical_staff_owner': (owner_position == 'Chief of Medical Staff').to_numpy(dtype=bool),
+        # Type rules only apply once we know the owner is not the Chief of Medical Staff
+        'policy_document': ((docs['type'] == 'Policy') & owner_known).to_numpy(dtype=bool),
+        'work_instruction': ((docs['type'] == 'WI') & owner_known).to_numpy(dtype=bool),
+    }
+    condlist = [conditions[name] for name, _, _ in URGENCY_RULES]
+
+    decided = docs[[]].copy()
+    decided['decision_rule'] = np.select(condlist, [name for name, _, _ in URGENCY_RULES], default=None)
+    decided['urgency_level'] = np.select(condlist, [urgency for _, urgency, _ in URGENCY_RULES], default=None)
+    decided['recommended_action'] = np.select(condlist, [action for _, _, action in URGENCY_RULES], default=None)
+    return decided
+
+
+def build_urgency_prompt(doc_data, owner_position):
+    """Builds the per-document urgency prompt sent to the LLM."""
+    return f"""
         Analyze the following document context to determine renewal urgency and recommended communication.
-        
+
         DOCUMENT DETAILS:
         - Title: {doc_data['title']}
         - Type: {doc_data['type']}
         - Status: {doc_data['status']}
         - Days until expiry (simulated): {(doc_data['Expiry_Date_dt'] - CURRENT_DATE).days}
-        - Owner Position: {owner_position} # 🚨 USE THE FETCHED VARIABLE
-        
+        - Owner Position: {owner_position}
+
         POLICY GUIDANCE:
         - Policies are HIGH urgency.
         - Work Instructions (WI) are MEDIUM urgency.
         - Documents owned by the 'Chief of Medical Staff' are always HIGH urgency.
         - Documents already expired based on current date {CURRENT_DATE} must be HIGH urgency.
-        
+
         Provide the output as a clean JSON object based on the required schema.
         """
-        
-        # 2. Call LLM for Contextual Decision
-        try:
-            client = genai.Client()
-            response = client.models.generate_content(
-                model='gemini-2.5-pro',
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": recommendation_schema
+
+
+BATCH_PROMPT_HEADER = f"""
+        Analyze each document below to determine its renewal urgency and recommended communication.
+
+        POLICY GUIDANCE:
+        - Policies are HIGH urgency.
+        - Work Instructions (WI) are MEDIUM urgency.
+        - Documents owned by the 'Chief of Medical Staff' are always HIGH urgency.
+        - Documents already expired based on current date {CURRENT_DATE} must be HIGH urgency.
+
+        Return a JSON array with exactly one object per document, each carrying the document's doc_id.
+
+        DOCUMENTS:
+"""
+
+
+def build_batch_line(doc_data, owner_position):
+    """One compact line per document in a batch prompt."""
+    return (
+        f"        - doc_id: {doc_data['doc_id']} | Title: {doc_data['title']} | Type: {doc_data['type']} | "
+        f"Days until expiry: {(doc_data['Expiry_Date_dt'] - CURRENT_DATE).days} | Owner Position: {owner_position}\n"
+    )
+
+
+def plan_batches(prepared, prompt_budget=None, max_batch_size=None):
+    """
+    Groups prepared documents into batches, sizing each batch so that its prompt stays
+    within the character budget. A single oversized document still gets its own batch.
+    """
+    prompt_budget = prompt_budget or TRIAGE_BATCH_PROMPT_BUDGET
+    max_batch_size = max_batch_size or TRIAGE_MAX_BATCH_SIZE
+
+    batches, current, current_size = [], [], len(BATCH_PROMPT_HEADER)
+    for doc_data, owner_position in prepared:
+        line = build_batch_line(doc_data, owner_position)
+        if current and (current_size + len(line) > prompt_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_size = [], len(BATCH_PROMPT_HEADER)
+        current.append((doc_data, owner_position, line))
+        current_size += len(line)
+    if current:
+        batches.append(current)
+    return batches
+
+
+@metrics.timed("Document Expiry Agent")
+def classify_batch(batch):
+    """
+    Classifies a batch of documents in one request. Items that are missing, duplicated,
+    carry an unknown doc_id or an invalid urgency are re-classified individually. If the
+    request itself fails (e.g. quota exhausted after retries) or its response cannot be
+    parsed, the whole batch gets the fallback recommendation rather than one call per document.
+    """
+    prompt = BATCH_PROMPT_HEADER + "".join(line for _, _, line in batch)
+    batch_ids = {doc_data['doc_id'] for doc_data, _, _ in batch}
+    by_doc_id = {}
+
+    try:
+        response = llm_gateway.generate_content(
+            model='gemini-2.5-pro',
+            agent="Document Expiry Agent",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": batch_recommendation_schema
+            }
+        )
+        for item in json.loads(response.text.strip()):
+            doc_id = item.get('doc_id')
+            if (doc_id in batch_ids and doc_id not in by_doc_id
+                    and item.get('urgency_level') in ("Low", "Medium", "High")
+                    and item.get('recommended_action')):
+                by_doc_id[doc_id] = {
+                    'urgency_level': item['urgency_level'],
+                    'recommended_action': item['recommended_action'],
+                    'decision_path': 'llm'
                 }
-            )
-            recommendation = json.loads(response.text.strip())
-            
-        except Exception as e:
-            log_activity("Document Expiry Agent", "AI Decision Error", f"LLM failed for {doc_data['doc_id']}. Defaulting to Medium urgency. Error: {e}")
-            recommendation = {'urgency_level': 'Medium', 'recommended_action': 'send_email'} # Safe fallback
-        
-        # 3. Augment the document data with AI results
+    except Exception as e:
+        log_activity("Document Expiry Agent", "AI Batch Error",
+                     f"Batch of {len(batch)} documents failed. Defaulting them to Medium urgency. Error: {e}")
+        metrics.record_fallback("Document Expiry Agent")
+        return [dict(FALLBACK_RECOMMENDATION) for _ in batch]
+
+    recommendations = []
+    for doc_data, owner_position, _ in batch:
+        recommendation = by_doc_id.get(doc_data['doc_id'])
+        if recommendation is None:
+            recommendation = classify_document(doc_data, owner_position)
+        recommendations.append(recommendation)
+    return recommendations
+
+
+def classify_documents_batched(prepared):
+    """Classifies all prepared documents using budget-sized batch requests, in input order."""
+    batches = plan_batches(prepared)
+    log_activity("Document Expiry Agent", "Batch Plan", f"{len(prepared)} documents packed into {len(batches)} LLM requests.")
+    recommendations = []
+    for batch in batches:
+        recommendations.extend(classify_batch(batch))
+    return recommendations
+
+
+def prepare_document(doc):
+    """Converts a registry row to a dict and resolves the owner's position."""
+    doc_data = doc.to_dict()
+    owner_info = get_owner_info(doc_data['owner_email'])
+    owner_position = owner_info.get('position', 'Staff') # Use a safe default
+    return doc_data, owner_position
+
+
+def parse_recommendation(doc_id, response=None, error=None):
+    """Parses the LLM response, falling back to Medium/send_email on any failure."""
+    try:
+        if error is not None:
+            raise error
+        recommendation = json.loads(response.text.strip())
+        recommendation['decision_path'] = 'llm'
+        return recommendation
+    except Exception as e:
+        log_activity("Document Expiry Agent", "AI Decision Error", f"LLM failed for {doc_id}. Defaulting to Medium urgency. Error: {e}")
+        metrics.record_fallback("Document Expiry Agent")
+        return dict(FALLBACK_RECOMMENDATION)
+
+
+@metrics.timed("Document Expiry Agent")
+def classify_document(doc_data, owner_position):
+    """Blocking urgency classification for a single document."""
+    try:
+        response = llm_gateway.generate_content(
+            model='gemini-2.5-pro',
+            agent="Document Expiry Agent",
+            contents=build_urgency_prompt(doc_data, owner_position),
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": recommendation_schema
+            }
+        )
+        return parse_recommendation(doc_data['doc_id'], response)
+    except Exception as e:
+        return parse_recommendation(doc_data['doc_id'], error=e)
+
+
+async def classify_documents_async(prepared, concurrency):
+    """
+    Fans the urgency calls out concurrently, never running more than `concurrency`
+    requests at once. Results are returned in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def classify(doc_data, owner_position):
+        async with semaphore:
+            try:
+                response = await llm_gateway.generate_content_async(
+                    model='gemini-2.5-pro',
+                    agent="Document Expiry Agent",
+                    contents=build_urgency_prompt(doc_data, owner_position),
+                    config={
+                        "response_mime_type": "application/json",
+                        "response_schema": recommendation_schema
+                    }
+                )
+                return parse_recommendation(doc_data['doc_id'], response)
+            except Exception as e:
+                return parse_recommendation(doc_data['doc_id'], error=e)
+
+    # gather() preserves the order of its arguments, so expiring_list stays in registry order
+    return await asyncio.gather(*(classify(doc_data, owner_position) for doc_data, owner_position in prepared))
+
+
+def find_triage_candidates(check_days=60, use_rules=None):
+    """
+    Selects active documents expiring within `check_days` and applies the urgency rules.
+    Returns (filtered_docs, ambiguous_docs, rule_results) where rule_results maps the
+    index of every rule-decided row to its rule outcome.
+
+    With incremental runs enabled, documents already notified whose registry row is
+    unchanged since are dropped before triage, so only the delta is processed.
+    """
+    use_rules = TRIAGE_RULES if use_rules is None else use_rules
+
+    # Calculate the cutoff date (Fixed logic remains for filtering)
+    cutoff_date = CURRENT_DATE + timedelta(days=check_days)
+
+    # Filter documents based on the expiration date and 'Active' status (range slice on the expiry index)
+    filtered_docs = get_document_registry().expiring_before(cutoff_date, status='Active')
+
+    # Incremental runs: keep only documents that entered the window or changed since they were notified
+    state = run_state.get_store()
+    if state is not None:
+        in_window = len(filtered_docs)
+        filtered_docs, unchanged_docs = state.select_delta(filtered_docs)
+        log_activity("Document Expiry Agent", "Incremental Run",
+                     f"Last completed run: {state.watermark() or 'none'}. {in_window} documents in the window, "
+                     f"{len(unchanged_docs)} unchanged since notified, {len(filtered_docs)} to process.")
+
+    # Deterministic fast path: decide every row the policy rules cover
+    if use_rules:
+        decided = evaluate_urgency_rules(filtered_docs)
+        ambiguous_docs = filtered_docs[decided['decision_rule'].isna()]
+        rule_results = decided[decided['decision_rule'].notna()].to_dict('index')
+    else:
+        ambiguous_docs = filtered_docs
+        rule_results = {}
+    return filtered_docs, ambiguous_docs, rule_results
+
+
+def rule_recommendation(rule):
+    return {
+        'urgency_level': rule['urgency_level'],
+        'recommended_action': rule['recommended_action'],
+        'decision_path': 'rule',
+        'decision_rule': rule['decision_rule']
+    }
+
+
+def iter_triage_candidates(check_days=60, use_rules=None):
+    """
+    Streaming variant of the triage input: yields (doc_data, decided) in registry order,
+    where rule-decided documents already carry their recommendation and the rest still
+    need triage_document().
+    """
+    filtered_docs, _, rule_results = find_triage_candidates(check_days, use_rules)
+    for index, doc_data in zip(filtered_docs.index, filtered_docs.to_dict('records')):
+        if index in rule_results:
+            doc_data.update(rule_recommendation(rule_results[index]))
+            yield doc_data, True
+        else:
+            yield doc_data, False
+
+
+@metrics.timed("Document Expiry Agent")
+def triage_document(doc_data, decided):
+    """Completes triage for one streamed candidate, calling the LLM only if no rule decided it."""
+    if not decided:
+        owner_position = get_owner_info(doc_data['owner_email']).get('position', 'Staff')
+        doc_data.update(classify_document(doc_data, owner_position))
+    return doc_data
+
+
+@metrics.timed("Document Expiry Agent")
+def get_expiring_documents(check_days=60, mode=None, concurrency=None, use_rules=None):
+    """
+    AI-Enhanced: Analyzes documents expiring soon and uses LLM to determine
+    the best action based on document context.
+
+    mode='async' issues the urgency calls concurrently (bounded by `concurrency`)
+    instead of one blocking round trip per document; mode='batch' packs many
+    documents into each request.
+
+    Rows decided by the deterministic URGENCY_RULES never reach the LLM. Every returned
+    document carries a 'decision_path' of 'rule', 'llm' or 'fallback' for auditing.
+    """
+    mode = mode or TRIAGE_MODE
+    use_rules = TRIAGE_RULES if use_rules is None else use_rules
+    concurrency = concurrency or TRIAGE_CONCURRENCY
+    log_activity("Document Expiry Agent", "Check Start", "Analyzing documents for upcoming expiries.")
+
+    expiring_list = []
+
+    # 1. Filter the window and apply the deterministic fast path
+    filtered_docs, ambiguous_docs, rule_results = find_triage_candidates(check_days, use_rules)
+
+    # 2. Define Context for LLM (ambiguous rows only)
+    prepared = [prepare_document(doc) for _, doc in ambiguous_docs.iterrows()]
+
+    # 3. Call LLM for Contextual Decision
+    if mode == 'async':
+        recommendations = asyncio.run(classify_documents_async(prepared, concurrency))
+    elif mode == 'batch':
+        recommendations = classify_documents_batched(prepared)
+    else:
+        recommendations = [classify_document(doc_data, owner_position) for doc_data, owner_position in prepared]
+    llm_results = dict(zip(ambiguous_docs.index, recommendations))
+
+    # 4. Augment the document data with rule or AI results, keeping registry order
+    path_counts = {'rule': 0, 'llm': 0, 'fallback': 0}
+    for index, doc_data in zip(filtered_docs.index, filtered_docs.to_dict('records')):
+        if index in llm_results:
+            recommendation = llm_results[index]
+        else:
+            recommendation = rule_recommendation(rule_results[index])
         doc_data.update(recommendation)
+        path_counts[recommendation['decision_path']] += 1
         expiring_list.append(doc_data)
 
-    log_activity("Document Expiry Agent", "Found Documents", f"Found {len(expiring_list)} documents for action.")
-    return expiring_list
\ No newline at end of file
+    log_triage_summary(len(expiring_list), path_counts)
+    return expiring_list
+
+
+def log_triage_summary(found, path_counts):
+    """Logs how many documents need action and how each triage decision was reached."""
+    log_activity("Document Expiry Agent", "Found Documents",
+                 f"Found {found} documents for action. Decided by rule: {path_counts['rule']}, "
+                 f"LLM: {path_counts['llm']}, fallback: {path_counts['fallback']}.")
+
+
+def summarize_expiry_windows(windows=(30, 60, 90)):
+    """Counts active documents expiring within each window, answered in a single index pass."""
+    counts = {days: len(docs) for days, docs in get_document_registry().expiring_windows(CURRENT_DATE, windows).items()}
+    log_activity("Document Expiry Agent", "Expiry Windows",
+                 ", ".join(f"{days} days: {count}" for days, count in counts.items()))
+    return counts
@@ -1,119 +1,349 @@
 # agents/main_orchestrator.py
 
+import json
 import os
+import multiprocessing
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
 
 # Import all necessary components
 # 🚨 CORRECTION 1: Updated Communication and Compliance Agent Imports 🚨
-from src.utils import log_activity, log_communication, CURRENT_DATE, DOCUMENTS_DF
-from src.agents.document_expiry_agent import get_expiring_documents
+from src.utils import log_activity, log_communication, init_logs, CURRENT_DATE
+from src import delivery, llm_cache, llm_gateway, log_writer, registry_store, run_state, utils
+from src import metrics as telemetry  # `metrics` names the per-process result dicts below
+from src.pipeline import Stage, run_pipeline
+from src.agents.document_expiry_agent import get_expiring_documents, summarize_expiry_windows, iter_triage_candidates, triage_document, log_triage_summary, TRIAGE_MODE
 from src.agents.ai_review_agent import generate_ai_summary
 from src.agents.routing_role_agent import get_owner_info, determine_reviewers_and_approvers, determine_cp_approver
-from src.agents.communication_agent import send_expiry_notification, send_review_request, send_whatsapp_acknowledgement, send_cp_approval_request # Added send_cp_approval_request
-from src.agents.credential_verification_agent import verify_consultant_credentials
+from src.agents.communication_agent import send_expiry_notification, send_review_request, send_whatsapp_acknowledgement, send_cp_approval_request, rendering_stats, flush_digests, take_digest_items, add_digest_items # Added send_cp_approval_request
+from src.agents.credential_verification_agent import verify_consultant_applications
 from src.agents.compliance_agent import generate_dashboard, finalize_cp_privileges, update_document_review_date, finalize_document_status, acknowledge_staff_read # Added finalize_document_status and acknowledge_staff_read
+from src.agents.compliance_agent import update_document_review_dates, finalize_document_statuses
 
-def run_process_a_document_control_lifecycle():
+# --- Sharded Process A Configuration ---
+# With PROCESS_A_SHARDS > 1 the per-document lifecycle runs in a process pool, one shard per worker.
+PROCESS_A_SHARDS = int(os.getenv('PROCESS_A_SHARDS', '1'))
+PROCESS_A_SHARD_BY = os.getenv('PROCESS_A_SHARD_BY', 'hash')  # 'hash' (doc_id) or 'department'
+SHARD_START_METHOD = os.getenv('SHARD_START_METHOD', 'spawn')
+
+# --- Streaming Process A Configuration ---
+# With PROCESS_A_STREAMING=1 each document flows through the lifecycle stages as soon as it is
+# triaged. Worker threads per stage can be overridden with e.g. STAGE_CONCURRENCY_TRIAGE=8.
+PROCESS_A_STREAMING = os.getenv('PROCESS_A_STREAMING', '0').lower() in ('1', 'true', 'yes')
+STREAMING_STAGE_CONCURRENCY = {
+    name: int(os.getenv(f"STAGE_CONCURRENCY_{name.upper()}", default))
+    for name, default in [('triage', '4'), ('ai_review', '4'), ('notify', '2'), ('route', '2'),
+                          ('review_request', '2'), ('compliance', '1')]
+}
+
+# --- Bulk Process B Configuration ---
+# Point CP_APPLICATIONS_DIR at a folder of application JSON files to verify them all in one run;
+# otherwise Process B handles the single application in data/consultant_application.json.
+CP_APPLICATIONS_DIR = os.getenv('CP_APPLICATIONS_DIR', '')
+
+# --- Per-Document Lifecycle Steps ---
+# Each step takes and returns a context dict for one document, so the same steps can run
+# in a simple loop (process_document) or as stages of the streaming pipeline.
+
+def start_document(doc):
+    """Resolves the owner for a triaged document; returns the lifecycle context or None to skip."""
+    owner_info = get_owner_info(doc['owner_email'])
+    if not owner_info:
+        log_activity("Orchestrator", "Error", f"Skipping {doc['doc_id']}: Owner email not found in HR list.")
+        return None
+    return {'doc': doc, 'owner_info': owner_info}
+
+
+def review_step(ctx):
+    # 1. AI Review Agent: Get content suggestion (AI Summary), quoted in the expiry notice
+    ctx['ai_summary'] = generate_ai_summary(ctx['doc']['doc_id'], ctx['doc']['title'])
+    return ctx
+
+
+def notify_step(ctx):
+    doc, owner_name = ctx['doc'], ctx['owner_info']['name']
+    doc_id, doc_title, owner_email, expiry_date_str = doc['doc_id'], doc['title'], doc['owner_email'], doc['expiry_date']
+
+    # 2. Communication Agent: Send expiry notice
+    # 🚨 CORRECTION 2: Updated arguments for send_expiry_notification 🚨
+    send_expiry_notification(doc_id, doc_title, owner_email, expiry_date_str,
+                             urgency=doc.get('urgency_level'), ai_summary=ctx.get('ai_summary'))
+    ctx['notified'] = True
+
+    # 🟢 N8N INTEGRATION: Print JSON output for the initial Email Node
+    # --- Prepare Data for N8N Email Node ---
+    n8n_email_data = {
+        "doc_id": doc_id,
+        "doc_title": doc_title,
+        "owner_email": owner_email,
+        "subject": f"URGENT: Action Required - {doc_title} Expiration",
+        "body_intro": f"Dear {owner_name}, the {doc_title} ({doc_id}) is due for renewal before {expiry_date_str}. Please update and submit the new version.",
+        # Include next step info for potential HITL link generation in n8n
+        "next_reviewer_email": ctx['reviewer_info']['email'] if 'reviewer_info' in ctx else 'unknown'
+    }
+
+    # Print the JSON object to stdout for the n8n Execute Command node to capture
+    print(json.dumps(n8n_email_data))
+    # ----------------------------------------
+
+    # 3. HITL Simulation: Owner Review and Submission
+    log_activity("Orchestrator", "HITL Simulation", 
+                 f"Awaiting updated document {doc_id} from {owner_name}. (Simulated: Submitted for Review)")
+    return ctx
+
+
+def route_step(ctx):
+    doc = ctx['doc']
+    # 4. Routing Agent: Determine Reviewer/Approver for the new version
+    ctx['reviewer_info'], ctx['approver_info'] = determine_reviewers_and_approvers(
+        doc['title'], ctx['owner_info']['position'], doc['type'], doc['owner_email']
+    )
+    return ctx
+
+
+def review_request_step(ctx):
+    doc, owner_name = ctx['doc'], ctx['owner_info']['name']
+
+    # 5. Communication Agent: Request Review
+    # 🚨 CORRECTION 3: Updated arguments for send_review_request 🚨
+    send_review_request(doc['title'], owner_name, ctx['reviewer_info'], urgency=doc.get('urgency_level'))
+
+    # 6. HITL Simulation: Approval/Acknowledgment
+    log_activity("Orchestrator", "HITL Simulation", 
+                 f"Awaiting approval from {ctx['approver_info']['name']} for {doc['doc_id']}. (Simulated: Approved)")
+
+    # 7. Communication Agent: Trigger staff acknowledgment flow
+    # 🚨 CORRECTION 4: Updated arguments for send_whatsapp_acknowledgement 🚨
+    send_whatsapp_acknowledgement(doc['owner_email'], doc['title'], "request_sent") 
+
+    log_activity("Communication Agent", "HITL Input", f"Simulated acknowledgment received from {owner_name} for '{doc['title']}'.")
+    send_whatsapp_acknowledgement(doc['owner_email'], doc['title'], "confirmation") # Confirmation message
+    return ctx
+
+
+def compliance_step(ctx):
+    doc_id = ctx['doc']['doc_id']
+
+    # 8. Compliance Agent: Log acknowledgment and Update the last_review date
+    acknowledge_staff_read(doc_id, ctx['owner_info']) # Log the acknowledgment
+    update_document_review_date(doc_id, CURRENT_DATE) # Update date using the current simulation date
+
+    # 9. Compliance Agent: Final status logging (The audit trail)
+    # 🚨 CORRECTION 5: Use finalize_document_status instead of the removed log_final_approval 🚨
+    finalize_document_status(doc_id, "Active (Renewed)")
+    ctx['renewed'] = True
+    return ctx
+
+
+LIFECYCLE_STEPS = [review_step, notify_step, route_step, review_request_step, compliance_step]
+
+
+def process_document(doc):
+    """
+    Runs the full lifecycle (review, notify, route, approve, acknowledge, update) for one
+    triaged expiring document. Returns the final lifecycle context, or None if skipped.
+    """
+    ctx = start_document(doc)
+    if ctx is None:
+        return None
+    for step in LIFECYCLE_STEPS:
+        ctx = step(ctx)
+    return ctx
+
+
+def record_outcome(state, doc, notified, renewed):
+    """Remembers a processed document in the incremental run state (no-op when disabled)."""
+    if state is not None:
+        state.record(doc, CURRENT_DATE, notified, renewed)
+
+
+def partition_documents(docs, shards, shard_by='hash'):
+    """
+    Splits triaged documents into `shards` lists, deterministically: by a stable hash of
+    doc_id, or by the owner's department so one department stays within one shard.
+    Relative document order is preserved inside each shard.
+    """
+    directory = utils.get_staff_directory()
+    partitions = [[] for _ in range(shards)]
+    for doc in docs:
+        if shard_by == 'department':
+            owner = directory.get(doc['owner_email'])
+            key = owner.department if owner is not None else 'Unknown'
+        else:
+            key = doc['doc_id']
+        partitions[zlib.crc32(str(key).encode('utf-8')) % shards].append(doc)
+    return partitions
+
+
+def init_shard_worker(backend, data_dir, cache_bypass):
+    """
+    Process pool initializer: silences stdout echo and applies the coordinator's data folder,
+    cache setting and non-network backend, which spawned workers would otherwise re-read from
+    the environment. Workers read the persisted registry but leave writing its log to the coordinator.
+    """
+    utils.LOG_QUIET = True
+    utils.DATA_DIR = data_dir
+    llm_cache.LLM_CACHE_BYPASS = cache_bypass
+    registry_store.JOURNAL_WRITES = False
+    if backend is not None:
+        llm_gateway.set_backend(backend)
+
+
+def run_process_a_shard(shard_docs):
+    """
+    Worker: runs the full lifecycle for one shard. Log entries are captured and returned
+    to the coordinator rather than written, so the merged logs are deterministic.
+    """
+    log_writer.start_capture()
+    # A pool worker may run several shards (or inherit the coordinator's counts when forked);
+    # report only this shard's telemetry so the coordinator's merge counts everything once
+    telemetry.reset()
+    renewed, outcomes = [], []
+    for doc in shard_docs:
+        ctx = process_document(doc) or {}
+        if ctx.get('renewed'):
+            renewed.append(doc['doc_id'])
+        outcomes.append((doc, ctx.get('notified', False), ctx.get('renewed', False)))
+    # Digest notifications are sent by the coordinator, so each recipient gets one digest across shards
+    return {'renewed': renewed, 'outcomes': outcomes, 'log_entries': log_writer.stop_capture(),
+            'digest_items': take_digest_items(), 'telemetry': telemetry.snapshot()}
+
+
+def run_process_a_sharded(expiring_docs, shards, shard_by):
+    """
+    Coordinator: fans the expiring documents out across a process pool and merges the
+    shard results back in shard order (logs, metrics and registry updates).
+    """
+    partitions = [part for part in partition_documents(expiring_docs, shards, shard_by) if part]
+    log_activity("Orchestrator", "Sharding",
+                 f"{len(expiring_docs)} documents split into {len(partitions)} shards by {shard_by}: "
+                 f"{[len(part) for part in partitions]}")
+
+    # Only local backends (e.g. a stub) are shipped to the workers; Gemini clients are created per process
+    backend = llm_gateway.current_backend()
+    portable_backend = None if isinstance(backend, llm_gateway.GeminiBackend) else backend
+
+    with ProcessPoolExecutor(
+        max_workers=len(partitions),
+        mp_context=multiprocessing.get_context(SHARD_START_METHOD),
+        initializer=init_shard_worker,
+        initargs=(portable_backend, os.path.abspath(utils.DATA_DIR), llm_cache.LLM_CACHE_BYPASS),
+    ) as executor:
+        results = list(executor.map(run_process_a_shard, partitions))
+
+    renewed = []
+    state = run_state.get_store()
+    for result in results:
+        log_writer.write_many(result['log_entries'])
+        add_digest_items(result['digest_items'])
+        telemetry.merge(result['telemetry'])
+        renewed.extend(result['renewed'])
+        for outcome in result['outcomes']:
+            record_outcome(state, *outcome)
+
+    # Workers updated their own copy of the registry; apply the same changes here in bulk
+    update_document_review_dates(renewed, CURRENT_DATE)
+    finalize_document_statuses(renewed, "Active (Renewed)")
+    return {'docs_renewed': len(renewed), 'cp_granted': 0}
+
+
+def run_process_a_streaming(stage_concurrency=None):
+    """
+    Streams each expiring document through triage -> AI review -> notify -> route ->
+    review request -> compliance update, so the first notification goes out as soon as the
+    first document is triaged instead of after the whole window has been analysed.
+    """
+    concurrency = dict(STREAMING_STAGE_CONCURRENCY, **(stage_concurrency or {}))
+    metrics = {'docs_renewed': 0, 'cp_granted': 0}
+    state = run_state.get_store()
+    path_counts = {'rule': 0, 'llm': 0, 'fallback': 0}
+    counts_lock = threading.Lock()
+
+    def triage_stage(candidate):
+        doc = triage_document(*candidate)
+        with counts_lock:
+            path_counts[doc['decision_path']] += 1
+        return start_document(doc)
+
+    def count_renewed(ctx):
+        if ctx.get('renewed'):
+            metrics['docs_renewed'] += 1
+        record_outcome(state, ctx['doc'], ctx.get('notified', False), ctx.get('renewed', False))
+
+    stages = [Stage('triage', triage_stage, concurrency['triage'])] + [
+        Stage(name, step, concurrency[name])
+        for name, step in zip(['ai_review', 'notify', 'route', 'review_request', 'compliance'], LIFECYCLE_STEPS)
+    ]
+    log_activity("Document Expiry Agent", "Check Start", "Analyzing documents for upcoming expiries.")
+    stats = run_pipeline(iter_triage_candidates(), stages, sink=count_renewed)
+    log_triage_summary(sum(path_counts.values()), path_counts)
+
+    log_activity("Orchestrator", "Pipeline Stats",
+                 "; ".join(f"{name}: {s['processed']} done, {s['errors']} errors, first after {s['first_completed_s']}s"
+                           for name, s in stats.items()))
+    return metrics
+
+
+@telemetry.timed("Orchestrator")
+def run_process_a_document_control_lifecycle(shards=None, shard_by=None, streaming=None):
     """
     Orchestrator: Manages the proactive document renewal workflow.
+    With shards > 1, the per-document lifecycle runs in a process pool (see run_process_a_sharded);
+    with streaming=True, documents flow through a staged pipeline (see run_process_a_streaming).
     """
+    shards = shards or PROCESS_A_SHARDS
+    shard_by = shard_by or PROCESS_A_SHARD_BY
+    streaming = PROCESS_A_STREAMING if streaming is None else streaming
+    started_at = time.time()
     log_activity("Orchestrator", "Start Process A", "Daily execution: Document Control Lifecycle.")
     
-    expiring_docs = get_expiring_documents()
-    
-    # Initialize metrics for the dashboard
-    metrics = {'docs_renewed': 0, 'cp_granted': 0}
-    
-    for doc in expiring_docs:
-        doc_id = doc['doc_id']
-        doc_title = doc['title']
-        owner_email = doc['owner_email']
-        expiry_date_str = doc['expiry_date']
-        doc_type = doc['type']
-        
-        owner_info = get_owner_info(owner_email)
-        if not owner_info:
-            log_activity("Orchestrator", "Error", f"Skipping {doc_id}: Owner email not found in HR list.")
-            continue
-            
-        owner_name = owner_info['name']
-        owner_role = owner_info['position']
-        
-        # 1. AI Review Agent: Get content suggestion (AI Summary)
-        # Note: We generate it but don't use it in the communication function as designed in the new AI comm agent
-        ai_summary = generate_ai_summary(doc_id, doc_title)
-        
-        # 2. Communication Agent: Send expiry notice
-# 2. Communication Agent: Send expiry notice
-        # 🚨 CORRECTION 2: Updated arguments for send_expiry_notification 🚨
-        send_expiry_notification(doc_id, doc_title, owner_email, expiry_date_str)
-        
-        # 🟢 N8N INTEGRATION: Print JSON output for the initial Email Node
-        import json
-        
-        # --- Prepare Data for N8N Email Node ---
-        n8n_email_data = {
-            "doc_id": doc_id,
-            "doc_title": doc_title,
-            "owner_email": owner_email,
-            "subject": f"URGENT: Action Required - {doc_title} Expiration",
-            "body_intro": f"Dear {owner_name}, the {doc_title} ({doc_id}) is due for renewal before {expiry_date_str}. Please update and submit the new version.",
-            # Include next step info for potential HITL link generation in n8n
-            "next_reviewer_email": reviewer_info['email'] if 'reviewer_info' in locals() else 'unknown' 
-        }
-        
-        # Print the JSON object to stdout for the n8n Execute Command node to capture
-        print(json.dumps(n8n_email_data))
-        # ----------------------------------------
-        
-        # 3. HITL Simulation: Owner Review and Submission
-        log_activity("Orchestrator", "HITL Simulation", 
-                     f"Awaiting updated document {doc_id} from {owner_name}. (Simulated: Submitted for Review)")
-        
-        
-        # 4. Routing Agent: Determine Reviewer/Approver for the new version
-        reviewer_info, approver_info = determine_reviewers_and_approvers(doc_title, owner_role)
-        
-        # 5. Communication Agent: Request Review
-        # 🚨 CORRECTION 3: Updated arguments for send_review_request 🚨
-        send_review_request(doc_title, owner_name, reviewer_info)
-        
-        # 6. HITL Simulation: Approval/Acknowledgment
-        log_activity("Orchestrator", "HITL Simulation", 
-                     f"Awaiting approval from {approver_info['name']} for {doc_id}. (Simulated: Approved)")
-        
-        # 7. Communication Agent: Trigger staff acknowledgment flow
-        # 🚨 CORRECTION 4: Updated arguments for send_whatsapp_acknowledgement 🚨
-        send_whatsapp_acknowledgement(owner_email, doc_title, "request_sent") 
-        
-        log_activity("Communication Agent", "HITL Input", f"Simulated acknowledgment received from {owner_name} for '{doc_title}'.")
-        send_whatsapp_acknowledgement(owner_email, doc_title, "confirmation") # Confirmation message
-        
-        # 8. Compliance Agent: Log acknowledgment and Update the last_review date
-        acknowledge_staff_read(doc_id, owner_info) # Log the acknowledgment
-        update_document_review_date(doc_id, CURRENT_DATE) # Update date using the current simulation date
-        
-        # 9. Compliance Agent: Final status logging (The audit trail)
-        # 🚨 CORRECTION 5: Use finalize_document_status instead of the removed log_final_approval 🚨
-        finalize_document_status(doc_id, "Active (Renewed)")
-        
-        metrics['docs_renewed'] += 1
+    summarize_expiry_windows()
+    if streaming:
+        # The pipeline triages one document at a time in its own worker threads
+        ignored = [f"{name}={value}" for name, value, default in
+                   [('PROCESS_A_SHARDS', shards, 1), ('TRIAGE_MODE', TRIAGE_MODE, 'serial')] if value != default]
+        if ignored:
+            log_activity("Orchestrator", "Config Warning",
+                         f"Streaming mode ignores {', '.join(ignored)}; use STAGE_CONCURRENCY_TRIAGE to scale triage.")
+        metrics = run_process_a_streaming()
+    else:
+        expiring_docs = get_expiring_documents()
+
+        if shards > 1 and len(expiring_docs) > 1:
+            metrics = run_process_a_sharded(expiring_docs, shards, shard_by)
+        else:
+            # Initialize metrics for the dashboard
+            metrics = {'docs_renewed': 0, 'cp_granted': 0}
+            state = run_state.get_store()
+            for doc in expiring_docs:
+                ctx = process_document(doc) or {}
+                if ctx.get('renewed'):
+                    metrics['docs_renewed'] += 1
+                record_outcome(state, doc, ctx.get('notified', False), ctx.get('renewed', False))
+
+    # In digest mode (COMM_DIGEST=1), send the consolidated per-recipient messages now
+    flush_digests()
 
+    # Incremental runs: persist the outcomes and advance the watermark only once the run completed
+    state = run_state.get_store()
+    if state is not None:
+        state.complete_run(CURRENT_DATE, started_at)
+        log_activity("Orchestrator", "Run State", f"Watermark advanced to {CURRENT_DATE}. Stored state: {state.stats()}")
     log_activity("Orchestrator", "End Process A", "Document Control lifecycle complete for this run.")
     
     return metrics # Return metrics to the main block
 
 
-def run_process_b_credentialing_privileging():
+def complete_cp_case(verification_result):
     """
-    Orchestrator: Manages the consultant credentialing workflow.
+    Carries one verified C&P application through approval or a missing-documents request.
+    Returns 1 if privileges were granted, else 0.
     """
-    log_activity("Orchestrator", "Start Process B", "New C&P application received (Dr. Alice Tan).")
-    
-    # 1. Credential Verification Agent: Check documents
-    verification_result = verify_consultant_credentials()
     applicant = verification_result['applicant']
-    
+
     if verification_result['is_compliant']:
         # 2. Routing Agent: Find final approver
         approver_info = determine_cp_approver()
@@ -129,31 +359,56 @@ def run_process_b_credentialing_privileging():
         # 5. Compliance Agent: Finalize privileges and update metrics
         finalize_cp_privileges(applicant, verification_result['specialty'])
         
-        return {'cp_granted': 1}
+        return 1
 
     else:
-        # Non-compliant: Request missing documents
+        # Non-compliant: Request missing or out-of-date documents
         subject = f"C&P Application Incomplete: {applicant}"
-        body = (f"Dear {applicant}, your C&P application is missing the following documents: "
-                 f"{', '.join(verification_result['missing_docs'])}. Please resubmit.")
+        body = f"Dear {applicant}, your C&P application could not be approved."
+        if verification_result['missing_docs']:
+            body += f" It is missing the following documents: {', '.join(verification_result['missing_docs'])}."
+        if verification_result.get('expiring_docs'):
+            body += (f" The following documents are expired or expire within the policy period and must be renewed: "
+                     f"{', '.join(verification_result['expiring_docs'])}.")
+        body += " Please resubmit."
         log_communication(verification_result['email'], "Email", subject, body)
         log_activity("Orchestrator", "State Update", f"Application PENDING DOCS for {applicant}.")
         
-        return {'cp_granted': 0}
+        return 0
+
+
+@telemetry.timed("Orchestrator")
+def run_process_b_credentialing_privileging(applications=None):
+    """
+    Orchestrator: Manages the consultant credentialing workflow.
+    `applications` may be a directory of application JSON files or a list of dicts;
+    it defaults to CP_APPLICATIONS_DIR, or the single configured application.
+    """
+    source = applications or CP_APPLICATIONS_DIR or [utils.get_consultant_app()]
+    if isinstance(source, list) and len(source) == 1:
+        log_activity("Orchestrator", "Start Process B", f"New C&P application received ({source[0].get('name')}).")
+    else:
+        log_activity("Orchestrator", "Start Process B", f"Bulk C&P verification started ({source if isinstance(source, str) else 'application list'}).")
+
+    # 1. Credential Verification Agent: Check documents (deterministically, LLM only when ambiguous)
+    cp_granted = 0
+    for verification_result in verify_consultant_applications(source):
+        cp_granted += complete_cp_case(verification_result)
+
+    return {'cp_granted': cp_granted}
 
 
 # --- Main Execution Block ---
 if __name__ == "__main__":
     
-    # 1. Clear previous logs for a clean run
-    if os.path.exists(os.path.join('logs', 'activity_log.txt')):
-        os.remove(os.path.join('logs', 'activity_log.txt'))
-    if os.path.exists(os.path.join('logs', 'communications_log.txt')):
-        os.remove(os.path.join('logs', 'communications_log.txt'))
+    # 1. Start clean logs for this run (headers are written here, not at import time)
+    init_logs()
+    log_activity("Orchestrator", "System Init", f"Starting Agentic Workflow on {CURRENT_DATE}.")
 
-    # Re-initialize logs via a utility call to ensure headers are written
-    from src.utils import log_activity as init_log
-    init_log("Orchestrator", "System Init", f"Starting Agentic Workflow on {CURRENT_DATE}.")
+    # With DELIVERY_ENABLED=1, messages are delivered by background senders while the workflows run
+    delivery_service = None
+    if delivery.DELIVERY_ENABLED:
+        delivery_service = delivery.DeliveryService().start()
 
     # --- Execute Workflows ---
     metrics_a = run_process_a_document_control_lifecycle()
@@ -169,4 +424,26 @@ if __name__ == "__main__":
     # 🚨 CORRECTION 7: Pass the final metrics to the dashboard generator 🚨
     generate_dashboard(final_metrics) 
     
-    log_activity("Orchestrator", "System Shutdown", "All workflows executed and dashboard generated. Review logs and outputs folder.")
\ No newline at end of file
+    # Report how many LLM calls were answered from the response cache
+    cache = llm_cache.get_cache()
+    if cache is not None:
+        log_activity("Orchestrator", "LLM Cache", f"Cache stats: {cache.stats()}")
+    log_activity("Orchestrator", "LLM Resilience", f"Retries, rate limiting and circuit breaker (this process): {llm_gateway.resilience_stats()}")
+    log_activity("Orchestrator", "Email Rendering", f"Messages by rendering path (this process): {rendering_stats()}")
+    log_activity("Orchestrator", "Staff Directory", f"Staff lookups by resolution (this process): {utils.get_staff_directory().resolution_stats()}")
+    
+    if delivery_service is not None:
+        counts = delivery_service.drain()
+        opened = delivery_service.pool.connections_opened if delivery_service.pool else 0
+        log_activity("Orchestrator", "Delivery", f"Outbound messages by status: {counts}; SMTP connections opened: {opened}")
+
+    store = registry_store.get_store()
+    if store is not None:
+        log_activity("Orchestrator", "Registry Store", f"Registry changes persisted: {store.stats()}")
+        store.close()
+
+    json_path, prom_path = telemetry.export()
+    log_activity("Orchestrator", "Telemetry", f"Metrics exported to {json_path} and {prom_path}.")
+
+    log_activity("Orchestrator", "System Shutdown", "All workflows executed and dashboard generated. Review logs and outputs folder.")
+    log_writer.shutdown()
\ No newline at end of file
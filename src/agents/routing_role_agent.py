@@ -1,28 +1,166 @@
 # src/agents/routing_role_agent.py (TOP OF FILE)
 
 # --- NEW IMPORTS ---
-from src.utils import get_owner_info, HR_IPSG_LIST, log_activity 
-from google import genai
+from src.utils import get_owner_info, get_staff_directory, get_routing_policy, log_activity, on_reload
+from src import llm_gateway, metrics
+from functools import lru_cache
+import heapq
 import json # To handle Gemini's JSON output
+import os
+import re
 # -------------------
 
+# --- Routing Candidate Configuration ---
+# The LLM only sees the top-k plausible reviewers and approvers (ranked locally by the owner's
+# department, approval role and position) instead of the whole staff list.
+# Set ROUTING_CANDIDATES=0 to send the full staff list as before.
+ROUTING_CANDIDATES = int(os.getenv('ROUTING_CANDIDATES', '15'))
+# Positions the routing policy names as reviewers/approvers
+SENIOR_POSITIONS = ('Chief of Medical Staff', 'QMR')
+
+# --- Compiled Routing Table ---
+
+def compile_routing_table(policy):
+    """
+    Compiles the routing policy config into (title patterns, rules). Each rule may match on
+    'doc_type' and/or 'owner_role'; 'reviewer'/'approver' are staff emails or 'owner'.
+    """
+    title_patterns = [
+        (doc_type, re.compile(pattern, re.IGNORECASE))
+        for doc_type, pattern in policy.get('title_patterns', {}).items()
+    ]
+    rules = [
+        (rule.get('name', f"rule_{i}"), rule.get('doc_type'), rule.get('owner_role'), rule['reviewer'], rule['approver'])
+        for i, rule in enumerate(policy.get('rules', []))
+    ]
+    return title_patterns, rules
+
+@lru_cache(maxsize=None)
+def get_routing_table():
+    """Compiles the routing policy on first use."""
+    return compile_routing_table(get_routing_policy())
+
+
+def infer_doc_type(doc_title):
+    """Infers the document type from its title when the registry type is not supplied."""
+    title_patterns, _ = get_routing_table()
+    for doc_type, pattern in title_patterns:
+        if pattern.search(doc_title):
+            return doc_type
+    return None
+
+
+@lru_cache(maxsize=None)
+def lookup_route(doc_type, owner_role):
+    """Memoized table lookup: returns (rule_name, reviewer_spec, approver_spec) or None."""
+    _, routing_rules = get_routing_table()
+    for name, rule_type, rule_role, reviewer, approver in routing_rules:
+        if rule_type is not None and rule_type != doc_type:
+            continue
+        if rule_role is not None and rule_role != owner_role:
+            continue
+        return name, reviewer, approver
+    return None
+
+
+# A reload may bring a different routing policy
+on_reload(get_routing_table.cache_clear)
+on_reload(lookup_route.cache_clear)
+
+
+def resolve_route_email(spec, owner_email):
+    """Turns a reviewer/approver spec into an email ('owner' means the document owner)."""
+    return owner_email if spec == 'owner' else spec
+
 def get_staff_names():
-    """Helper to get a list of staff names and roles for the LLM to use."""
-    staff_list = []
-    for email, info in HR_IPSG_LIST.items():
-        # Use 'name' and 'position' keys
-        staff_list.append(f"{info['name']} ({info['position']}), Email: {email}") 
-    return "\n".join(staff_list)
-
-def determine_reviewers_and_approvers(doc_title, owner_role):
+    """Helper to get a list of staff names and roles for the LLM to use (rendered once per HR list load)."""
+    return get_staff_directory().staff_context()
+
+
+def reviewer_score(record, department):
+    return ((2 if record.approval_role in ('Reviewer', 'Approver') else 0)
+            + (2 if department is not None and record.department == department else 0)
+            + (1 if record.position in SENIOR_POSITIONS else 0))
+
+
+def approver_score(record, department):
+    return ((3 if record.approval_role == 'Approver' else 0)
+            + (2 if record.position in SENIOR_POSITIONS else 0)
+            + (1 if department is not None and record.department == department else 0))
+
+
+@lru_cache(maxsize=None)
+def ranked_candidates(department, k):
+    """
+    Top-k reviewer and approver candidates for documents owned in `department`, drawn from
+    the directory indexes rather than a scan of every staff member. Memoized per department.
+    """
+    directory = get_staff_directory()
+    pool = {}
+    # Pool order breaks score ties: same department first, then approvers, senior staff, reviewers
+    for group in ([directory.by_department(department)] + [directory.by_approval_role('Approver')]
+                  + [directory.by_position(position) for position in SENIOR_POSITIONS]
+                  + [directory.by_approval_role('Reviewer')]):
+        for record in group:
+            pool.setdefault(record.email, record)
+
+    def top(score):
+        scored = [(score(record, department), -order, record) for order, record in enumerate(pool.values())]
+        return tuple(record for value, _, record in heapq.nlargest(k, scored, key=lambda item: item[:2]) if value > 0)
+
+    return top(reviewer_score), top(approver_score)
+
+
+# Candidates are derived from the HR list
+on_reload(ranked_candidates.cache_clear)
+
+
+def select_routing_candidates(owner_email, k=None):
     """
-    Routing Agent: Uses Gemini to dynamically determine the best Reviewer and Approver 
-    based on the document and owner's role, adhering to a defined policy.
+    Returns (reviewer candidates, approver candidates) as staff records for one document.
+    The owner is always a reviewer candidate, since WI/Form owners review their own documents.
     """
+    k = k or ROUTING_CANDIDATES
+    owner = get_staff_directory().get(owner_email) if owner_email else None
+    reviewers, approvers = ranked_candidates(owner.department if owner is not None else None, k)
+    if owner is not None:
+        reviewers = ((owner,) + tuple(record for record in reviewers if record.email != owner.email))[:k]
+    return reviewers, approvers
+
+
+def render_candidates(records):
+    return "\n".join(
+        f"    - {record.name} ({record.position}, {record.department}, {record.approval_role}), Email: {record.email}"
+        for record in records)
+
+@metrics.timed("Routing & Role Agent")
+def determine_reviewers_and_approvers(doc_title, owner_role, doc_type=None, owner_email=None):
+    """
+    Routing Agent: Resolves the Reviewer and Approver from the compiled routing table,
+    and only uses Gemini to determine them when no routing rule matches the document.
+    """
+    # 0. Table-driven fast path (memoized per doc type and owner role)
+    route = lookup_route(doc_type or infer_doc_type(doc_title), owner_role)
+    if route is not None and (owner_email or 'owner' not in route[1:]):
+        rule_name, reviewer_spec, approver_spec = route
+        reviewer_info = get_owner_info(resolve_route_email(reviewer_spec, owner_email))
+        approver_info = get_owner_info(resolve_route_email(approver_spec, owner_email))
+        log_activity("Routing & Role Agent", "Rule Routing Complete",
+                     f"Rule '{rule_name}' for {doc_title}: Reviewer set to {reviewer_info['name']} | Approver set to {approver_info['name']}")
+        return reviewer_info, approver_info
+
     log_activity("Routing & Role Agent", "AI Routing Start", f"Using LLM for route determination for: {doc_title}")
     
-    # 1. Prepare Staff and Rules Context
-    staff_context = get_staff_names()
+    # 1. Prepare Staff and Rules Context: only locally pre-selected candidates, unless disabled
+    if ROUTING_CANDIDATES > 0:
+        reviewer_candidates, approver_candidates = select_routing_candidates(owner_email)
+        staff_context = (f"CANDIDATE REVIEWERS (choose the reviewer from this list):\n{render_candidates(reviewer_candidates)}\n\n"
+                         f"    CANDIDATE APPROVERS (choose the approver from this list):\n{render_candidates(approver_candidates)}")
+        allowed_reviewers = {record.email for record in reviewer_candidates}
+        allowed_approvers = {record.email for record in approver_candidates}
+    else:
+        staff_context = get_staff_names()
+        allowed_reviewers = allowed_approvers = None
     
     # Define the policy rules for the LLM
     policy_rules = """
@@ -47,6 +185,7 @@ def determine_reviewers_and_approvers(doc_title, owner_role):
     prompt = f"""
     You are a professional Document Control Routing AI. Your task is to select the most appropriate Reviewer and Approver 
     from the STAFF LIST based on the DOCUMENT DETAILS and the ROUTING POLICY RULES.
+    The reviewer and approver emails must be copied exactly from the STAFF LIST.
 
     DOCUMENT DETAILS:
     - Document Title: {doc_title}
@@ -67,11 +206,10 @@ def determine_reviewers_and_approvers(doc_title, owner_role):
     
     # 3. Call Gemini (Update this section)
     try:
-        client = genai.Client()
-    
         # Use the structured output feature
-        response = client.models.generate_content(
+        response = llm_gateway.generate_content(
             model='gemini-2.5-pro', # Or gemini-2.5-pro for better fidelity
+            agent="Routing & Role Agent",
             contents=prompt,
             config={
                 "response_mime_type": "application/json", # Enforce JSON output
@@ -85,6 +223,18 @@ def determine_reviewers_and_approvers(doc_title, owner_role):
         reviewer_email = route_data.get('reviewer_email', 'qmr@phmk.my') # Default fallback
         approver_email = route_data.get('approver_email', 'qmr@phmk.my') # Default fallback
 
+        # Only accept emails from the candidate lists; otherwise use the top-ranked candidate
+        if allowed_reviewers is not None and reviewer_email not in allowed_reviewers and reviewer_candidates:
+            log_activity("Routing & Role Agent", "AI Routing Invalid",
+                         f"Reviewer {reviewer_email} is not a candidate for {doc_title}. Using {reviewer_candidates[0].email}.")
+            metrics.record_fallback("Routing & Role Agent")
+            reviewer_email = reviewer_candidates[0].email
+        if allowed_approvers is not None and approver_email not in allowed_approvers and approver_candidates:
+            log_activity("Routing & Role Agent", "AI Routing Invalid",
+                         f"Approver {approver_email} is not a candidate for {doc_title}. Using {approver_candidates[0].email}.")
+            metrics.record_fallback("Routing & Role Agent")
+            approver_email = approver_candidates[0].email
+
         # Use the imported get_owner_info from utils.py
         reviewer_info = get_owner_info(reviewer_email)
         approver_info = get_owner_info(approver_email)
@@ -95,24 +245,28 @@ def determine_reviewers_and_approvers(doc_title, owner_role):
 
     except Exception as e:
         log_activity("Routing & Role Agent", "AI Routing ERROR", f"LLM routing failed. Falling back to default QMR route. Error: {e}")
+        metrics.record_fallback("Routing & Role Agent")
         # Fallback to a safe, default route (QMR for both)
         qmr_info = get_owner_info('qmr@phmk.my')
         return qmr_info, qmr_info
 
+@metrics.timed("Routing & Role Agent")
 def determine_cp_approver():
     """Determines the final C&P Approver (Chief Medical Officer/QMR equivalent)."""
     
     approver_role = 'Approver' 
     
-    for email, info in HR_IPSG_LIST.items():
-        if info.get('approval_role') == approver_role: # Use 'approval_role'
-             log_activity("Routing & Role Agent", "C&P Approver Found", 
-                         f"Approver set to {info['name']}") # Use 'name'
-             return {
-                 'name': info['name'],
-                 'email': email,
-                 'role': info['approval_role'] # Use 'approval_role'
-             }
+    # Index lookup on approval_role; the first Approver in HR list order wins
+    approvers = get_staff_directory().by_approval_role(approver_role)
+    if approvers:
+        approver = approvers[0]
+        log_activity("Routing & Role Agent", "C&P Approver Found", 
+                     f"Approver set to {approver.name}")
+        return {
+            'name': approver.name,
+            'email': approver.email,
+            'role': approver.approval_role
+        }
     
     log_activity("Routing & Role Agent", "C&P Approver Error", "No C&P Approver found in HR list.")
     return None
\ No newline at end of file
@@ -0,0 +1,125 @@
+# src/credential_matcher.py
+
+import re
+
+# A year, optionally followed by month and day ("2025", "2025 06 30", "20250630") once the
+# filename has been normalized
+DATE_PATTERN = r"(?:^|\s)(?P<year>(?:19|20)\d{2})(?:\s?(?P<month>\d{2})\s?(?P<day>\d{2}))?(?:\s|$)"
+
+EVIDENCE_COLUMNS = ['app', 'file', 'category', 'valid_until', 'days_remaining', 'status']
+
+
+def normalize_doc_name(name):
+    """'APC_2025.pdf' -> 'apc 2025'; 'C&P Form' -> 'c&p form'."""
+    stem = re.sub(r"\.[A-Za-z0-9]{2,4}$", "", str(name))
+    return re.sub(r"[\s_\-]+", " ", stem).strip().lower()
+
+
+class CredentialMatcher:
+    """
+    Maps submitted filenames to required-document categories and validity dates.
+
+    Built once from the policy rules: every category name and alias is normalized and
+    compiled into a single anchored regex, so a whole batch of filenames is classified
+    with one vectorized pass. A filename dated with a bare year ("BLS_2024.pdf") is valid
+    through 31 December of year + validity_years - 1 for its category (default 1); a full
+    date ("APC_2025-06-30.pdf") is read as the expiry date itself. Undated files never expire.
+    """
+
+    def __init__(self, required_docs, aliases=None, validity_years=None, expiry_threshold_days=0):
+        self.required_docs = list(required_docs)
+        self.validity_years = dict(validity_years or {})
+        self.expiry_threshold_days = int(expiry_threshold_days or 0)
+
+        self._categories = {}
+        for category in self.required_docs:
+            for name in [category] + list((aliases or {}).get(category, [])):
+                self._categories.setdefault(normalize_doc_name(name), category)
+
+        # Longest names first, so an alias that extends another one wins
+        alternation = "|".join(re.escape(name) for name in sorted(self._categories, key=len, reverse=True))
+        self._pattern = re.compile(f"^(?P<name>{alternation})(?:\\s|$)") if alternation else None
+
+    @classmethod
+    def from_policy(cls, policy_rules):
+        return cls(
+            policy_rules.get('required_docs', []),
+            aliases=policy_rules.get('aliases'),
+            validity_years=policy_rules.get('validity_years'),
+            expiry_threshold_days=policy_rules.get('expiry_threshold_days', 0),
+        )
+
+    def evidence_table(self, applications, as_of):
+        """
+        One row per submitted file across all `applications`: the application's position,
+        the file, its category (None if unmatched), the validity date, days remaining at
+        `as_of`, and a status of 'valid', 'no_expiry', 'expiring' (within the policy
+        threshold), 'expired' or 'unmatched'.
+        """
+        # Imported here so importing the agents stays cheap (see the lazy startup in src/utils.py)
+        import numpy as np
+        import pandas as pd
+
+        files = pd.DataFrame(
+            [(i, doc) for i, app in enumerate(applications) for doc in app.get('submitted_docs', [])],
+            columns=['app', 'file']
+        )
+        if files.empty:
+            return pd.DataFrame(columns=EVIDENCE_COLUMNS)
+
+        normalized = files['file'].map(normalize_doc_name)
+        if self._pattern is not None:
+            names = normalized.str.extract(self._pattern)['name']
+        else:
+            names = pd.Series(np.nan, index=files.index, dtype=object)
+        files['category'] = names.map(self._categories)
+
+        # Validity: an explicit date wins, otherwise the end of the covered year(s)
+        dates = normalized.str.extract(DATE_PATTERN)
+        span = files['category'].map(self.validity_years).fillna(1)
+        end_year = pd.to_numeric(dates['year'], errors='coerce') + span - 1
+        year_end = pd.to_datetime(pd.DataFrame({'year': end_year, 'month': 12, 'day': 31}), errors='coerce')
+        explicit = pd.to_datetime(dates['year'] + '-' + dates['month'] + '-' + dates['day'],
+                                  format='%Y-%m-%d', errors='coerce')
+        files['valid_until'] = explicit.fillna(year_end).dt.date
+
+        days_remaining = (explicit.fillna(year_end) - pd.Timestamp(as_of)).dt.days
+        files['status'] = np.select(
+            [files['category'].isna(), days_remaining.isna(), days_remaining < 0,
+             days_remaining < self.expiry_threshold_days],
+            ['unmatched', 'no_expiry', 'expired', 'expiring'],
+            default='valid'
+        )
+        files['category'] = files['category'].astype(object).where(files['category'].notna(), None)
+        files['valid_until'] = files['valid_until'].astype(object).where(files['valid_until'].notna(), None)
+        files['days_remaining'] = days_remaining.astype('Int64').astype(object).where(days_remaining.notna(), None)
+        return files[EVIDENCE_COLUMNS]
+
+    def assess(self, applications, as_of):
+        """
+        Checks each application against the required categories. Returns one dict per
+        application with 'missing_docs' (no file for the category), 'expiring_docs' (only
+        expired files, or files inside the expiry threshold), 'unmatched_docs' and the
+        application's 'evidence' rows.
+        """
+        table = self.evidence_table(applications, as_of)
+        matched = table[table['category'].notna()]
+        present = set(zip(matched['app'], matched['category']))
+        usable = matched[matched['status'].isin(['valid', 'no_expiry'])]
+        valid = set(zip(usable['app'], usable['category']))
+
+        # One conversion for the whole batch, then bucket the rows per application
+        evidence = {}
+        for row in table.to_dict('records'):
+            evidence.setdefault(row.pop('app'), []).append(row)
+
+        results = []
+        for i in range(len(applications)):
+            rows = evidence.get(i, [])
+            results.append({
+                'missing_docs': [doc for doc in self.required_docs if (i, doc) not in present],
+                'expiring_docs': [doc for doc in self.required_docs if (i, doc) in present and (i, doc) not in valid],
+                'unmatched_docs': [row['file'] for row in rows if row['status'] == 'unmatched'],
+                'evidence': rows,
+            })
+        return results
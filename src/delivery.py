@@ -0,0 +1,327 @@
+# src/delivery.py
+
+import os
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.message import EmailMessage
+
+from src.rate_limit import TokenBucket
+from src.utils import log_activity
+
+# --- Delivery Configuration ---
+# With DELIVERY_ENABLED=1, every logged communication is also queued for real delivery.
+# Emails go out over SMTP (point SMTP_HOST/SMTP_PORT at a local stand-in such as
+# `python -m aiosmtpd -n -l localhost:8025` for testing).
+DELIVERY_ENABLED = os.getenv('DELIVERY_ENABLED', '0').lower() in ('1', 'true', 'yes')
+DELIVERY_QUEUE_PATH = os.getenv('DELIVERY_QUEUE_PATH', os.path.join('logs', 'outbound.sqlite'))
+SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '8025'))
+SMTP_SENDER = os.getenv('SMTP_SENDER', 'document-control@phmk.my')
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '10'))
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '4'))             # connections, and sender threads
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '5'))
+DELIVERY_BACKOFF_SECONDS = float(os.getenv('DELIVERY_BACKOFF_SECONDS', '1.0'))  # doubles per attempt
+DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', '50'))
+
+# Messages per second allowed on each channel (0 = unlimited), e.g. DELIVERY_RATE_EMAIL=20
+DELIVERY_RATES = {
+    channel: float(os.getenv(f"DELIVERY_RATE_{channel.upper()}", default))
+    for channel, default in [('email', '50'), ('whatsapp', '10')]
+}
+
+
+def channel_for(comm_type):
+    """Maps a communication log type ('Email (C&P)', 'WhatsApp (Digest)', ...) to its delivery channel."""
+    return comm_type.split(' ')[0].lower()
+
+
+class OutboundQueue:
+    """
+    Persistent outbound message queue in SQLite. Each message records its delivery
+    status ('queued', 'sending', 'sent', 'failed' or 'skipped'), attempts and last
+    error, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DELIVERY_QUEUE_PATH
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Shard worker processes enqueue into the same file, so wait on locks rather than fail
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, recipient TEXT, subject TEXT, body TEXT,"
+            " status TEXT, attempts INTEGER, next_attempt_at REAL, last_error TEXT,"
+            " created_at REAL, updated_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_due ON messages (status, next_attempt_at)")
+        self._conn.commit()
+
+    def enqueue(self, channel, recipient, subject, body):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (channel, recipient, subject, body, status, attempts, next_attempt_at,"
+                " last_error, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', 0, ?, NULL, ?, ?)",
+                (channel, recipient, subject, body, now, now, now)
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def claim(self, limit):
+        """Marks up to `limit` due messages as 'sending' and returns them as dicts."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, channel, recipient, subject, body, attempts FROM messages"
+                " WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE messages SET status = 'sending', updated_at = ? WHERE id = ?", [(now, row[0]) for row in rows]
+            )
+            self._conn.commit()
+        keys = ('id', 'channel', 'recipient', 'subject', 'body', 'attempts')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def mark_sent(self, message_id):
+        self._set(message_id, "status = 'sent', attempts = attempts + 1, last_error = NULL", ())
+
+    def mark_retry(self, message_id, error, delay):
+        self._set(message_id, "status = 'queued', attempts = attempts + 1, last_error = ?, next_attempt_at = ?",
+                  (str(error), time.time() + delay))
+
+    def mark_failed(self, message_id, error):
+        self._set(message_id, "status = 'failed', attempts = attempts + 1, last_error = ?", (str(error),))
+
+    def mark_skipped(self, message_id, reason):
+        self._set(message_id, "status = 'skipped', last_error = ?", (reason,))
+
+    def _set(self, message_id, assignments, params):
+        with self._lock:
+            self._conn.execute(f"UPDATE messages SET {assignments}, updated_at = ? WHERE id = ?",
+                               (*params, time.time(), message_id))
+            self._conn.commit()
+
+    def requeue(self, message_id, delay=0.0):
+        """Returns one claimed message to the queue, due after `delay` seconds, without counting an attempt."""
+        self._set(message_id, "status = 'queued', next_attempt_at = ?", (time.time() + delay,))
+
+    def requeue_interrupted(self):
+        """Returns messages left 'sending' by a crashed run to the queue."""
+        with self._lock:
+            count = self._conn.execute("UPDATE messages SET status = 'queued' WHERE status = 'sending'").rowcount
+            self._conn.commit()
+        return count
+
+    def status(self, message_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, attempts, last_error FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+        return dict(zip(('status', 'attempts', 'last_error'), row)) if row else None
+
+    def counts(self):
+        """Number of messages per delivery status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall()
+        return dict(rows)
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE status IN ('queued', 'sending')"
+            ).fetchone()[0]
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` open SMTP connections and hands them out to sender threads, so
+    thousands of messages reuse a handful of connections. A connection that fails is
+    closed and replaced on the next checkout.
+    """
+
+    def __init__(self, host=None, port=None, size=None, timeout=None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.timeout = timeout or SMTP_TIMEOUT
+        self.size = size or SMTP_POOL_SIZE
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            except Exception:
+                try:
+                    connection.close()
+                finally:
+                    connection = None
+                raise
+            finally:
+                if connection is not None:
+                    self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                connection.quit()
+            except Exception:
+                connection.close()
+
+
+def smtp_transport(pool):
+    """Sends an email message dict over a pooled SMTP connection."""
+    def send(message):
+        email = EmailMessage()
+        email['From'] = SMTP_SENDER
+        email['To'] = message['recipient']
+        email['Subject'] = message['subject']
+        email.set_content(message['body'])
+        with pool.connection() as connection:
+            connection.send_message(email)
+    return send
+
+
+class DeliveryService:
+    """
+    Sender threads that drain the outbound queue: each message is rate limited per
+    channel, sent through its channel's transport, and retried with exponential backoff
+    until DELIVERY_MAX_ATTEMPTS is reached. Messages for channels without a transport
+    (WhatsApp, by default) are marked skipped so nothing waits on them forever.
+    """
+
+    def __init__(self, outbound=None, transports=None, rates=None, workers=None):
+        self.outbound = outbound or OutboundQueue()
+        self.pool = None
+        if transports is None:
+            self.pool = SMTPConnectionPool()
+            transports = {'email': smtp_transport(self.pool)}
+        self.transports = transports
+        self.buckets = {channel: TokenBucket(rate) for channel, rate in (rates or DELIVERY_RATES).items()}
+        self.workers = workers or SMTP_POOL_SIZE
+        self._claimed = queue.Queue(maxsize=self.workers * 2)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return self
+        self.outbound.requeue_interrupted()
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._claim_loop, name='delivery-claim', daemon=True)]
+        self._threads += [threading.Thread(target=self._send_loop, name=f"delivery-send-{n}", daemon=True)
+                          for n in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _claim_loop(self):
+        # One thread claims due messages in batches and feeds the senders
+        while not self._stop.is_set():
+            try:
+                batch = self.outbound.claim(DELIVERY_BATCH_SIZE)
+            except Exception as e:
+                log_activity("Delivery", "Queue Error", f"Could not claim outbound messages. Error: {e}")
+                batch = []
+            if not batch:
+                time.sleep(0.05)
+                continue
+            for message in batch:
+                self._claimed.put(message)
+        for _ in range(self.workers):
+            self._claimed.put(None)
+
+    def _send_loop(self):
+        while True:
+            message = self._claimed.get()
+            if message is None:
+                return
+            try:
+                self.deliver(message)
+            except Exception as e:
+                # Keep the thread alive (stop() waits for it) and give the message back to the queue
+                log_activity("Delivery", "Queue Error", f"Could not record delivery of message {message['id']}. Error: {e}")
+                try:
+                    self.outbound.requeue(message['id'], DELIVERY_BACKOFF_SECONDS)
+                except Exception:
+                    pass  # Left 'sending'; requeue_interrupted() picks it up on the next start
+
+    def deliver(self, message):
+        """Sends one claimed message and records the outcome."""
+        channel = message['channel']
+        transport = self.transports.get(channel)
+        if transport is None:
+            self.outbound.mark_skipped(message['id'], f"no transport configured for channel '{channel}'")
+            return
+        if channel in self.buckets:
+            self.buckets[channel].acquire()
+        try:
+            transport(message)
+        except Exception as e:
+            attempts = message['attempts'] + 1
+            if attempts >= DELIVERY_MAX_ATTEMPTS:
+                self.outbound.mark_failed(message['id'], e)
+                log_activity("Delivery", "Failed", f"{channel} to {message['recipient']} failed after {attempts} attempts. Error: {e}")
+            else:
+                self.outbound.mark_retry(message['id'], e, DELIVERY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+            return
+        self.outbound.mark_sent(message['id'])
+
+    def drain(self, timeout=60):
+        """Waits until no message is queued or sending (or `timeout` seconds), then stops the threads."""
+        deadline = time.monotonic() + timeout
+        while self.outbound.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.stop()
+        return self.outbound.counts()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.pool is not None:
+            self.pool.close()
+
+
+_outbound = None
+_outbound_lock = threading.Lock()
+
+
+def get_outbound_queue():
+    global _outbound
+    if _outbound is None:
+        with _outbound_lock:
+            if _outbound is None:
+                _outbound = OutboundQueue()
+    return _outbound
+
+
+def enqueue(recipient, comm_type, subject, body):
+    """Queues a communication for delivery; returns the message id."""
+    return get_outbound_queue().enqueue(channel_for(comm_type), recipient, subject, body)
@@ -0,0 +1,169 @@
+# src/llm_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Cache Configuration ---
+# Responses are stored in SQLite keyed by a hash of model + prompt + response schema,
+# so a repeat run over an unchanged registry is answered locally.
+LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', 'logs')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+LLM_CACHE_BYPASS = os.getenv('LLM_CACHE_BYPASS', '0').lower() in ('1', 'true', 'yes')
+# The table size is only counted (and trimmed back to LLM_CACHE_MAX_ENTRIES) every this many puts
+LLM_CACHE_EVICT_EVERY = int(os.getenv('LLM_CACHE_EVICT_EVERY', '100'))
+
+DAY = 24 * 60 * 60
+
+# Time-to-live per agent, in seconds. An agent with a TTL of 0 is never cached.
+LLM_CACHE_TTLS = {
+    'AI Review Agent': 7 * DAY,               # Amendment suggestions per title change slowly
+    'Routing & Role Agent': 7 * DAY,          # Same (title, owner role) routes the same way
+    'Credential Verification Agent': 1 * DAY, # Re-check applications daily
+    'Document Expiry Agent': 1 * DAY,         # Days-to-expiry is part of the prompt anyway
+    'Communication Agent': 1 * DAY,
+    'Compliance Agent': 0,                    # Dashboard summarises a fresh log every run
+}
+DEFAULT_TTL = 1 * DAY
+
+
+def make_cache_key(model, contents, config=None):
+    """Content-addressed key: SHA-256 over the model name, prompt and response schema."""
+    schema = (config or {}).get('response_schema')
+    payload = json.dumps([model, contents, schema], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(response_text, config=None):
+    """
+    False for responses that should not be cached: empty ones, and ones that were asked
+    for as JSON but do not parse (the agent falls back on them, so caching would repeat
+    the fallback for the whole TTL).
+    """
+    if not response_text:
+        return False
+    if (config or {}).get('response_mime_type') != 'application/json':
+        return True
+    try:
+        json.loads(response_text)
+    except ValueError:
+        return False
+    return True
+
+
+class LLMResponseCache:
+    """SQLite-backed response cache with per-agent TTLs and size-bounded LRU eviction."""
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or os.path.join(LLM_CACHE_DIR, 'llm_cache.sqlite')
+        self.max_entries = max_entries or LLM_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Other processes may use the same file, so wait on locks rather than fail
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, agent TEXT, response_text TEXT,"
+            " created_at REAL, expires_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached response text, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_text, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response_text, agent=None, ttl=None):
+        """
+        Stores a response. Every LLM_CACHE_EVICT_EVERY puts the least recently used
+        entries beyond max_entries are evicted, so the table may briefly overshoot.
+        """
+        ttl = ttl_for(agent) if ttl is None else ttl
+        if ttl <= 0 or response_text is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, response_text, now, now + ttl, now)
+            )
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= LLM_CACHE_EVICT_EVERY:
+                self._puts_since_evict = 0
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current number of stored entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': entries,
+        }
+
+
+def ttl_for(agent):
+    return LLM_CACHE_TTLS.get(agent, DEFAULT_TTL)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide cache, or None when caching is bypassed."""
+    global _cache
+    if LLM_CACHE_BYPASS:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
+
+
+def set_cache(cache):
+    """Installs a cache instance (e.g. one pointing at a temporary file). Pass None to reset."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
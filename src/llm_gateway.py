@@ -0,0 +1,546 @@
+# src/llm_gateway.py
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from src import llm_cache, metrics
+from src.rate_limit import TokenBucket
+from src.utils import log_activity
+
+# --- Gateway Configuration ---
+# One Gemini client is shared by every agent in the process. The underlying
+# httpx connection pool keeps TLS connections alive between documents, so only
+# the first call of a run pays the connection setup cost.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')  # 'gemini' or 'stub'
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+LLM_KEEPALIVE_SECONDS = float(os.getenv('LLM_KEEPALIVE_SECONDS', '60'))
+
+# --- Resilience Configuration ---
+# Calls are paced per model by request (RPM) and token (TPM) buckets, transient errors
+# (429, 5xx, timeouts) are retried with exponential backoff, and a per-model circuit
+# breaker fails fast to the agents' fallbacks once the service is clearly down.
+# Published quotas per model as (RPM, TPM); LLM_RPM / LLM_TPM override them for every model.
+MODEL_RATE_LIMITS = {
+    'gemini-2.5-pro': (150, 2_000_000),
+    'gemini-2.5-flash': (1000, 1_000_000),
+}
+DEFAULT_RATE_LIMIT = (60, 1_000_000)
+LLM_RPM = os.getenv('LLM_RPM')
+LLM_TPM = os.getenv('LLM_TPM')
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '1.0'))   # seconds, doubled per retry
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '30'))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))      # consecutive failed calls
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '60'))
+# Rough prompt size estimate used for the TPM bucket before the real usage is known
+CHARS_PER_TOKEN = 4
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_client = None
+_backend = None
+_lock = threading.Lock()
+
+
+class LLMResponse:
+    """Minimal response object exposing the same `.text` attribute as a Gemini response."""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class LLMServiceError(Exception):
+    """An error from the LLM service carrying its HTTP status code (e.g. 429 when quota is exhausted)."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the service while a model's circuit breaker is open."""
+
+
+class StubBackend:
+    """
+    Local stand-in for the Gemini API. Returns a fixed reply for plain prompts and a
+    minimal object that satisfies the response schema for structured prompts, so the
+    whole workflow can run without network access or an API key.
+
+    `latency` (seconds) and `failure_rate` (fraction of calls answered with a 429) make
+    it a fake for exercising rate limiting, retries and the circuit breaker; they default
+    to LLM_STUB_LATENCY and LLM_STUB_FAILURE_RATE.
+    """
+
+    # The stub has no quota, so it is not paced unless asked to be
+    rate_limited = False
+
+    def __init__(self, reply="Stub response: no LLM backend configured.", responder=None,
+                 latency=None, failure_rate=None, seed=None, rate_limited=False):
+        self.reply = reply
+        self.responder = responder  # Optional callable(model, contents, config) -> str
+        self.latency = float(os.getenv('LLM_STUB_LATENCY', '0') if latency is None else latency)
+        self.failure_rate = float(os.getenv('LLM_STUB_FAILURE_RATE', '0') if failure_rate is None else failure_rate)
+        self.rate_limited = rate_limited
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._stats_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Shipped to shard worker processes, which need their own lock
+        state = self.__dict__.copy()
+        del state['_stats_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def _simulate_service(self):
+        with self._stats_lock:
+            self.calls += 1
+            fail = self.failure_rate > 0 and self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if fail:
+            raise LLMServiceError("429 RESOURCE_EXHAUSTED (simulated by the stub backend)", code=429)
+
+    def generate_content(self, model, contents, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self._simulate_service()
+        return self._respond(model, contents, config)
+
+    async def generate_content_async(self, model, contents, config=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._simulate_service()
+        return self._respond(model, contents, config)
+
+    def _respond(self, model, contents, config):
+        if self.responder is not None:
+            return LLMResponse(self.responder(model, contents, config))
+
+        schema = (config or {}).get('response_schema')
+        text = json.dumps(stub_value_for_schema(schema, contents=contents)) if schema else self.reply
+        # Estimated usage, so token telemetry is populated in offline runs too
+        return LLMResponse(text, usage_metadata={'prompt_token_count': estimate_tokens(contents),
+                                                 'candidates_token_count': estimate_tokens(text)})
+
+
+def stub_value_for_schema(schema, name='', contents=None):
+    """
+    Builds the simplest value that satisfies a JSON response schema. A top-level array
+    gets one item per "doc_id: ..." line in the prompt (e.g. a batch triage request),
+    with the item's doc_id filled in, so batched calls are answered in one round trip.
+    """
+    schema_type = schema.get('type')
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'object':
+        return {key: stub_value_for_schema(prop, key) for key, prop in schema.get('properties', {}).items()}
+    if schema_type == 'array':
+        items = []
+        for doc_id in re.findall(r"doc_id: (\S+)", str(contents or '')):
+            item = stub_value_for_schema(schema.get('items', {}), name)
+            if isinstance(item, dict) and 'doc_id' in item:
+                item['doc_id'] = doc_id
+            items.append(item)
+        return items
+    if schema_type == 'boolean':
+        return False
+    if schema_type in ('integer', 'number'):
+        return 0
+    return f"stub {name}".strip()
+
+
+class GeminiBackend:
+    """Wraps a single pooled `genai.Client` shared across all agents."""
+
+    rate_limited = True
+
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_content_async(self, model, contents, config=None):
+        return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+
+def get_client():
+    """Returns the process-wide Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        # Deferred so that importing the agents does not pay for the SDK import
+        from google import genai
+        import httpx
+
+        with _lock:
+            if _client is None:
+                limits = httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+                )
+                _client = genai.Client(
+                    http_options={
+                        'client_args': {'limits': limits},
+                        'async_client_args': {'limits': limits},
+                    }
+                )
+    return _client
+
+
+def get_backend():
+    """Returns the active backend, selecting it from LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        backend = StubBackend() if LLM_BACKEND == 'stub' else GeminiBackend(get_client())
+        with _lock:
+            if _backend is None:
+                _backend = backend
+    return _backend
+
+
+def current_backend():
+    """Returns the installed backend without creating one (None if no call has been made yet)."""
+    return _backend
+
+
+def set_backend(backend):
+    """Installs a backend (e.g. a StubBackend) for every subsequent LLM call. Pass None to reset."""
+    global _backend
+    with _lock:
+        _backend = backend
+
+
+# --- Rate Limiting, Retries and Circuit Breaking ---
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls; while open every call is rejected
+    immediately. After `reset_seconds` a single trial call is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=None, reset_seconds=None):
+        self.threshold = threshold or LLM_BREAKER_THRESHOLD
+        self.reset_seconds = LLM_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def abandon(self):
+        """Releases a half-open trial whose call was cancelled before it could succeed or fail."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class ModelGuard:
+    """
+    Request and token buckets plus a circuit breaker for one model. The request rate adapts:
+    every 429 halves it (down to 10% of the configured RPM), and each success wins back 5%.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        rpm, tpm = MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+        rpm = float(LLM_RPM) if LLM_RPM else rpm
+        tpm = float(LLM_TPM) if LLM_TPM else tpm
+        # Burst capacity of a few seconds' worth, so a run does not start with a full minute's quota at once
+        self.requests = TokenBucket(rpm / 60.0, capacity=max(1.0, rpm / 60.0 * 5))
+        self.tokens = TokenBucket(tpm / 60.0, capacity=max(1.0, tpm / 60.0 * 5))
+        self.breaker = CircuitBreaker()
+        self.configured_rate = rpm / 60.0
+
+    def throttle(self):
+        self.requests.set_rate(max(self.configured_rate * 0.1, self.requests.rate / 2))
+
+    def recover(self):
+        if self.requests.rate < self.configured_rate:
+            self.requests.set_rate(min(self.configured_rate, self.requests.rate + self.configured_rate * 0.05))
+
+    def wait_time(self, estimated_tokens):
+        """Seconds until both buckets admit this call (0.0 means admitted, tokens taken)."""
+        delay = self.requests.try_acquire()
+        if delay > 0:
+            return delay
+        delay = self.tokens.try_acquire(estimated_tokens)
+        if delay > 0:
+            # Give the request token back so a token-bound wait does not also burn request quota
+            self.requests.release()
+        return delay
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+RESILIENCE_STATS = {'retries': 0, 'rate_limit_wait_s': 0.0, 'short_circuits': 0, 'transient_errors': 0}
+_stats_lock = threading.Lock()
+
+
+def get_guard(model):
+    guard = _guards.get(model)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.setdefault(model, ModelGuard(model))
+    return guard
+
+
+def reset_guards():
+    """Forgets all rate limiter and breaker state (e.g. after changing the limits)."""
+    with _guards_lock:
+        _guards.clear()
+
+
+def count(stat, amount=1):
+    with _stats_lock:
+        RESILIENCE_STATS[stat] += amount
+
+
+def resilience_stats():
+    with _stats_lock:
+        stats = dict(RESILIENCE_STATS)
+    stats['rate_limit_wait_s'] = round(stats['rate_limit_wait_s'], 3)
+    stats['open_circuits'] = [model for model, guard in list(_guards.items()) if guard.breaker.state != 'closed']
+    return stats
+
+
+def is_transient(error):
+    """True for errors worth retrying: quota (429), server-side 5xx, timeouts and dropped connections."""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if isinstance(code, int):
+        return code in TRANSIENT_STATUS_CODES
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    message = str(error)
+    return (name in ('ReadTimeout', 'ConnectTimeout', 'ConnectError', 'RemoteProtocolError')
+            or any(marker in message for marker in ('429', 'RESOURCE_EXHAUSTED', 'UNAVAILABLE', 'DEADLINE_EXCEEDED')))
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry number (0-based)."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def estimate_tokens(contents):
+    return max(1, len(str(contents)) // CHARS_PER_TOKEN)
+
+
+def check_breaker(guard, model):
+    """
+    Circuit check, made once per logical call (not per retry): a half-open trial call keeps
+    its retries, and only its final outcome closes or re-opens the breaker.
+    """
+    if not guard.breaker.allow():
+        count('short_circuits')
+        raise CircuitOpenError(f"Circuit open for {model}; skipping the LLM call.")
+
+
+def before_attempt(guard, backend, contents):
+    """Seconds to wait for the rate limiter before calling (0.0 = go)."""
+    if not getattr(backend, 'rate_limited', True):
+        return 0.0
+    return guard.wait_time(estimate_tokens(contents))
+
+
+def after_failure(guard, error, attempt):
+    """Records a failed attempt; returns the backoff delay before retrying, or re-raises."""
+    if not is_transient(error):
+        # Bad requests are the caller's problem; the service answered, so it is not down
+        guard.breaker.record_success()
+        raise error
+    count('transient_errors')
+    if getattr(error, 'code', None) == 429 or '429' in str(error):
+        guard.throttle()
+    if attempt >= LLM_MAX_RETRIES:
+        guard.breaker.record_failure()
+        raise error
+    count('retries')
+    metrics.inc('llm_retries_total', model=getattr(guard, 'model', 'unknown'))
+    return backoff_delay(attempt)
+
+
+def call_with_resilience(backend, model, contents, config):
+    guard = get_guard(model)
+    check_breaker(guard, model)
+    attempt = 0
+    try:
+        while True:
+            wait = before_attempt(guard, backend, contents)
+            while wait > 0:
+                time.sleep(wait)
+                count('rate_limit_wait_s', wait)
+                wait = guard.wait_time(estimate_tokens(contents))
+            try:
+                response = backend.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                delay = after_failure(guard, e, attempt)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            guard.breaker.record_success()
+            guard.recover()
+            return response
+    except (KeyboardInterrupt, SystemExit):
+        guard.breaker.abandon()
+        raise
+
+
+async def call_with_resilience_async(backend, model, contents, config):
+    guard = get_guard(model)
+    check_breaker(guard, model)
+    attempt = 0
+    try:
+        while True:
+            wait = before_attempt(guard, backend, contents)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                count('rate_limit_wait_s', wait)
+                wait = guard.wait_time(estimate_tokens(contents))
+            try:
+                if hasattr(backend, 'generate_content_async'):
+                    response = await backend.generate_content_async(model=model, contents=contents, config=config)
+                else:
+                    # Backends without native async support run in a worker thread
+                    response = await asyncio.to_thread(backend.generate_content, model=model, contents=contents, config=config)
+            except Exception as e:
+                delay = after_failure(guard, e, attempt)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            guard.breaker.record_success()
+            guard.recover()
+            return response
+    except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+        guard.breaker.abandon()
+        raise
+
+
+def record_call(agent, model, started, response=None):
+    """Telemetry for one backend call: latency, outcome and token usage."""
+    agent = agent or 'unknown'
+    metrics.observe('llm_call_seconds', time.perf_counter() - started, agent=agent, model=model)
+    metrics.inc('llm_calls_total', agent=agent, model=model, outcome='ok' if response is not None else 'error')
+    if response is not None:
+        metrics.record_llm_usage(agent, model, getattr(response, 'usage_metadata', None))
+
+
+def record_short_circuit(agent, model):
+    """A call rejected by the open breaker never reached the service: no latency, and not an error."""
+    metrics.inc('llm_calls_total', agent=agent or 'unknown', model=model, outcome='short_circuit')
+
+
+def lookup_cache(model, contents, config, agent, use_cache):
+    """
+    Returns (cache, key, cached_response); cache is None when caching does not apply.
+    A cache that cannot be read (e.g. 'database is locked') is skipped for this call.
+    """
+    if not use_cache or llm_cache.ttl_for(agent) <= 0:
+        return None, None, None
+    try:
+        cache = llm_cache.get_cache()
+        if cache is None:
+            return None, None, None
+        key = llm_cache.make_cache_key(model, contents, config)
+        cached_text = cache.get(key)
+    except Exception as e:
+        log_activity("LLM Gateway", "Cache Error", f"Cache read failed for {agent or 'unknown'}; calling the model. Error: {e}")
+        return None, None, None
+    return cache, key, (LLMResponse(cached_text) if cached_text is not None else None)
+
+
+def store_response(cache, key, response, config, agent):
+    """Caches a validated response; a failed write is logged and the response is still returned."""
+    if cache is None or not llm_cache.is_cacheable(response.text, config):
+        return
+    try:
+        cache.put(key, response.text, agent=agent)
+    except Exception as e:
+        log_activity("LLM Gateway", "Cache Error", f"Cache write failed for {agent or 'unknown'}. Error: {e}")
+
+
+def generate_content(model, contents, config=None, agent=None, use_cache=True):
+    """
+    Single entry point for all agent LLM calls. Identical requests are answered from the
+    response cache (see src/llm_cache.py) according to the calling agent's TTL. Calls are
+    rate limited, retried on transient errors and short-circuited while the model's
+    breaker is open. Errors that remain propagate to the caller so each agent keeps its
+    own fallback behaviour.
+    """
+    cache, key, cached = lookup_cache(model, contents, config, agent, use_cache)
+    if cached is not None:
+        metrics.inc('llm_calls_total', agent=agent or 'unknown', model=model, outcome='cached')
+        return cached
+
+    started = time.perf_counter()
+    try:
+        response = call_with_resilience(get_backend(), model, contents, config)
+    except CircuitOpenError:
+        record_short_circuit(agent, model)
+        raise
+    except Exception:
+        record_call(agent, model, started)
+        raise
+    record_call(agent, model, started, response)
+    store_response(cache, key, response, config, agent)
+    return response
+
+
+async def generate_content_async(model, contents, config=None, agent=None, use_cache=True):
+    """Async variant of generate_content for concurrent fan-out (e.g. expiry triage)."""
+    cache, key, cached = lookup_cache(model, contents, config, agent, use_cache)
+    if cached is not None:
+        metrics.inc('llm_calls_total', agent=agent or 'unknown', model=model, outcome='cached')
+        return cached
+
+    started = time.perf_counter()
+    try:
+        response = await call_with_resilience_async(get_backend(), model, contents, config)
+    except CircuitOpenError:
+        record_short_circuit(agent, model)
+        raise
+    except Exception:
+        record_call(agent, model, started)
+        raise
+    record_call(agent, model, started, response)
+    store_response(cache, key, response, config, agent)
+    return response
@@ -0,0 +1,131 @@
+# src/log_writer.py
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+# --- Writer Configuration ---
+# Log lines are queued and written by one background thread in batches, so each
+# event costs a queue put instead of an open/write/close on the log file.
+LOG_BUFFERED = os.getenv('LOG_BUFFERED', '1').lower() in ('1', 'true', 'yes')
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '0.2'))  # seconds
+LOG_FLUSH_SIZE = int(os.getenv('LOG_FLUSH_SIZE', '500'))            # entries per batch
+
+
+class BackgroundLogWriter:
+    """
+    Queue-backed log writer. Entries are grouped per file and appended with a single
+    open/write per batch. A batch is written when it reaches `flush_size` entries or
+    `flush_interval` seconds after its first entry, whichever comes first.
+    """
+
+    def __init__(self, flush_interval=None, flush_size=None):
+        self.flush_interval = LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flush_size = flush_size or LOG_FLUSH_SIZE
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                    self._thread.start()
+
+    def write(self, path, text):
+        """Queues `text` to be appended to `path`."""
+        if self._closed:
+            write_entries([(path, text)])
+            return
+        self._ensure_started()
+        self._queue.put((path, text))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Keep collecting until the batch is full or the flush interval has passed
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                write_entries(batch)
+            except Exception as e:
+                print(f"!!! LOG WRITER ERROR: Failed to write {len(batch)} log entries. Error: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued entry has been written."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Flushes outstanding entries; later writes go straight to disk."""
+        self.flush()
+        self._closed = True
+
+
+def write_entries(entries):
+    """Appends (path, text) entries, opening each file once."""
+    by_path = {}
+    for path, text in entries:
+        by_path.setdefault(path, []).append(text)
+    for path, texts in by_path.items():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as f:
+            f.write("".join(texts))
+
+
+_writer = BackgroundLogWriter()
+# When set (see start_capture), entries are collected in memory instead of written
+_capture = None
+# Guarantee that nothing queued is lost when the process exits
+atexit.register(_writer.close)
+
+
+def write(path, text):
+    """Appends `text` to `path`, through the background writer unless LOG_BUFFERED=0."""
+    if _capture is not None:
+        _capture.append((path, text))
+    elif LOG_BUFFERED:
+        _writer.write(path, text)
+    else:
+        write_entries([(path, text)])
+
+
+def write_many(entries):
+    """Writes a sequence of (path, text) entries in order, e.g. entries captured in a worker process."""
+    for path, text in entries:
+        write(path, text)
+
+
+def start_capture():
+    """Collects subsequent log entries in memory (used by shard worker processes)."""
+    global _capture
+    _capture = []
+
+
+def stop_capture():
+    """Stops capturing and returns the captured (path, text) entries in write order."""
+    global _capture
+    entries, _capture = _capture or [], None
+    return entries
+
+
+def flush():
+    """Waits until all queued log entries are on disk (e.g. before reading a log file)."""
+    _writer.flush()
+
+
+def shutdown():
+    """Flushes and stops buffering; called by the orchestrator at the end of a run."""
+    _writer.close()
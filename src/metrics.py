@@ -0,0 +1,222 @@
+# src/metrics.py
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# --- Telemetry Configuration ---
+# In-process counters and histograms for agent wall time, LLM latency and token usage,
+# cache hits, retries and fallbacks. Exported at the end of a run as JSON and as
+# Prometheus text (outputs/metrics.json, outputs/metrics.prom).
+METRICS_DIR = os.getenv('METRICS_DIR', 'outputs')
+
+# Histogram bucket upper bounds, in seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+HELP = {
+    'agent_function_seconds': 'Wall time of agent functions.',
+    'llm_call_seconds': 'Latency of LLM calls that reached the backend (including retries).',
+    'llm_calls_total': 'LLM calls by outcome (ok, error, cached, short_circuit).',
+    'llm_prompt_tokens_total': 'Prompt tokens reported in usage metadata.',
+    'llm_response_tokens_total': 'Response tokens reported in usage metadata.',
+    'llm_retries_total': 'Retried LLM attempts after transient errors.',
+    'agent_fallbacks_total': 'Times an agent used its non-LLM fallback.',
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> value
+_histograms = {}   # (name, labels) -> {'buckets': [...], 'sum': float, 'count': int}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Adds `amount` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Records one observation (seconds) in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * (len(TIME_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        histogram['buckets'][bisect.bisect_left(TIME_BUCKETS, value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def timed(agent, function=None):
+    """Decorator recording the wall time of every call in agent_function_seconds."""
+    def decorate(func):
+        name = function or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe('agent_function_seconds', time.perf_counter() - started, agent=agent, function=name)
+        return wrapper
+    return decorate
+
+
+def record_fallback(agent):
+    inc('agent_fallbacks_total', agent=agent)
+
+
+def record_llm_usage(agent, model, usage_metadata):
+    """Adds token counts from a response's usage metadata (a Gemini object or a dict), if present."""
+    if usage_metadata is None:
+        return
+    for field, metric in (('prompt_token_count', 'llm_prompt_tokens_total'),
+                          ('candidates_token_count', 'llm_response_tokens_total')):
+        value = usage_metadata.get(field) if isinstance(usage_metadata, dict) else getattr(usage_metadata, field, None)
+        if value:
+            inc(metric, value, agent=agent or 'unknown', model=model)
+
+
+# --- Snapshots, Merging and Export ---
+
+def snapshot():
+    """All metrics as plain data (picklable, e.g. to return them from a shard worker)."""
+    with _lock:
+        return {
+            'counters': [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, dict(labels), dict(h, buckets=list(h['buckets']))]
+                           for (name, labels), h in _histograms.items()],
+        }
+
+
+def merge(data):
+    """Adds a snapshot taken in another process into this one."""
+    with _lock:
+        for name, labels, value in data['counters']:
+            key = _key(name, labels)
+            _counters[key] = _counters.get(key, 0) + value
+        for name, labels, incoming in data['histograms']:
+            key = _key(name, labels)
+            histogram = _histograms.setdefault(
+                key, {'buckets': [0] * (len(TIME_BUCKETS) + 1), 'sum': 0.0, 'count': 0})
+            histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], incoming['buckets'])]
+            histogram['sum'] += incoming['sum']
+            histogram['count'] += incoming['count']
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def quantile(histogram, q):
+    """Upper bucket bound containing the q-quantile (an estimate, as in Prometheus)."""
+    if not histogram['count']:
+        return 0.0
+    target, running = q * histogram['count'], 0
+    for bound, count in zip(TIME_BUCKETS + (float('inf'),), histogram['buckets']):
+        running += count
+        if running >= target:
+            return bound
+    return float('inf')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels.items()) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def to_prometheus(data=None):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    data = data or snapshot()
+    lines, declared = [], set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for name, labels, value in sorted(data['counters'], key=lambda c: (c[0], sorted(c[1].items()))):
+        declare(name, 'counter')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name, labels, histogram in sorted(data['histograms'], key=lambda h: (h[0], sorted(h[1].items()))):
+        declare(name, 'histogram')
+        running = 0
+        for bound, count in zip(TIME_BUCKETS + (float('inf'),), histogram['buckets']):
+            running += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': le})} {running}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(directory=None):
+    """Writes metrics.json and metrics.prom; returns their paths."""
+    directory = directory or METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    data = snapshot()
+    json_path = os.path.join(directory, 'metrics.json')
+    prom_path = os.path.join(directory, 'metrics.prom')
+    with open(json_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    with open(prom_path, 'w') as f:
+        f.write(to_prometheus(data))
+    return json_path, prom_path
+
+
+def summary_markdown(data=None):
+    """Markdown tables for the dashboard: slowest agent functions first, then LLM usage per agent."""
+    data = data or snapshot()
+    lines = ["| Agent | Function | Calls | Total (s) | Mean (s) | p95 (s) |", "|---|---|---|---|---|---|"]
+    functions = [(labels, h) for name, labels, h in data['histograms'] if name == 'agent_function_seconds']
+    for labels, h in sorted(functions, key=lambda item: -item[1]['sum']):
+        lines.append(f"| {labels['agent']} | {labels['function']} | {h['count']} | {h['sum']:.3f} | "
+                     f"{h['sum'] / h['count']:.3f} | {quantile(h, 0.95)} |")
+
+    per_agent = {}
+    for name, labels, h in data['histograms']:
+        if name == 'llm_call_seconds':
+            row = per_agent.setdefault(labels['agent'], {})
+            row['calls'] = row.get('calls', 0) + h['count']
+            row['seconds'] = row.get('seconds', 0.0) + h['sum']
+    columns = {'llm_prompt_tokens_total': 'prompt', 'llm_response_tokens_total': 'response',
+               'agent_fallbacks_total': 'fallbacks'}
+    for name, labels, value in data['counters']:
+        if name in columns:
+            row = per_agent.setdefault(labels['agent'], {})
+            row[columns[name]] = row.get(columns[name], 0) + value
+        elif name == 'llm_calls_total' and labels.get('outcome') == 'cached':
+            row = per_agent.setdefault(labels['agent'], {})
+            row['cached'] = row.get('cached', 0) + value
+
+    lines += ["", "| Agent | LLM calls | Mean latency (s) | Cache hits | Prompt tokens | Response tokens | Fallbacks |",
+              "|---|---|---|---|---|---|---|"]
+    for agent, row in sorted(per_agent.items()):
+        calls = row.get('calls', 0)
+        mean = f"{row['seconds'] / calls:.3f}" if calls else "-"
+        lines.append(f"| {agent} | {calls} | {mean} | {row.get('cached', 0)} | {row.get('prompt', 0)} | "
+                     f"{row.get('response', 0)} | {row.get('fallbacks', 0)} |")
+
+    retries = sum(value for name, _, value in data['counters'] if name == 'llm_retries_total')
+    short_circuits = sum(value for name, labels, value in data['counters']
+                         if name == 'llm_calls_total' and labels.get('outcome') == 'short_circuit')
+    lines += ["", f"LLM retries: {retries}; calls short-circuited by the breaker: {short_circuits}."]
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+# src/pipeline.py
+
+import queue
+import threading
+import time
+
+from src.utils import log_activity
+
+# Marks the end of the stream on a stage queue
+_END = object()
+
+
+class Stage:
+    """
+    One step of a streaming pipeline. `func(item)` returns the item to pass on to the
+    next stage, or None to drop it. `concurrency` worker threads run the stage.
+    """
+
+    def __init__(self, name, func, concurrency=1):
+        self.name = name
+        self.func = func
+        self.concurrency = max(1, concurrency)
+
+
+def run_pipeline(source, stages, queue_size=16, sink=None):
+    """
+    Streams items from `source` (any iterable, consumed lazily) through `stages`. Every
+    item moves to the next stage as soon as the current one finishes with it, and the
+    bounded queues between stages apply back-pressure so memory stays flat. Items
+    leaving the last stage are passed to `sink` (called from one thread at a time); an
+    exception from `sink` counts as an error of the last stage.
+
+    Returns per-stage stats: items processed, errors, and seconds until the stage
+    completed its first item (time-to-first-result).
+    """
+    started = time.monotonic()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = {stage.name: {'processed': 0, 'errors': 0, 'first_completed_s': None} for stage in stages}
+    remaining_workers = [stage.concurrency for stage in stages]
+    lock = threading.Lock()
+    sink_lock = threading.Lock()
+
+    def feed():
+        try:
+            for item in source:
+                queues[0].put(item)
+        except Exception as e:
+            log_activity("Orchestrator", "Pipeline Source Error", f"Stopped reading pipeline input. Error: {e}")
+        finally:
+            for _ in range(stages[0].concurrency):
+                queues[0].put(_END)
+
+    def work(position):
+        stage = stages[position]
+        is_last = position == len(stages) - 1
+        try:
+            while True:
+                item = queues[position].get()
+                if item is _END:
+                    break
+                try:
+                    result = stage.func(item)
+                    if is_last and result is not None and sink is not None:
+                        with sink_lock:
+                            sink(result)
+                except Exception as e:
+                    log_activity("Orchestrator", "Pipeline Stage Error", f"Stage '{stage.name}' failed for an item. Error: {e}")
+                    with lock:
+                        stats[stage.name]['errors'] += 1
+                    continue
+
+                with lock:
+                    stage_stats = stats[stage.name]
+                    stage_stats['processed'] += 1
+                    if stage_stats['first_completed_s'] is None:
+                        stage_stats['first_completed_s'] = round(time.monotonic() - started, 3)
+                if not is_last and result is not None:
+                    queues[position + 1].put(result)
+        finally:
+            # The last worker of a stage to finish closes the next stage's input
+            with lock:
+                remaining_workers[position] -= 1
+                stage_done = remaining_workers[position] == 0
+            if stage_done and not is_last:
+                for _ in range(stages[position + 1].concurrency):
+                    queues[position + 1].put(_END)
+
+    threads = [threading.Thread(target=feed, name='pipeline-source', daemon=True)]
+    for position, stage in enumerate(stages):
+        threads.extend(
+            threading.Thread(target=work, args=(position,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+            for n in range(stage.concurrency)
+        )
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats
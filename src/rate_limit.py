@@ -0,0 +1,56 @@
+# src/rate_limit.py
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`
+    (default: one second's worth). A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(self.rate, 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Takes `tokens` if available. Returns 0.0 on success, else the seconds to wait before retrying."""
+        if self.rate <= 0:
+            return 0.0
+        # A request larger than the bucket can ever hold is let through once the bucket is full
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def set_rate(self, rate):
+        """Changes the refill rate; tokens accrued so far are kept."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def release(self, tokens=1):
+        """Returns unused tokens to the bucket (e.g. when a call is abandoned before it is made)."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,167 @@
+# src/registry.py
+
+import numpy as np
+import pandas as pd
+
+
+class DocumentRegistry:
+    """
+    Wraps the documents table with a doc_id -> row position index so lookups and
+    updates no longer scan the whole DataFrame. Updates are applied in place, so
+    other references to the same DataFrame see them immediately. Inserts build a new
+    DataFrame; `on_replace`, if set, is called with it so holders of the old one
+    (e.g. src.utils.DOCUMENTS_DF) can pick it up.
+
+    If a `journal` is attached (see src/registry_store.py), every update and insert is
+    also appended to it as a record that can be replayed after a restart.
+    """
+
+    # Columns whose changes invalidate the sorted expiry index
+    EXPIRY_COLUMNS = ('expiry_date', 'Expiry_Date_dt')
+
+    def __init__(self, df):
+        self.df = df
+        self.journal = None
+        self.on_replace = None
+        self._rebuild_index()
+        self._expiry_index = None
+
+    def _rebuild_index(self):
+        # Keep the first occurrence of any duplicated doc_id
+        self._positions = {}
+        if 'doc_id' in self.df.columns:
+            for position, doc_id in enumerate(self.df['doc_id'].tolist()):
+                self._positions.setdefault(doc_id, position)
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._positions
+
+    def position(self, doc_id):
+        """Row position of a document, or None if it is not registered."""
+        return self._positions.get(doc_id)
+
+    def get(self, doc_id):
+        """Returns the document's row as a dict, or None if it is not registered."""
+        position = self._positions.get(doc_id)
+        if position is None:
+            return None
+        return self.df.iloc[position].to_dict()
+
+    def positions(self, doc_ids):
+        """Resolves doc_ids to row positions; returns (found doc_ids, positions array)."""
+        found, positions = [], []
+        for doc_id in doc_ids:
+            position = self._positions.get(doc_id)
+            if position is not None:
+                found.append(doc_id)
+                positions.append(position)
+        return found, np.asarray(positions, dtype=np.intp)
+
+    def update_field(self, doc_ids, column, value):
+        """
+        Sets `column` to `value` for every listed document in one vectorized assignment.
+        `value` may be a scalar or a sequence aligned with `doc_ids`. Returns the doc_ids
+        that were found and updated.
+        """
+        doc_ids = list(doc_ids)
+        if not isinstance(value, (str, bytes)) and hasattr(value, '__len__'):
+            values = dict(zip(doc_ids, value))
+        else:
+            values = None
+
+        found, positions = self.positions(doc_ids)
+        if not found:
+            return []
+        if column not in self.df.columns:
+            self.df[column] = None
+
+        column_position = self.df.columns.get_loc(column)
+        new_values = [values[doc_id] for doc_id in found] if values is not None else value
+        self.df.iloc[positions, column_position] = new_values
+        if column in self.EXPIRY_COLUMNS:
+            self._expiry_index = None
+        if self.journal is not None:
+            self.journal.append({'op': 'update', 'column': column, 'doc_ids': found, 'value': new_values})
+        return found
+
+    def update_review_dates(self, doc_ids, new_date):
+        """Bulk update of the review date for many documents."""
+        return self.update_field(doc_ids, 'review_date', str(new_date))
+
+    def update_statuses(self, doc_ids, status):
+        """Bulk update of the status for many documents."""
+        return self.update_field(doc_ids, 'status', status)
+
+    def insert(self, records):
+        """
+        Appends new documents (a list of dicts) and extends the index incrementally.
+        Raises ValueError if any doc_id is already registered or repeated in `records`.
+        """
+        records = list(records)
+        new_rows = pd.DataFrame(records)
+        if new_rows.empty:
+            return 0
+        duplicates = [doc_id for doc_id in new_rows['doc_id'] if doc_id in self._positions]
+        if duplicates or new_rows['doc_id'].duplicated().any():
+            raise ValueError(f"Duplicate doc_id(s) in registry insert: {duplicates or list(new_rows['doc_id'])}")
+
+        if 'expiry_date' in new_rows.columns:
+            new_rows['Expiry_Date_dt'] = pd.to_datetime(
+                new_rows['expiry_date'], format='%Y-%m-%d', errors='coerce'
+            ).dt.date
+
+        start = len(self.df)
+        self.df = pd.concat([self.df, new_rows], ignore_index=True)
+        for offset, doc_id in enumerate(new_rows['doc_id'].tolist()):
+            self._positions[doc_id] = start + offset
+        self._expiry_index = None
+        if self.on_replace is not None:
+            self.on_replace(self.df)
+        if self.journal is not None:
+            self.journal.append({'op': 'insert', 'records': records})
+        return len(new_rows)
+
+    # --- Expiry Index ---
+
+    def _get_expiry_index(self):
+        """
+        Sorted (expiry dates, row positions) arrays, built lazily and cached until an
+        insert or an expiry-date update invalidates them. Rows without a valid expiry
+        date are left out of the index.
+        """
+        if self._expiry_index is None:
+            if 'Expiry_Date_dt' in self.df.columns:
+                expiry = pd.to_datetime(self.df['Expiry_Date_dt'], errors='coerce').to_numpy(dtype='datetime64[D]')
+            else:
+                expiry = np.array([], dtype='datetime64[D]')
+            valid = np.flatnonzero(~np.isnat(expiry))
+            order = valid[np.argsort(expiry[valid], kind='stable')]
+            self._expiry_index = (expiry[order], order)
+        return self._expiry_index
+
+    def _select(self, positions, status):
+        # Return rows in registry order, optionally restricted to one status
+        rows = self.df.iloc[np.sort(positions)]
+        if status is not None:
+            rows = rows[rows['status'] == status]
+        return rows
+
+    def expiring_before(self, cutoff, status='Active'):
+        """Rows expiring on or before `cutoff` (a date), found by a range slice on the expiry index."""
+        values, positions = self._get_expiry_index()
+        end = np.searchsorted(values, np.datetime64(cutoff, 'D'), side='right')
+        return self._select(positions[:end], status)
+
+    def expiring_windows(self, base_date, windows=(30, 60, 90), status='Active'):
+        """
+        Answers several "expiring within N days of base_date" queries in one pass over the
+        index. Returns {days: DataFrame slice}.
+        """
+        values, positions = self._get_expiry_index()
+        base = np.datetime64(base_date, 'D')
+        cutoffs = np.array([base + np.timedelta64(days, 'D') for days in windows], dtype='datetime64[D]')
+        ends = np.searchsorted(values, cutoffs, side='right')
+        return {days: self._select(positions[:end], status) for days, end in zip(windows, ends)}
@@ -0,0 +1,261 @@
+# src/registry_store.py
+
+import glob
+import importlib.util
+import json
+import os
+import threading
+import time
+
+from src.utils import log_activity
+
+# --- Registry Persistence Configuration ---
+# With REGISTRY_PERSISTENCE=1, every registry mutation (review date and status updates,
+# inserts) is appended to a write-ahead log. Once the log holds REGISTRY_COMPACT_EVERY
+# records it is compacted into a snapshot. At startup the latest snapshot is loaded instead
+# of documents.csv and only the log tail is replayed, so both write and restart cost follow
+# the number of changes rather than the registry size.
+REGISTRY_PERSISTENCE = os.getenv('REGISTRY_PERSISTENCE', '0').lower() in ('1', 'true', 'yes')
+REGISTRY_STORE_DIR = os.getenv('REGISTRY_STORE_DIR', os.path.join('logs', 'registry'))
+REGISTRY_COMPACT_EVERY = int(os.getenv('REGISTRY_COMPACT_EVERY', '10000'))
+# 'auto' writes Parquet when a Parquet engine (pyarrow or fastparquet) is installed, else pickle
+REGISTRY_SNAPSHOT_FORMAT = os.getenv('REGISTRY_SNAPSHOT_FORMAT', 'auto')
+# fsync after every log record (survives power loss, not just a crashed process)
+REGISTRY_WAL_FSYNC = os.getenv('REGISTRY_WAL_FSYNC', '0').lower() in ('1', 'true', 'yes')
+
+# Shard workers load the persisted registry but must not write to the coordinator's log
+JOURNAL_WRITES = True
+
+# Derived columns are recomputed on load rather than stored
+DERIVED_COLUMNS = ('Expiry_Date_dt',)
+
+
+def snapshot_format():
+    if REGISTRY_SNAPSHOT_FORMAT != 'auto':
+        return REGISTRY_SNAPSHOT_FORMAT
+    if importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet'):
+        return 'parquet'
+    return 'pickle'
+
+
+class RegistryStore:
+    """
+    Write-ahead log plus compacted snapshots for a DocumentRegistry.
+
+    Layout of the store directory:
+      wal.jsonl                one JSON record per mutation, each with a sequence number
+      snapshot-<seq>.<ext>     the registry as of log record <seq>
+      snapshot.json            points at the current snapshot and its sequence number
+    """
+
+    def __init__(self, directory=None, compact_every=None, fmt=None):
+        self.directory = directory or REGISTRY_STORE_DIR
+        self.compact_every = compact_every or REGISTRY_COMPACT_EVERY
+        self.format = fmt or snapshot_format()
+        self.wal_path = os.path.join(self.directory, 'wal.jsonl')
+        self.meta_path = os.path.join(self.directory, 'snapshot.json')
+        self.registry = None
+        self.seq = 0
+        self.wal_records = 0
+        self.compactions = 0
+        self._wal = None
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    # --- Loading ---
+
+    def _meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load_snapshot(self):
+        """The latest snapshot as a DataFrame (without derived columns), or None if there is none."""
+        import pandas as pd
+
+        meta = self._meta()
+        if meta is None:
+            return None
+        path = os.path.join(self.directory, meta['file'])
+        if meta['format'] == 'parquet':
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_pickle(path)
+        self.seq = meta['seq']
+        return df
+
+    def _read_wal(self, after_seq):
+        """
+        Log records with a sequence number above `after_seq`, and the byte length of the
+        intact part of the log. A record only counts once its newline is written, so a
+        torn last line is left out.
+        """
+        records, intact = [], 0
+        if not os.path.exists(self.wal_path):
+            return records, intact
+        with open(self.wal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the final record can be incomplete (the process died mid-write)
+                    break
+                intact += len(line)
+                if record['seq'] > after_seq:
+                    records.append(record)
+        return records, intact
+
+    def _truncate_torn_tail(self, intact):
+        """Cuts a torn last record off the log, so new records are not appended to it."""
+        if os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) > intact:
+            with open(self.wal_path, 'r+b') as f:
+                f.truncate(intact)
+            return True
+        return False
+
+    def attach(self, registry):
+        """
+        Replays the log tail onto `registry` (loaded from the snapshot, or from the CSV if
+        there is none) and journals its further mutations. Returns the number of records replayed.
+        """
+        with self._lock:
+            meta = self._meta()
+            records, intact = self._read_wal(meta['seq'] if meta else 0)
+            registry.journal = None
+            replay(registry, records)
+            if records:
+                self.seq = records[-1]['seq']
+            self.registry = registry
+            self.wal_records = len(records)
+            if JOURNAL_WRITES:
+                if self._truncate_torn_tail(intact):
+                    log_activity("Orchestrator", "Registry Store", "Discarded a torn record at the end of the registry log.")
+                registry.journal = self
+                if self.wal_records >= self.compact_every:
+                    self.compact()
+        return len(records)
+
+    # --- Writing ---
+
+    def append(self, record):
+        """Appends one mutation to the log; compacts once the log is long enough."""
+        with self._lock:
+            self.seq += 1
+            if self._wal is None:
+                self._wal = open(self.wal_path, 'a')
+            self._wal.write(json.dumps(dict(record, seq=self.seq), default=str) + "\n")
+            self._wal.flush()
+            if REGISTRY_WAL_FSYNC:
+                os.fsync(self._wal.fileno())
+            self.wal_records += 1
+            if self.wal_records >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        Writes the attached registry as a new snapshot, points snapshot.json at it and
+        truncates the log. Safe against a crash at any step: until snapshot.json is
+        replaced the old snapshot and the full log are still used, and afterwards
+        records already in the snapshot are skipped by sequence number.
+        """
+        with self._lock:
+            if self.registry is None:
+                return None
+            extension = 'parquet' if self.format == 'parquet' else 'pkl'
+            name = f"snapshot-{self.seq}.{extension}"
+            path = os.path.join(self.directory, name)
+            df = self.registry.df.drop(columns=[c for c in DERIVED_COLUMNS if c in self.registry.df.columns])
+            if self.format == 'parquet':
+                df.to_parquet(path + '.tmp', index=False)
+            else:
+                df.to_pickle(path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+            with open(self.meta_path + '.tmp', 'w') as f:
+                json.dump({'seq': self.seq, 'format': self.format, 'file': name, 'rows': len(df),
+                           'created': time.time()}, f)
+            os.replace(self.meta_path + '.tmp', self.meta_path)
+
+            if self._wal is not None:
+                self._wal.close()
+            self._wal = open(self.wal_path, 'w')
+            self.wal_records = 0
+            self.compactions += 1
+
+            for old in glob.glob(os.path.join(self.directory, 'snapshot-*')):
+                if os.path.basename(old) != name:
+                    os.remove(old)
+            return path
+
+    def close(self):
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+
+    def stats(self):
+        meta = self._meta()
+        return {
+            'seq': self.seq,
+            'wal_records': self.wal_records,
+            'snapshot_seq': meta['seq'] if meta else None,
+            'format': self.format,
+            'compactions': self.compactions,
+        }
+
+
+def replay(registry, records):
+    """
+    Re-applies logged mutations to a registry, in order. Consecutive updates are coalesced
+    (last write wins per document and column) into one vectorized update per column.
+    """
+    pending = {}  # column -> {doc_id: value}
+
+    def apply_pending():
+        for column, values in pending.items():
+            registry.update_field(list(values), column, list(values.values()))
+        pending.clear()
+
+    for record in records:
+        if record['op'] == 'update':
+            values = pending.setdefault(record['column'], {})
+            if isinstance(record['value'], list):
+                values.update(zip(record['doc_ids'], record['value']))
+            else:
+                values.update(dict.fromkeys(record['doc_ids'], record['value']))
+        elif record['op'] == 'insert':
+            # Updates logged before an insert may target the rows it adds only afterwards
+            apply_pending()
+            registry.insert(record['records'])
+        else:
+            raise ValueError(f"Unknown registry log operation: {record['op']}")
+    apply_pending()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide registry store, or None when persistence is off."""
+    global _store
+    if _store is None and not REGISTRY_PERSISTENCE:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RegistryStore()
+    return _store
+
+
+def set_store(store):
+    """Installs a store instance (e.g. one pointing at a temporary directory). Pass None to reset."""
+    global _store
+    with _store_lock:
+        if _store is not None and _store is not store:
+            _store.close()
+        _store = store
@@ -0,0 +1,177 @@
+# src/run_state.py
+
+import os
+import sqlite3
+import threading
+import time
+
+# --- Incremental Run Configuration ---
+# With INCREMENTAL_RUNS=1, Process A remembers what it has already handled: the date of the
+# last completed run (the watermark), a content hash of every registry row it triaged and
+# when each document was notified and renewed. A daily run then only processes documents
+# that entered the expiry window or changed since, instead of re-notifying the whole window.
+INCREMENTAL_RUNS = os.getenv('INCREMENTAL_RUNS', '0').lower() in ('1', 'true', 'yes')
+RUN_STATE_PATH = os.getenv('RUN_STATE_PATH', os.path.join('logs', 'run_state.sqlite'))
+
+# Registry columns that make up a document's content hash. Columns the workflow itself
+# writes (review_date) and derived columns (Expiry_Date_dt) are left out.
+HASH_COLUMNS = ('doc_id', 'title', 'owner_email', 'type', 'last_review', 'expiry_date', 'status')
+
+# Outcomes are written in batches of this many documents
+FLUSH_EVERY = 500
+
+
+def row_hashes(docs):
+    """Content hash (16 hex digits) per registry row, computed in one vectorized pass."""
+    import pandas as pd
+
+    columns = [column for column in HASH_COLUMNS if column in docs.columns]
+    hashes = pd.util.hash_pandas_object(docs[columns].astype(str), index=False)
+    return hashes.map(lambda value: format(value, '016x'))
+
+
+class RunStateStore:
+    """
+    SQLite store of the per-document notification state and the run watermark.
+    Outcomes recorded during a run are buffered and flushed in batches; a document
+    only counts as handled once its outcome is flushed, so an interrupted run
+    re-processes whatever it had not finished.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or RUN_STATE_PATH
+        self._lock = threading.Lock()
+        self._pending = []
+        # Documents selected and skipped by select_delta() since the last completed run
+        self.selected = 0
+        self.unchanged = 0
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id TEXT PRIMARY KEY, row_hash TEXT, expiry_date TEXT,"
+            " notified_on TEXT, renewed_on TEXT, updated_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_date TEXT, started_at REAL, finished_at REAL, processed INTEGER, skipped INTEGER)"
+        )
+        self._conn.commit()
+
+    # --- Watermark ---
+
+    def watermark(self):
+        """Simulation date of the last completed run, as an ISO string, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(run_date) FROM runs").fetchone()
+        return row[0]
+
+    def complete_run(self, run_date, started_at):
+        """Flushes outstanding outcomes and advances the watermark to `run_date`."""
+        self.flush()
+        with self._lock:
+            self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                               (str(run_date), started_at, time.time(), self.selected, self.unchanged))
+            self._conn.commit()
+            self.selected = self.unchanged = 0
+
+    # --- Delta Selection ---
+
+    def select_delta(self, docs):
+        """
+        Splits registry rows into (to_process, unchanged). A row is unchanged when the
+        document was already notified and its content hash is the same as then.
+        Rows to process carry a 'row_hash' column for record().
+        """
+        docs = docs.copy()
+        docs['row_hash'] = row_hashes(docs) if len(docs) else []
+        known = self._notified_hashes(docs['doc_id'].tolist())
+        unchanged = docs['doc_id'].map(known).eq(docs['row_hash'])
+        self.selected += int((~unchanged).sum())
+        self.unchanged += int(unchanged.sum())
+        return docs[~unchanged], docs[unchanged]
+
+    def _notified_hashes(self, doc_ids):
+        known = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(doc_ids), 900):
+                chunk = doc_ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                known.update(self._conn.execute(
+                    f"SELECT doc_id, row_hash FROM documents WHERE notified_on IS NOT NULL AND doc_id IN ({placeholders})",
+                    chunk
+                ).fetchall())
+        return known
+
+    # --- Outcomes ---
+
+    def record(self, doc, run_date, notified, renewed):
+        """Buffers the outcome of one processed document (a triaged doc dict carrying 'row_hash')."""
+        if not notified:
+            return
+        entry = (doc['doc_id'], doc.get('row_hash'), doc.get('expiry_date'), str(run_date),
+                 str(run_date) if renewed else None, time.time())
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= FLUSH_EVERY
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)", pending)
+                self._conn.commit()
+
+    def get(self, doc_id):
+        """Stored state of one document as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, row_hash, expiry_date, notified_on, renewed_on FROM documents WHERE doc_id = ?",
+                (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('doc_id', 'row_hash', 'expiry_date', 'notified_on', 'renewed_on'), row))
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            runs = self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        return {'documents': documents, 'runs': runs}
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self.selected = self.unchanged = 0
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM runs")
+            self._conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide run-state store, or None when incremental runs are off."""
+    global _store
+    if _store is None and not INCREMENTAL_RUNS:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RunStateStore()
+    return _store
+
+
+def set_store(store):
+    """Installs a store instance (e.g. one pointing at a temporary file). Pass None to reset."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,127 @@
+# src/staff_directory.py
+
+import threading
+from typing import NamedTuple
+
+# Used when an email is not in the HR list (same default as before the directory existed)
+FALLBACK_EMAIL = 'qmr@phmk.my'
+DEFAULT_FALLBACK = {'name': 'Default QMR', 'position': 'QMR', 'department': None, 'approval_role': 'Approver'}
+
+INDEXED_FIELDS = ('position', 'department', 'approval_role')
+
+
+class StaffRecord(NamedTuple):
+    """One immutable HR/IPSG list entry."""
+    email: str
+    name: str
+    position: str
+    department: str
+    approval_role: str
+
+    def to_dict(self):
+        """A fresh dict with the keys agents expect (name, position, department, approval_role, email)."""
+        return self._asdict()
+
+
+class StaffDirectory:
+    """
+    The HR/IPSG list as immutable records, indexed by email and by position, department
+    and approval_role. Built once per data load, so the rendered staff context and the
+    indexes are only rebuilt when the HR list is reloaded.
+    """
+
+    def __init__(self, records):
+        self._by_email = {}
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        for record in records:
+            if record.email in self._by_email:
+                continue
+            self._by_email[record.email] = record
+            for field in INDEXED_FIELDS:
+                self._indexes[field].setdefault(getattr(record, field), []).append(record)
+        self._indexes = {field: {key: tuple(group) for key, group in index.items()}
+                         for field, index in self._indexes.items()}
+        self._staff_context = None
+        self._stats = {'found': 0, 'fallback': 0, 'default': 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_hr_list(cls, hr_list):
+        """Builds the directory from the {email: {name, position, ...}} dict loaded from the CSV."""
+        def clean(value):
+            # Empty CSV cells arrive as NaN
+            return None if value != value else value
+
+        return cls(
+            StaffRecord(email, clean(info.get('name')), clean(info.get('position')),
+                        clean(info.get('department')), clean(info.get('approval_role')))
+            for email, info in hr_list.items()
+        )
+
+    def __len__(self):
+        return len(self._by_email)
+
+    def __contains__(self, email):
+        return email in self._by_email
+
+    def __iter__(self):
+        return iter(self._by_email.values())
+
+    def get(self, email):
+        """The staff record for `email`, or None."""
+        return self._by_email.get(email)
+
+    # --- Secondary Indexes ---
+
+    def by_position(self, position):
+        return self._indexes['position'].get(position, ())
+
+    def by_department(self, department):
+        return self._indexes['department'].get(department, ())
+
+    def by_approval_role(self, approval_role):
+        return self._indexes['approval_role'].get(approval_role, ())
+
+    def find(self, position=None, department=None, approval_role=None):
+        """Records matching every given field, in HR list order."""
+        criteria = [(field, value) for field, value in
+                    (('position', position), ('department', department), ('approval_role', approval_role))
+                    if value is not None]
+        if not criteria:
+            return tuple(self)
+        # Start from the smallest index group and filter the rest
+        groups = sorted((self._indexes[field].get(value, ()) for field, value in criteria), key=len)
+        return tuple(record for record in groups[0]
+                     if all(getattr(record, field) == value for field, value in criteria))
+
+    # --- Rendering and Resolution ---
+
+    def staff_context(self):
+        """The staff list as rendered for LLM prompts, built once per directory."""
+        if self._staff_context is None:
+            self._staff_context = "\n".join(
+                f"{record.name} ({record.position}), Email: {record.email}" for record in self)
+        return self._staff_context
+
+    def resolve(self, email):
+        """
+        Looks up `email`, falling back to the QMR and then to a default QMR entry.
+        Returns (record dict copy, resolution) where resolution is 'found', 'fallback' or 'default'.
+        """
+        record = self._by_email.get(email)
+        if record is not None:
+            resolution, info = 'found', record.to_dict()
+        else:
+            fallback = self._by_email.get(FALLBACK_EMAIL)
+            if fallback is not None:
+                resolution, info = 'fallback', fallback.to_dict()
+            else:
+                resolution, info = 'default', dict(DEFAULT_FALLBACK, email=FALLBACK_EMAIL)
+        with self._stats_lock:
+            self._stats[resolution] += 1
+        return info, resolution
+
+    def resolution_stats(self):
+        """How often resolve() found the email, fell back to the QMR, or used the default entry."""
+        with self._stats_lock:
+            return dict(self._stats)
@@ -1,25 +1,28 @@
 # src/utils.py (Revised)
 
-import pandas as pd
 import json
 from datetime import datetime, date
 import os
+import threading
 from dotenv import load_dotenv
+from src import log_writer
 
 # --- Load Environment Variables ---
 load_dotenv()
 
 # --- Global Configuration ---
+# Folder holding the CSV/JSON inputs; read when the data is (re)loaded, so it can be changed before reload_data()
+DATA_DIR = os.getenv('DATA_DIR', 'data')
 LOGS_DIR = 'logs'
 COMMUNICATIONS_LOG_PATH = os.path.join(LOGS_DIR, 'communications_log.txt')
 ACTIVITY_LOG_PATH = os.path.join(LOGS_DIR, 'activity_log.txt')
-os.makedirs('data', exist_ok=True)
-os.makedirs(LOGS_DIR, exist_ok=True)
+# Set LOG_QUIET=1 to stop echoing every activity line to stdout
+LOG_QUIET = os.getenv('LOG_QUIET', '0').lower() in ('1', 'true', 'yes')
 
 # Set the current date for simulation (e.g., today: 2025-10-30)
-# NOTE: The expiration date check will be based on this. 
+# NOTE: The expiration date check will be based on this.
 # Documents D001 (03-15) and D002 (12-10) are ALREADY expired based on this date.
-CURRENT_DATE = date(2025, 10, 30) 
+CURRENT_DATE = date(2025, 10, 30)
 
 
 # --- Logging Helper (Kept simple and clean) ---
@@ -27,63 +30,177 @@ def log_activity(agent_name, action, detail):
     """Logs internal agent actions to the Activity Log."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] [{agent_name}] {action}: {detail}\n"
-    # Ensure logs directory exists before writing
-    os.makedirs(LOGS_DIR, exist_ok=True) 
-    with open(ACTIVITY_LOG_PATH, 'a') as f:
-        f.write(log_entry)
-    print(f"[{agent_name}] {action}: {detail}")
+    # Queued for the background writer, which creates the logs directory and appends in batches
+    log_writer.write(ACTIVITY_LOG_PATH, log_entry)
+    if not LOG_QUIET:
+        print(f"[{agent_name}] {action}: {detail}")
     return log_entry
 
-try:
-    # 1. Load HR/IPSG List: Use column names directly for consistency
-    HR_IPSG_DF = pd.read_csv('data/hr_ipsg_list.csv')
-
-    # NEW LINE HERE: Convert the DataFrame to the LIST/Dictionary format
-    # The dictionary key will be the email, and the value will be the staff info.
-    HR_IPSG_LIST = HR_IPSG_DF.set_index('email').to_dict('index')
-    
-    # 2. Load Documents: Pay attention to date formats
-    DOCUMENTS_DF = pd.read_csv('data/documents.csv')
-    # Use your exact date format (e.g., 2025-03-15)
-    DOCUMENTS_DF['Expiry_Date_dt'] = pd.to_datetime(
-        DOCUMENTS_DF['expiry_date'], format='%Y-%m-%d', errors='coerce'
-    ).dt.date
-    
-    # 3. Load JSON files
-    with open('data/consultant_application.json', 'r') as f:
-        CONSULTANT_APP = json.load(f)
-    with open('data/email_templates.json', 'r') as f:
-        EMAIL_TEMPLATES = json.load(f)
-    with open('data/policy_rules.json', 'r') as f:
-        POLICY_RULES = json.load(f)
-    
-    # Log the successful setup (this will be the very first log entry)
-    log_activity("Orchestrator", "Setup", "All data loaded and logging initialized.")
-
-except Exception as e:
-    print(f"!!! CRITICAL ERROR: Could not load required data files. Check 'data/' folder. Error: {e}")
-    # Initialize empty structures to prevent immediate crash
-    DOCUMENTS_DF, HR_IPSG_DF = pd.DataFrame(), pd.DataFrame()
-    POLICY_RULES, EMAIL_TEMPLATES, CONSULTANT_APP = {}, {}, {}
+
+def init_logs():
+    """
+    (Re-)initializes both log files with their headers. Called explicitly by the
+    orchestrator at the start of a run rather than as an import side effect.
+    """
+    # Anything still queued belongs to the previous run's files
+    log_writer.flush()
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    with open(ACTIVITY_LOG_PATH, 'w') as f:
+        f.write(f"--- Agentic Workflow Execution Log Start: {CURRENT_DATE} ---\n")
+    with open(COMMUNICATIONS_LOG_PATH, 'w') as f:
+        f.write(f"--- Simulated Communications Log Start: {CURRENT_DATE} ---\n")
+
+
+# --- Lazy Data Loading ---
+# Data files are read on first use and cached, so importing the agents (e.g. for a
+# trivial command) does not pay for pandas or the CSV/JSON parsing.
+_DATA = {}
+_DATA_LOCK = threading.RLock()
+# Callables run by reload_data(), e.g. to clear caches derived from the data
+_RELOAD_CALLBACKS = []
+
+def load_data():
+    """Loads every data file once and caches the results. Safe to call repeatedly and from threads."""
+    if _DATA:
+        return _DATA
+    with _DATA_LOCK:
+        if not _DATA:
+            _load_data_files()
+    return _DATA
+
+def _load_data_files():
+
+    import pandas as pd
+    from src import registry_store
+    from src.registry import DocumentRegistry
+    from src.staff_directory import StaffDirectory
+
+    # With REGISTRY_PERSISTENCE=1 the registry comes from its latest snapshot plus the write-ahead log
+    store = registry_store.get_store()
+
+    try:
+        # 1. Load HR/IPSG List: Use column names directly for consistency
+        hr_ipsg_df = pd.read_csv(os.path.join(DATA_DIR, 'hr_ipsg_list.csv'))
+
+        # Convert the DataFrame to the LIST/Dictionary format
+        # The dictionary key will be the email, and the value will be the staff info.
+        hr_ipsg_list = hr_ipsg_df.set_index('email').to_dict('index')
+
+        # 2. Load Documents: Pay attention to date formats
+        documents_df = store.load_snapshot() if store is not None else None
+        if documents_df is None:
+            documents_df = pd.read_csv(os.path.join(DATA_DIR, 'documents.csv'))
+        # Use your exact date format (e.g., 2025-03-15)
+        documents_df['Expiry_Date_dt'] = pd.to_datetime(
+            documents_df['expiry_date'], format='%Y-%m-%d', errors='coerce'
+        ).dt.date
+
+        # 3. Load JSON files
+        with open(os.path.join(DATA_DIR, 'consultant_application.json'), 'r') as f:
+            consultant_app = json.load(f)
+        with open(os.path.join(DATA_DIR, 'email_templates.json'), 'r') as f:
+            email_templates = json.load(f)
+        with open(os.path.join(DATA_DIR, 'policy_rules.json'), 'r') as f:
+            policy_rules = json.load(f)
+
+        log_activity("Orchestrator", "Setup", "All data loaded on first use.")
+
+    except Exception as e:
+        print(f"!!! CRITICAL ERROR: Could not load required data files. Check '{DATA_DIR}/' folder. Error: {e}")
+        # Initialize empty structures to prevent immediate crash
+        documents_df, hr_ipsg_df = pd.DataFrame(), pd.DataFrame()
+        hr_ipsg_list = {}
+        policy_rules, email_templates, consultant_app = {}, {}, {}
+
+    # Routing policy is optional: without it every document is routed by the LLM
+    try:
+        with open(os.path.join(DATA_DIR, 'routing_policy.json'), 'r') as f:
+            routing_policy = json.load(f)
+    except Exception as e:
+        print(f"!!! WARNING: Could not load routing policy. All routing will use the LLM. Error: {e}")
+        routing_policy = {}
+
+    # Index the registry by doc_id so agents never scan the full table per document
+    registry = DocumentRegistry(documents_df)
+
+    def publish_documents_df(df):
+        # Inserts replace registry.df; keep DOCUMENTS_DF pointing at the current frame
+        if _DATA.get('DOCUMENT_REGISTRY') is registry:
+            _DATA['DOCUMENTS_DF'] = df
+
+    registry.on_replace = publish_documents_df
+    if store is not None and not documents_df.empty:
+        snapshot_seq = store.stats()['snapshot_seq']
+        source = f"snapshot at change {snapshot_seq}" if snapshot_seq is not None else "documents.csv"
+        replayed = store.attach(registry)
+        log_activity("Orchestrator", "Registry Store", f"Registry loaded from {source}; {replayed} logged changes replayed.")
+
+    _DATA.update({
+        'DOCUMENTS_DF': registry.df,
+        'DOCUMENT_REGISTRY': registry,
+        'HR_IPSG_DF': hr_ipsg_df,
+        'HR_IPSG_LIST': hr_ipsg_list,
+        # Immutable staff records indexed by email, position, department and approval_role
+        'STAFF_DIRECTORY': StaffDirectory.from_hr_list(hr_ipsg_list),
+        'CONSULTANT_APP': consultant_app,
+        'EMAIL_TEMPLATES': email_templates,
+        'POLICY_RULES': policy_rules,
+        'ROUTING_POLICY': routing_policy,
+    })
+
+def on_reload(callback):
+    """Registers `callback` to run whenever reload_data() replaces the data."""
+    _RELOAD_CALLBACKS.append(callback)
+    return callback
+
+def reload_data():
+    """Drops the cached data so the next access re-reads the files."""
+    with _DATA_LOCK:
+        _DATA.clear()
+    for callback in _RELOAD_CALLBACKS:
+        callback()
+    return load_data()
+
+def get_document_registry():
+    return load_data()['DOCUMENT_REGISTRY']
+
+def get_hr_list():
+    return load_data()['HR_IPSG_LIST']
+
+def get_staff_directory():
+    return load_data()['STAFF_DIRECTORY']
+
+def get_consultant_app():
+    return load_data()['CONSULTANT_APP']
+
+def get_email_templates():
+    return load_data()['EMAIL_TEMPLATES']
+
+def get_policy_rules():
+    return load_data()['POLICY_RULES']
+
+def get_routing_policy():
+    return load_data()['ROUTING_POLICY']
+
+def __getattr__(name):
+    # Backwards compatibility: `src.utils.DOCUMENTS_DF` etc. still work, loading on first access
+    if name in ('DOCUMENTS_DF', 'DOCUMENT_REGISTRY', 'HR_IPSG_DF', 'HR_IPSG_LIST', 'STAFF_DIRECTORY', 'CONSULTANT_APP',
+                'EMAIL_TEMPLATES', 'POLICY_RULES', 'ROUTING_POLICY'):
+        return load_data()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_owner_info(email):
-    """Retrieves staff info from the HR_IPSG_LIST based on email using default CSV headers."""
-    info = HR_IPSG_LIST.get(email)
-    
-    if info:
-        info['email'] = email
-        # The returned dictionary uses keys: 'name', 'position', 'department', 'approval_role'
-        return info
-    else:
+    """
+    Retrieves staff info from the staff directory based on email, falling back to the QMR.
+    Returns a fresh dict (keys: 'name', 'position', 'department', 'approval_role', 'email'),
+    so callers can never modify the shared HR records.
+    """
+    info, resolution = get_staff_directory().resolve(email)
+    if resolution != 'found':
         log_activity("Utility", "Error", f"Staff email {email} not found in HR list. Defaulting to QMR.")
-        
-        qmr_email = 'qmr@phmk.my' 
-        # Ensure the fallback uses the correct keys: 'name', 'position', etc.
-        qmr_info = HR_IPSG_LIST.get(qmr_email, {'name': 'Default QMR', 'position': 'QMR', 'approval_role': 'Approver'})
-        qmr_info['email'] = qmr_email
-        return qmr_info
-
-# --- Initialize Communication Log (Moved here for dependency) ---
+    return info
+
+# --- Communication Log ---
 def log_communication(recipient, comm_type, subject, body):
     """Writes a log entry for a simulated communication."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -92,14 +209,11 @@ def log_communication(recipient, comm_type, subject, body):
         f"SUBJECT: {subject}\n"
         f"---BODY---\n{body}\n----------\n"
     )
-    with open(COMMUNICATIONS_LOG_PATH, 'a') as f:
-        f.write(log_entry)
-        
-    log_activity("Communication Agent", f"{comm_type} Sent", f"'{subject}' to {recipient}")
+    log_writer.write(COMMUNICATIONS_LOG_PATH, log_entry)
 
+    # Real delivery is opt-in (DELIVERY_ENABLED); imported here because delivery imports this module
+    from src import delivery
+    if delivery.DELIVERY_ENABLED:
+        delivery.enqueue(recipient, comm_type, subject, body)
 
-# Re-initialize the log files with headers (since they might have failed on previous runs)
-with open(ACTIVITY_LOG_PATH, 'w') as f:
-    f.write(f"--- Agentic Workflow Execution Log Start: {CURRENT_DATE} ---\n")
-with open(COMMUNICATIONS_LOG_PATH, 'w') as f:
-    f.write(f"--- Simulated Communications Log Start: {CURRENT_DATE} ---\n")
\ No newline at end of file
+    log_activity("Communication Agent", f"{comm_type} Sent", f"'{subject}' to {recipient}")
@@ -0,0 +1,40 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from src import llm_cache, llm_gateway, log_writer, metrics, registry_store, run_state, utils  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    """
+    Runs every test in a temporary directory (logs, caches and stores land there)
+    against the sample data folder, with the stub LLM backend, the response cache
+    bypassed and fresh telemetry and breakers.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, 'DATA_DIR', os.path.join(REPO_ROOT, 'data'))
+    monkeypatch.setattr(utils, 'LOG_QUIET', True)
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_BYPASS', True)
+    monkeypatch.setattr(llm_gateway, 'LLM_BACKOFF_BASE', 0.0)
+    llm_gateway.set_backend(llm_gateway.StubBackend(latency=0, failure_rate=0))
+    llm_gateway.reset_guards()
+    registry_store.set_store(None)
+    run_state.set_store(None)
+    metrics.reset()
+    utils.reload_data()
+    yield tmp_path
+    # Pending log lines use relative paths, so write them before leaving the directory
+    log_writer.flush()
+    llm_gateway.set_backend(None)
+    llm_gateway.reset_guards()
+    registry_store.set_store(None)
+    run_state.set_store(None)
+    utils.reload_data()
@@ -0,0 +1,150 @@
+# tests/test_agents.py
+
+import json
+import threading
+from datetime import timedelta
+
+from src import llm_gateway, utils
+from src.agents import communication_agent, document_expiry_agent, routing_role_agent
+from src.staff_directory import StaffDirectory, StaffRecord
+from src.utils import CURRENT_DATE
+
+
+# --- Batched Urgency Triage ---
+
+def prepared_documents(count):
+    return [({'doc_id': f"D{i:03d}", 'title': f"Policy {i:03d}", 'type': 'Policy', 'status': 'Active',
+              'Expiry_Date_dt': CURRENT_DATE + timedelta(days=20)}, 'Consultant') for i in range(count)]
+
+
+def test_stub_backend_answers_a_whole_batch_in_one_call():
+    backend = llm_gateway.StubBackend()
+    llm_gateway.set_backend(backend)
+    [batch] = document_expiry_agent.plan_batches(prepared_documents(5))
+    recommendations = document_expiry_agent.classify_batch(batch)
+    assert [r['urgency_level'] for r in recommendations] == ['Low'] * 5
+    assert backend.calls == 1
+
+
+def test_failed_batch_falls_back_without_per_document_calls():
+    def responder(model, contents, config):
+        raise llm_gateway.LLMServiceError("400 INVALID_ARGUMENT", code=400)
+
+    backend = llm_gateway.StubBackend(responder=responder, latency=0, failure_rate=0)
+    llm_gateway.set_backend(backend)
+    [batch] = document_expiry_agent.plan_batches(prepared_documents(5))
+    recommendations = document_expiry_agent.classify_batch(batch)
+    assert recommendations == [document_expiry_agent.FALLBACK_RECOMMENDATION] * 5
+    assert backend.calls == 1
+
+
+def test_items_missing_from_a_batch_response_are_classified_individually():
+    def responder(model, contents, config):
+        if 'DOCUMENTS:' in contents:
+            return json.dumps([{'doc_id': 'D000', 'urgency_level': 'High', 'recommended_action': 'escalate'}])
+        return json.dumps({'urgency_level': 'Low', 'recommended_action': 'send_email'})
+
+    backend = llm_gateway.StubBackend(responder=responder, latency=0, failure_rate=0)
+    llm_gateway.set_backend(backend)
+    [batch] = document_expiry_agent.plan_batches(prepared_documents(2))
+    high, low = document_expiry_agent.classify_batch(batch)
+    assert (high['urgency_level'], low['urgency_level']) == ('High', 'Low')
+    assert backend.calls == 2
+
+
+def test_batches_respect_the_prompt_budget():
+    prepared = prepared_documents(20)
+    line = len(document_expiry_agent.build_batch_line(*prepared[0]))
+    budget = len(document_expiry_agent.BATCH_PROMPT_HEADER) + 6 * line
+    batches = document_expiry_agent.plan_batches(prepared, prompt_budget=budget, max_batch_size=50)
+    assert [len(batch) for batch in batches] == [6, 6, 6, 2]
+
+
+# --- Templates ---
+
+def test_variants_for_different_contexts_are_drafted_concurrently(monkeypatch):
+    monkeypatch.setattr(communication_agent, '_variants', {})
+    monkeypatch.setattr(communication_agent, '_variant_locks', {})
+    both_drafting = threading.Barrier(2, timeout=5)
+    drafted = []
+
+    def draft(kind, urgency):
+        # Each draft waits for the other one, so it deadlocks if drafts are serialized
+        both_drafting.wait()
+        drafted.append(urgency)
+        return None
+
+    monkeypatch.setattr(communication_agent, 'draft_llm_variant', draft)
+    threads = [threading.Thread(target=communication_agent.get_llm_variant, args=('expiry_notice', urgency))
+               for urgency in ('High', 'Low')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(drafted) == ['High', 'Low']
+    # Drafted once per context class, even when the draft was rejected
+    assert communication_agent.get_llm_variant('expiry_notice', 'High') is None
+    assert len(drafted) == 2
+
+
+# --- Digests ---
+
+def test_digest_renders_with_built_in_templates(monkeypatch):
+    monkeypatch.setitem(utils.load_data(), 'EMAIL_TEMPLATES', {})
+    communication_agent.get_compiled_templates.cache_clear()
+    subject, body = communication_agent.render_digest('Ms. Lim', 'WhatsApp', [
+        ('request_sent', {'title': 'Blood Transfusion WI'}, None),
+        ('unknown_kind', {'title': 'Incident Form'}, None),
+    ])
+    communication_agent.get_compiled_templates.cache_clear()
+    assert subject == '2 document updates'
+    assert body.startswith('Hi Ms. Lim')
+    assert "- Your request for 'Blood Transfusion WI' has been sent" in body
+    assert body.endswith('- Incident Form')
+
+
+# --- Staff Directory and Routing Candidates ---
+
+STAFF = [
+    StaffRecord('a@phmk.my', 'A', 'Consultant', 'Medical', 'Owner'),
+    StaffRecord('b@phmk.my', 'B', 'Nurse', 'Medical', 'Reviewer'),
+    StaffRecord('c@phmk.my', 'C', 'Nurse', 'Nursing', 'Reviewer'),
+    StaffRecord('q@phmk.my', 'Q', 'QMR', 'Quality', 'Approver'),
+    StaffRecord('u@phmk.my', 'U', 'Unit Manager', 'Medical', 'Approver'),
+    StaffRecord('x@phmk.my', 'X', 'Pharmacist', 'Pharmacy', 'Owner'),
+]
+
+
+def emails(records):
+    return [record.email[0] for record in records]
+
+
+def test_routing_candidates_are_ranked_from_the_directory_indexes(monkeypatch):
+    monkeypatch.setitem(utils.load_data(), 'STAFF_DIRECTORY', StaffDirectory(STAFF))
+    routing_role_agent.ranked_candidates.cache_clear()
+    try:
+        reviewers, approvers = routing_role_agent.select_routing_candidates('a@phmk.my', k=3)
+        # The owner always reviews; then same-department reviewers and approvers, then senior staff
+        assert emails(reviewers) == ['a', 'b', 'u']
+        assert emails(approvers) == ['q', 'u', 'a']
+
+        reviewers, approvers = routing_role_agent.select_routing_candidates('nobody@phmk.my', k=3)
+        assert emails(reviewers) == ['q', 'u', 'b']
+        # Staff with no approver qualification are never offered
+        assert emails(approvers) == ['q', 'u']
+    finally:
+        routing_role_agent.ranked_candidates.cache_clear()
+
+
+def test_staff_directory_find_intersects_indexes():
+    directory = StaffDirectory(STAFF)
+    assert emails(directory.find(department='Medical', approval_role='Approver')) == ['u']
+    assert emails(directory.find(position='Nurse')) == ['b', 'c']
+    info, resolution = directory.resolve('missing@phmk.my')
+    assert resolution == 'default' and info['position'] == 'QMR'
+
+
+def test_owner_info_is_a_copy_of_the_shared_record():
+    info = utils.get_owner_info('qmr@phmk.my')
+    info['position'] = 'Changed'
+    assert utils.get_owner_info('qmr@phmk.my')['position'] != 'Changed'
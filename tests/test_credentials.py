@@ -0,0 +1,85 @@
+# tests/test_credentials.py
+
+from datetime import date
+
+from src import llm_gateway, utils
+from src.agents.credential_verification_agent import verify_consultant_applications
+from src.credential_matcher import CredentialMatcher, normalize_doc_name
+
+POLICY = {
+    'required_docs': ['C&P Form', 'APC', 'Indemnity', 'BLS'],
+    'expiry_threshold_days': 60,
+    'aliases': {'APC': ['Annual Practising Certificate'], 'BLS': ['Basic Life Support']},
+    'validity_years': {'APC': 1, 'Indemnity': 1, 'BLS': 2},
+}
+AS_OF = date(2025, 10, 30)
+
+
+def application(name, docs):
+    return {'name': name, 'email': f"{name.lower()}@phmk.my", 'specialty': 'Cardiology', 'submitted_docs': docs}
+
+
+def test_normalize_doc_name():
+    assert normalize_doc_name('APC_2025.pdf') == 'apc 2025'
+    assert normalize_doc_name('Basic-Life  Support.PDF') == 'basic life support'
+
+
+def test_evidence_table_matches_aliases_and_validity_dates():
+    matcher = CredentialMatcher.from_policy(POLICY)
+    table = matcher.evidence_table([application('A', [
+        'C&P Form.pdf', 'Annual Practising Certificate 2025.pdf', 'BLS_2024.pdf',
+        'Indemnity_2025-11-15.pdf', 'Indemnity_2024.pdf', 'CV.docx',
+    ])], AS_OF)
+    rows = {row['file']: row for row in table.to_dict('records')}
+
+    assert rows['C&P Form.pdf']['status'] == 'no_expiry'
+    assert rows['Annual Practising Certificate 2025.pdf']['category'] == 'APC'
+    # Two-year validity: a 2024 BLS certificate runs to the end of 2025
+    assert rows['BLS_2024.pdf']['valid_until'] == date(2025, 12, 31)
+    assert rows['BLS_2024.pdf']['status'] == 'valid'
+    # A full date is the expiry date itself
+    assert rows['Indemnity_2025-11-15.pdf']['days_remaining'] == 16
+    assert rows['Indemnity_2025-11-15.pdf']['status'] == 'expiring'
+    assert rows['Indemnity_2024.pdf']['status'] == 'expired'
+    assert rows['CV.docx']['status'] == 'unmatched'
+    assert rows['CV.docx']['category'] is None
+
+
+def test_assess_reports_missing_expiring_and_unmatched_per_application():
+    matcher = CredentialMatcher.from_policy(POLICY)
+    complete, partial, empty = matcher.assess([
+        application('A', ['C&P Form.pdf', 'APC_2025.pdf', 'Indemnity_2025.pdf', 'BLS_2024.pdf']),
+        application('B', ['C&P Form.pdf', 'APC_2024.pdf', 'scan001.pdf']),
+        application('C', []),
+    ], AS_OF)
+
+    assert complete['missing_docs'] == [] and complete['expiring_docs'] == []
+    assert partial['missing_docs'] == ['Indemnity', 'BLS']
+    assert partial['expiring_docs'] == ['APC']
+    assert partial['unmatched_docs'] == ['scan001.pdf']
+    assert empty['missing_docs'] == POLICY['required_docs'] and empty['evidence'] == []
+
+
+def test_bulk_verification_decides_clear_cases_locally(monkeypatch):
+    monkeypatch.setitem(utils.load_data(), 'POLICY_RULES', POLICY)
+    backend = llm_gateway.current_backend()
+    results = list(verify_consultant_applications([
+        application('A', ['C&P Form.pdf', 'APC_2025.pdf', 'Indemnity_2025.pdf', 'BLS_2024.pdf']),
+        application('B', ['C&P Form.pdf', 'APC_2025.pdf']),
+        application('C', ['C&P Form.pdf', 'APC_2025.pdf', 'scan001.pdf']),
+    ]))
+
+    assert [(r['is_compliant'], r['decision_path']) for r in results[:2]] == [(True, 'rule'), (False, 'rule')]
+    # A missing document plus an unrecognized file is ambiguous, so only that one goes to the LLM
+    assert results[2]['decision_path'] == 'llm'
+    assert backend.calls == 1
+
+
+def test_bulk_verification_fails_closed_without_required_docs(monkeypatch):
+    monkeypatch.setitem(utils.load_data(), 'POLICY_RULES', {})
+    results = list(verify_consultant_applications([
+        application('A', ['C&P Form.pdf', 'APC_2025.pdf', 'Indemnity_2025.pdf', 'BLS_2024.pdf']),
+    ]))
+    assert results[0]['is_compliant'] is False
+    assert results[0]['decision_path'] == 'fallback'
+    assert llm_gateway.current_backend().calls == 0
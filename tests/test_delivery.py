@@ -0,0 +1,102 @@
+# tests/test_delivery.py
+
+import sqlite3
+
+import pytest
+
+from src import delivery
+from src.delivery import DeliveryService, OutboundQueue
+
+
+@pytest.fixture
+def outbound(tmp_path, monkeypatch):
+    monkeypatch.setattr(delivery, 'DELIVERY_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(delivery, 'DELIVERY_BACKOFF_SECONDS', 0.0)
+    return OutboundQueue(str(tmp_path / 'outbound.sqlite'))
+
+
+def flaky_transport(failures):
+    """Fails the first `failures` sends, then records every message it is given."""
+    sent = []
+
+    def send(message):
+        nonlocal failures
+        if failures > 0:
+            failures -= 1
+            raise ConnectionError("SMTP connection dropped")
+        sent.append(message['recipient'])
+    send.sent = sent
+    return send
+
+
+def test_channel_for_maps_log_types():
+    assert delivery.channel_for('Email (C&P)') == 'email'
+    assert delivery.channel_for('WhatsApp (Digest)') == 'whatsapp'
+
+
+def test_failed_sends_are_retried_until_they_succeed(outbound):
+    transport = flaky_transport(1)
+    service = DeliveryService(outbound, transports={'email': transport}, rates={})
+    message_id = outbound.enqueue('email', 'a@phmk.my', 'Subject', 'Body')
+
+    [message] = outbound.claim(10)
+    service.deliver(message)
+    assert outbound.status(message_id)['status'] == 'queued'
+
+    [message] = outbound.claim(10)
+    service.deliver(message)
+    assert outbound.status(message_id) == {'status': 'sent', 'attempts': 2, 'last_error': None}
+    assert transport.sent == ['a@phmk.my']
+
+
+def test_messages_fail_after_the_last_attempt(outbound):
+    service = DeliveryService(outbound, transports={'email': flaky_transport(10)}, rates={})
+    message_id = outbound.enqueue('email', 'a@phmk.my', 'Subject', 'Body')
+    for _ in range(delivery.DELIVERY_MAX_ATTEMPTS):
+        [message] = outbound.claim(10)
+        service.deliver(message)
+    status = outbound.status(message_id)
+    assert status['status'] == 'failed'
+    assert status['attempts'] == delivery.DELIVERY_MAX_ATTEMPTS
+    assert 'dropped' in status['last_error']
+    assert outbound.claim(10) == []
+
+
+def test_channels_without_a_transport_are_skipped(outbound):
+    service = DeliveryService(outbound, transports={'email': flaky_transport(0)}, rates={})
+    message_id = outbound.enqueue('whatsapp', '+60123', 'Subject', 'Body')
+    [message] = outbound.claim(10)
+    service.deliver(message)
+    assert outbound.status(message_id)['status'] == 'skipped'
+
+
+def test_interrupted_sends_are_requeued_and_drained(outbound):
+    transport = flaky_transport(1)
+    for n in range(5):
+        outbound.enqueue('email', f"user{n}@phmk.my", 'Subject', 'Body')
+    # A crashed run left two messages claimed but never sent
+    outbound.claim(2)
+    assert outbound.counts() == {'sending': 2, 'queued': 3}
+
+    service = DeliveryService(outbound, transports={'email': transport}, rates={'email': 0}, workers=2).start()
+    assert service.drain(timeout=10) == {'sent': 5}
+    assert sorted(transport.sent) == [f"user{n}@phmk.my" for n in range(5)]
+
+
+def test_a_failed_status_update_requeues_the_message(outbound, monkeypatch):
+    transport = flaky_transport(0)
+    message_id = outbound.enqueue('email', 'a@phmk.my', 'Subject', 'Body')
+    mark_sent = outbound.mark_sent
+    failures = iter([True])
+
+    def flaky_mark_sent(message_id):
+        if next(failures, False):
+            raise sqlite3.OperationalError("database is locked")
+        mark_sent(message_id)
+
+    monkeypatch.setattr(outbound, 'mark_sent', flaky_mark_sent)
+    service = DeliveryService(outbound, transports={'email': transport}, rates={}, workers=1).start()
+    # The sender thread survives the error, so the requeued message is sent and drain() returns
+    assert service.drain(timeout=10) == {'sent': 1}
+    assert outbound.status(message_id)['attempts'] == 1
+    assert transport.sent == ['a@phmk.my', 'a@phmk.my']
@@ -0,0 +1,219 @@
+# tests/test_llm_gateway.py
+
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from src import llm_cache, llm_gateway, metrics
+from src.rate_limit import TokenBucket
+
+MODEL = 'gemini-2.5-flash'
+
+
+class ScriptedBackend(llm_gateway.StubBackend):
+    """Stub backend that fails while `failing` is set, with a transient 503."""
+
+    def __init__(self):
+        super().__init__(reply='ok', latency=0, failure_rate=0)
+        self.failing = True
+
+    def _simulate_service(self):
+        self.calls += 1
+        if self.failing:
+            raise llm_gateway.LLMServiceError("503 UNAVAILABLE", code=503)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'LLM_MAX_RETRIES', 2)
+    backend = ScriptedBackend()
+    llm_gateway.set_backend(backend)
+    breaker = llm_gateway.get_guard(MODEL).breaker
+    breaker.threshold = 1
+    breaker.reset_seconds = 0.05
+    return backend
+
+
+def open_breaker(breaker, elapsed):
+    """Pretends the breaker opened `elapsed` seconds ago."""
+    breaker.opened_at = llm_gateway.time.monotonic() - elapsed
+
+
+# --- Circuit Breaker ---
+
+def test_breaker_opens_after_retries_are_exhausted(backend):
+    with pytest.raises(llm_gateway.LLMServiceError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+    assert backend.calls == llm_gateway.LLM_MAX_RETRIES + 1
+    assert llm_gateway.get_guard(MODEL).breaker.state == 'open'
+
+    with pytest.raises(llm_gateway.CircuitOpenError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+    assert backend.calls == llm_gateway.LLM_MAX_RETRIES + 1
+
+
+def test_short_circuits_are_counted_under_their_own_outcome(backend):
+    for expected in (llm_gateway.LLMServiceError, llm_gateway.CircuitOpenError):
+        with pytest.raises(expected):
+            llm_gateway.generate_content(MODEL, 'prompt', agent='AI Review Agent')
+    outcomes = {labels['outcome']: value for name, labels, value in metrics.snapshot()['counters']
+                if name == 'llm_calls_total'}
+    assert outcomes == {'error': 1, 'short_circuit': 1}
+
+
+def test_breaker_recovers_after_a_failed_half_open_trial(backend):
+    breaker = llm_gateway.get_guard(MODEL).breaker
+    with pytest.raises(llm_gateway.LLMServiceError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+
+    # The half-open trial keeps its retries; when they all fail the breaker opens again
+    open_breaker(breaker, breaker.reset_seconds)
+    assert breaker.state == 'half_open'
+    with pytest.raises(llm_gateway.LLMServiceError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+    assert breaker.state == 'open'
+
+    # Once the service is back, the next trial closes it
+    backend.failing = False
+    open_breaker(breaker, breaker.reset_seconds)
+    assert llm_gateway.generate_content(MODEL, 'prompt').text == 'ok'
+    assert breaker.state == 'closed'
+    assert llm_gateway.generate_content(MODEL, 'prompt').text == 'ok'
+
+
+def test_cancelled_half_open_trial_releases_the_breaker(backend):
+    breaker = llm_gateway.get_guard(MODEL).breaker
+    with pytest.raises(llm_gateway.LLMServiceError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+    open_breaker(breaker, breaker.reset_seconds)
+
+    async def cancelled_trial():
+        task = asyncio.ensure_future(llm_gateway.generate_content_async(MODEL, 'prompt'))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    backend.latency = 1.0
+    asyncio.run(cancelled_trial())
+    backend.latency, backend.failing = 0, False
+    assert llm_gateway.generate_content(MODEL, 'prompt').text == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_non_transient_errors_are_not_retried():
+    def responder(model, contents, config):
+        raise llm_gateway.LLMServiceError("400 INVALID_ARGUMENT", code=400)
+
+    backend = llm_gateway.StubBackend(responder=responder, latency=0, failure_rate=0)
+    llm_gateway.set_backend(backend)
+    with pytest.raises(llm_gateway.LLMServiceError):
+        llm_gateway.generate_content(MODEL, 'prompt')
+    assert backend.calls == 1
+    assert llm_gateway.get_guard(MODEL).breaker.state == 'closed'
+
+
+# --- Token Buckets ---
+
+def test_token_bucket_admits_a_burst_then_reports_the_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.1, abs=0.02)
+
+
+def test_token_bucket_lets_oversized_requests_through_when_full():
+    bucket = TokenBucket(rate=1, capacity=5)
+    assert bucket.try_acquire(50) == 0.0
+    assert bucket.try_acquire(1) > 0
+
+
+def test_token_bucket_release_returns_tokens():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.try_acquire() == 0.0
+    bucket.release()
+    assert bucket.try_acquire() == 0.0
+
+
+def test_token_bucket_with_zero_rate_never_limits():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.try_acquire(100) == 0.0 for _ in range(10))
+
+
+def test_token_wait_gives_the_request_token_back():
+    guard = llm_gateway.ModelGuard(MODEL)
+    guard.requests = TokenBucket(rate=1, capacity=1)
+    guard.tokens = TokenBucket(rate=1, capacity=10)
+    guard.tokens.try_acquire(10)
+    assert guard.wait_time(5) > 0
+    # The request token was released, so a call within the token budget is admitted
+    guard.tokens.release(10)
+    assert guard.wait_time(5) == 0.0
+
+
+# --- Response Cache ---
+
+def test_cache_skips_responses_that_do_not_parse(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_BYPASS', False)
+    cache = llm_cache.LLMResponseCache('cache.sqlite')
+    llm_cache.set_cache(cache)
+    replies = iter(['{not json', json.dumps({'ok': True})])
+    backend = llm_gateway.StubBackend(responder=lambda *args: next(replies), latency=0, failure_rate=0)
+    llm_gateway.set_backend(backend)
+    config = {'response_mime_type': 'application/json'}
+    try:
+        assert llm_gateway.generate_content(MODEL, 'p', config, agent='AI Review Agent').text == '{not json'
+        assert llm_gateway.generate_content(MODEL, 'p', config, agent='AI Review Agent').text == '{"ok": true}'
+        assert llm_gateway.generate_content(MODEL, 'p', config, agent='AI Review Agent').text == '{"ok": true}'
+    finally:
+        llm_cache.set_cache(None)
+    assert backend.calls == 2
+
+
+def test_cache_evicts_least_recently_used_entries_periodically(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_EVICT_EVERY', 5)
+    # A ticking clock, so every put has a distinct last_access
+    clock = iter(range(1_000_000))
+    monkeypatch.setattr(llm_cache.time, 'time', lambda: float(next(clock)))
+    cache = llm_cache.LLMResponseCache('cache.sqlite', max_entries=3)
+    for i in range(4):
+        cache.put(f"k{i}", 'text', agent='AI Review Agent')
+    assert cache.stats()['entries'] == 4
+    cache.put('k4', 'text', agent='AI Review Agent')
+    assert cache.stats()['entries'] == 3
+    assert cache.get('k0') is None
+    assert cache.get('k4') == 'text'
+
+
+class LockedCache(llm_cache.LLMResponseCache):
+    """A cache whose reads or writes fail the way a busy SQLite file does."""
+
+    def __init__(self, path, failing):
+        super().__init__(path)
+        self.failing = failing
+
+    def get(self, key):
+        if self.failing == 'get':
+            raise sqlite3.OperationalError("database is locked")
+        return super().get(key)
+
+    def put(self, key, text, agent=None):
+        if self.failing == 'put':
+            raise sqlite3.OperationalError("database is locked")
+        return super().put(key, text, agent=agent)
+
+
+@pytest.mark.parametrize('failing', ['get', 'put'])
+def test_cache_errors_do_not_fail_the_call(monkeypatch, failing):
+    monkeypatch.setattr(llm_cache, 'LLM_CACHE_BYPASS', False)
+    llm_cache.set_cache(LockedCache('cache.sqlite', failing))
+    backend = llm_gateway.StubBackend(reply='ok', latency=0, failure_rate=0)
+    llm_gateway.set_backend(backend)
+    try:
+        assert llm_gateway.generate_content(MODEL, 'p', agent='AI Review Agent').text == 'ok'
+        assert llm_gateway.generate_content(MODEL, 'p', agent='AI Review Agent').text == 'ok'
+    finally:
+        llm_cache.set_cache(None)
+    assert backend.calls == 2
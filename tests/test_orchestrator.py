@@ -0,0 +1,98 @@
+# tests/test_orchestrator.py
+
+import os
+
+import pytest
+
+from benchmarks.synthetic import write_dataset
+from src import metrics, utils
+from src.agents import main_orchestrator
+from src.agents.document_expiry_agent import get_expiring_documents
+from conftest import REPO_ROOT
+
+
+def totals(snapshot):
+    """Counter values and histogram observation counts, summed per metric name."""
+    result = {}
+    for name, _, value in snapshot['counters']:
+        result[name] = result.get(name, 0) + value
+    for name, _, histogram in snapshot['histograms']:
+        result[name] = result.get(name, 0) + histogram['count']
+    return result
+
+
+@pytest.fixture
+def expiring_docs():
+    docs = get_expiring_documents(check_days=400)
+    metrics.reset()
+    assert len(docs) >= 2
+    return docs
+
+
+def test_sharded_run_renews_the_same_documents_as_a_single_process(expiring_docs):
+    sequential = main_orchestrator.run_process_a_shard(expiring_docs)['renewed']
+    utils.reload_data()
+
+    result = main_orchestrator.run_process_a_sharded(expiring_docs, shards=2, shard_by='hash')
+    assert result['docs_renewed'] == len(sequential) > 0
+    # The cache is bypassed in code only; the pool initializer hands that to the spawned workers
+    assert not os.path.exists(os.path.join('logs', 'llm_cache.sqlite'))
+
+
+def test_a_worker_running_several_shards_reports_each_shard_once(expiring_docs):
+    expected = totals(main_orchestrator.run_process_a_shard(expiring_docs)['telemetry'])
+
+    # The same worker process runs two shards back to back; merging both must not double count
+    first = main_orchestrator.run_process_a_shard(expiring_docs[:1])
+    second = main_orchestrator.run_process_a_shard(expiring_docs[1:])
+    metrics.reset()
+    metrics.merge(first['telemetry'])
+    metrics.merge(second['telemetry'])
+
+    assert expected['llm_calls_total'] > 0
+    assert totals(metrics.snapshot()) == expected
+
+
+def test_sharded_run_reports_the_same_telemetry_as_a_single_process(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / 'synthetic')
+    write_dataset(data_dir, documents=300, staff=20, source_dir=os.path.join(REPO_ROOT, 'data'))
+    # Set in code only: the pool initializer hands the data folder to the spawned workers
+    monkeypatch.setattr(utils, 'DATA_DIR', data_dir)
+    utils.reload_data()
+    docs = get_expiring_documents()
+    assert all(main_orchestrator.partition_documents(docs, 3))
+
+    metrics.reset()
+    main_orchestrator.run_process_a_shard(docs)
+    sequential = totals(metrics.snapshot())
+
+    utils.reload_data()
+    metrics.reset()
+    main_orchestrator.run_process_a_sharded(docs, shards=3, shard_by='hash')
+    sharded = totals(metrics.snapshot())
+    # The coordinator makes no LLM calls of its own, so every call counted here came from a worker
+    assert sharded['llm_calls_total'] == sequential['llm_calls_total'] > 0
+    assert sharded['agent_function_seconds'] == sequential['agent_function_seconds']
+
+
+def test_streaming_run_reports_triage_decision_paths(monkeypatch):
+    docs = get_expiring_documents()
+    expected = {path: sum(doc['decision_path'] == path for doc in docs) for path in ('rule', 'llm', 'fallback')}
+    summaries = []
+    monkeypatch.setattr(main_orchestrator, 'log_triage_summary', lambda found, counts: summaries.append((found, counts)))
+
+    main_orchestrator.run_process_a_streaming()
+    assert summaries == [(len(docs), expected)]
+
+
+def test_incomplete_application_notice_lists_only_what_applies(monkeypatch):
+    sent = []
+    monkeypatch.setattr(main_orchestrator, 'log_communication', lambda *args: sent.append(args))
+    result = {'applicant': 'Dr. Tan', 'email': 'tan@phmk.my', 'specialty': 'Cardiology', 'is_compliant': False,
+              'missing_docs': [], 'expiring_docs': ['APC']}
+    assert main_orchestrator.complete_cp_case(result) == 0
+
+    [(recipient, _, _, body)] = sent
+    assert recipient == 'tan@phmk.my'
+    assert 'missing' not in body
+    assert 'must be renewed: APC.' in body
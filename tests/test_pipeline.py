@@ -0,0 +1,78 @@
+# tests/test_pipeline.py
+
+import threading
+import time
+
+from src.pipeline import Stage, run_pipeline
+
+
+def test_items_flow_through_every_stage():
+    results = []
+    stats = run_pipeline(range(20), [
+        Stage('double', lambda x: x * 2, concurrency=3),
+        Stage('keep_multiples_of_four', lambda x: x if x % 4 == 0 else None, concurrency=2),
+    ], queue_size=2, sink=results.append)
+
+    assert sorted(results) == list(range(0, 40, 4))
+    assert stats['double']['processed'] == 20
+    assert stats['keep_multiples_of_four']['processed'] == 20
+    assert stats['double']['first_completed_s'] is not None
+
+
+def test_stage_errors_are_counted_and_do_not_stop_the_stream():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    results = []
+    stats = run_pipeline(range(6), [Stage('check', fail_on_three, concurrency=2)], sink=results.append)
+    assert sorted(results) == [0, 1, 2, 4, 5]
+    assert stats['check'] == {'processed': 5, 'errors': 1, 'first_completed_s': stats['check']['first_completed_s']}
+
+
+def test_bounded_queues_apply_back_pressure():
+    consumed = []
+    consumed_at_yield = []
+    lock = threading.Lock()
+
+    def source():
+        for item in range(50):
+            with lock:
+                consumed_at_yield.append(len(consumed))
+            yield item
+
+    def slow(x):
+        time.sleep(0.001)
+        with lock:
+            consumed.append(x)
+        return x
+
+    run_pipeline(source(), [Stage('slow', slow)], queue_size=4)
+    assert len(consumed) == 50
+    # The source never runs more than the queue plus the items held by the feeder and worker ahead
+    assert max(produced - done for produced, done in enumerate(consumed_at_yield)) <= 4 + 2
+
+
+def test_source_errors_end_the_stream_cleanly():
+    def source():
+        yield 1
+        yield 2
+        raise RuntimeError("input went away")
+
+    results = []
+    run_pipeline(source(), [Stage('identity', lambda x: x)], sink=results.append)
+    assert results == [1, 2]
+
+
+def test_sink_errors_are_counted_and_do_not_hang_the_pipeline():
+    results = []
+
+    def sink(item):
+        if item == 2:
+            raise OSError("disk full")
+        results.append(item)
+
+    stats = run_pipeline(range(5), [Stage('first', lambda x: x, concurrency=2), Stage('last', lambda x: x)], sink=sink)
+    assert sorted(results) == [0, 1, 3, 4]
+    assert (stats['last']['processed'], stats['last']['errors']) == (4, 1)
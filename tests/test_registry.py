@@ -0,0 +1,155 @@
+# tests/test_registry.py
+
+import json
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from src import registry_store, utils
+from src.registry import DocumentRegistry
+from src.registry_store import RegistryStore
+
+
+def make_registry():
+    df = pd.DataFrame({
+        'doc_id': ['D1', 'D2', 'D3', 'D4'],
+        'title': ['Policy A', 'WI B', 'Form C', 'Policy D'],
+        'expiry_date': ['2025-11-01', '2025-10-01', 'not a date', '2026-01-15'],
+        'status': ['Active', 'Active', 'Active', 'Archived'],
+    })
+    df['Expiry_Date_dt'] = pd.to_datetime(df['expiry_date'], format='%Y-%m-%d', errors='coerce').dt.date
+    return DocumentRegistry(df)
+
+
+# --- Indexes ---
+
+def test_lookup_and_bulk_update_by_doc_id():
+    registry = make_registry()
+    assert registry.get('D2')['title'] == 'WI B'
+    assert registry.get('missing') is None
+    assert registry.update_statuses(['D1', 'missing', 'D3'], 'Renewed') == ['D1', 'D3']
+    assert registry.df['status'].tolist() == ['Renewed', 'Active', 'Renewed', 'Archived']
+
+
+def test_expiring_before_uses_the_expiry_index():
+    registry = make_registry()
+    assert registry.expiring_before(date(2025, 11, 1))['doc_id'].tolist() == ['D1', 'D2']
+    assert registry.expiring_before(date(2026, 12, 31), status=None)['doc_id'].tolist() == ['D1', 'D2', 'D4']
+
+    registry.update_field(['D2'], 'Expiry_Date_dt', date(2027, 1, 1))
+    assert registry.expiring_before(date(2025, 11, 1))['doc_id'].tolist() == ['D1']
+
+
+def test_expiring_windows_match_single_queries():
+    registry = make_registry()
+    windows = registry.expiring_windows(date(2025, 10, 1), windows=(0, 31, 120))
+    for days, rows in windows.items():
+        cutoff = pd.Timestamp(date(2025, 10, 1)) + pd.Timedelta(days=days)
+        assert rows['doc_id'].tolist() == registry.expiring_before(cutoff.date())['doc_id'].tolist()
+
+
+def test_insert_extends_the_index_and_rejects_duplicates():
+    registry = make_registry()
+    registry.insert([{'doc_id': 'D5', 'title': 'New', 'expiry_date': '2025-10-15', 'status': 'Active'}])
+    assert registry.position('D5') == 4
+    assert 'D5' in registry.expiring_before(date(2025, 10, 31))['doc_id'].tolist()
+    with pytest.raises(ValueError):
+        registry.insert([{'doc_id': 'D1', 'title': 'Again'}])
+
+
+def test_insert_publishes_the_new_frame_to_documents_df():
+    registry = utils.get_document_registry()
+    before = len(utils.DOCUMENTS_DF)
+    registry.insert([{'doc_id': 'D999', 'title': 'Inserted', 'expiry_date': '2026-01-01', 'status': 'Active'}])
+    assert utils.DOCUMENTS_DF is registry.df
+    assert len(utils.load_data()['DOCUMENTS_DF']) == before + 1
+
+
+# --- Write-Ahead Log and Snapshots ---
+
+def attach_store(directory, compact_every=1000):
+    store = RegistryStore(str(directory), compact_every=compact_every, fmt='pickle')
+    registry = DocumentRegistry(reload_frame(store))
+    store.attach(registry)
+    return store, registry
+
+
+def reload_frame(store):
+    df = store.load_snapshot()
+    if df is None:
+        df = make_registry().df
+    else:
+        df['Expiry_Date_dt'] = pd.to_datetime(df['expiry_date'], format='%Y-%m-%d', errors='coerce').dt.date
+    return df
+
+
+def test_wal_replay_restores_updates_and_inserts(tmp_path):
+    store, registry = attach_store(tmp_path / 'store')
+    registry.update_review_dates(['D1', 'D2'], date(2025, 10, 30))
+    registry.insert([{'doc_id': 'D5', 'title': 'New', 'expiry_date': '2026-02-01', 'status': 'Active'}])
+    registry.update_statuses(['D5', 'D1'], 'Active (Renewed)')
+    registry.update_statuses(['D1'], 'Archived')
+    store.close()
+
+    restarted_store, restarted = attach_store(tmp_path / 'store')
+    assert restarted_store.wal_records == 4
+    assert restarted.get('D1')['status'] == 'Archived'
+    assert restarted.get('D2')['review_date'] == '2025-10-30'
+    assert restarted.get('D5')['status'] == 'Active (Renewed)'
+    assert restarted.df.drop(columns='Expiry_Date_dt').equals(registry.df.drop(columns='Expiry_Date_dt'))
+
+
+def test_compaction_writes_a_snapshot_and_truncates_the_log(tmp_path):
+    store, registry = attach_store(tmp_path / 'store', compact_every=3)
+    for doc_id in ('D1', 'D2', 'D3', 'D4'):
+        registry.update_statuses([doc_id], 'Renewed')
+    store.close()
+    assert store.compactions == 1
+    assert store.stats()['snapshot_seq'] == 3
+    assert store.wal_records == 1
+
+    restarted_store, restarted = attach_store(tmp_path / 'store', compact_every=3)
+    assert restarted_store.wal_records == 1
+    assert restarted.df['status'].tolist() == ['Renewed'] * 4
+
+
+def test_replay_ignores_a_torn_last_record(tmp_path):
+    store, registry = attach_store(tmp_path / 'store')
+    registry.update_statuses(['D1'], 'Renewed')
+    store.close()
+    with open(store.wal_path, 'a') as f:
+        f.write(json.dumps({'op': 'update', 'column': 'status', 'doc_ids': ['D2'], 'value': 'X'})[:20])
+
+    _, restarted = attach_store(tmp_path / 'store')
+    assert restarted.get('D1')['status'] == 'Renewed'
+    assert restarted.get('D2')['status'] == 'Active'
+
+
+def test_writes_after_a_torn_record_survive_a_restart(tmp_path):
+    store, registry = attach_store(tmp_path / 'store')
+    registry.update_statuses(['D1'], 'Renewed')
+    store.close()
+    with open(store.wal_path, 'a') as f:
+        f.write(json.dumps({'op': 'update', 'column': 'status', 'doc_ids': ['D2'], 'value': 'X'})[:20])
+
+    # The torn record is cut off on attach, so the next write starts on a clean line
+    store, registry = attach_store(tmp_path / 'store')
+    registry.update_statuses(['D3'], 'Renewed')
+    store.close()
+
+    restarted_store, restarted = attach_store(tmp_path / 'store')
+    assert restarted_store.wal_records == 2
+    assert restarted.get('D2')['status'] == 'Active'
+    assert restarted.get('D3')['status'] == 'Renewed'
+
+
+def test_replay_coalesces_updates_last_write_wins():
+    registry = make_registry()
+    registry_store.replay(registry, [
+        {'op': 'update', 'column': 'status', 'doc_ids': ['D1', 'D2'], 'value': 'A'},
+        {'op': 'update', 'column': 'status', 'doc_ids': ['D2'], 'value': ['B']},
+    ])
+    assert registry.df['status'].tolist()[:2] == ['A', 'B']
+    with pytest.raises(ValueError):
+        registry_store.replay(registry, [{'op': 'drop'}])
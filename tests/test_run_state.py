@@ -0,0 +1,56 @@
+# tests/test_run_state.py
+
+import pandas as pd
+
+from src.run_state import RunStateStore
+
+DOCS = pd.DataFrame({
+    'doc_id': ['D1', 'D2', 'D3'],
+    'title': ['Policy A', 'WI B', 'Form C'],
+    'owner_email': ['a@phmk.my', 'b@phmk.my', 'c@phmk.my'],
+    'expiry_date': ['2025-11-01', '2025-11-15', '2025-12-01'],
+    'status': ['Active', 'Active', 'Active'],
+})
+
+
+def record_all(store, docs, run_date, notified=True):
+    for doc in docs.to_dict('records'):
+        store.record(doc, run_date, notified=notified, renewed=False)
+
+
+def test_first_run_processes_every_document(tmp_path):
+    store = RunStateStore(str(tmp_path / 'state.sqlite'))
+    to_process, unchanged = store.select_delta(DOCS)
+    assert to_process['doc_id'].tolist() == ['D1', 'D2', 'D3']
+    assert unchanged.empty
+
+
+def test_only_new_or_changed_documents_are_selected_again(tmp_path):
+    store = RunStateStore(str(tmp_path / 'state.sqlite'))
+    to_process, _ = store.select_delta(DOCS)
+    record_all(store, to_process, '2025-10-30')
+    store.complete_run('2025-10-30', started_at=0)
+    assert store.watermark() == '2025-10-30'
+
+    changed = DOCS.copy()
+    changed.loc[changed['doc_id'] == 'D2', 'expiry_date'] = '2026-11-15'
+    changed = pd.concat([changed, pd.DataFrame([{'doc_id': 'D4', 'title': 'New', 'owner_email': 'd@phmk.my',
+                                                 'expiry_date': '2025-11-20', 'status': 'Active'}])])
+    to_process, unchanged = store.select_delta(changed)
+    assert to_process['doc_id'].tolist() == ['D2', 'D4']
+    assert unchanged['doc_id'].tolist() == ['D1', 'D3']
+
+
+def test_unflushed_or_unnotified_outcomes_are_not_remembered(tmp_path):
+    path = str(tmp_path / 'state.sqlite')
+    store = RunStateStore(path)
+    to_process, _ = store.select_delta(DOCS)
+    docs = to_process.to_dict('records')
+    store.record(docs[0], '2025-10-30', notified=False, renewed=False)
+    store.record(docs[1], '2025-10-30', notified=True, renewed=True)
+
+    # An interrupted run: nothing was flushed, so a new process sees no state
+    assert RunStateStore(path).get('D2') is None
+    store.flush()
+    assert store.get('D1') is None
+    assert store.get('D2')['renewed_on'] == '2025-10-30'